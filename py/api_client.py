@@ -1,52 +1,175 @@
 import argparse
+import asyncio
 import base64
 import json
+import mimetypes
+import random
+import statistics
+import sys
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any, Optional
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional
 from urllib import error, request
 
+if TYPE_CHECKING:
+    import httpx
+
 BASE64_PLACEHOLDER = "<omitted base64 image>"
+FRAME_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+SEND_COMMAND = "send"
+LOAD_COMMAND = "load"
+COMMANDS = (SEND_COMMAND, LOAD_COMMAND)
+POST_OPERATION = "post"
+PUT_OPERATION = "put"
 
 
-def main() -> None:
+def main(argv: Optional[List[str]] = None) -> None:
     parser = argparse.ArgumentParser(description="Interact with the RealityGuide API.")
-    parser.add_argument("image_path", type=Path, help="Path to the image to upload.")
-    parser.add_argument(
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    send_parser = subparsers.add_parser(
+        SEND_COMMAND, help="Create a goal from an image, or update one with --goal-id."
+    )
+    send_parser.add_argument(
+        "image_path", type=Path, help="Path to the image to upload."
+    )
+    send_parser.add_argument(
         "--goal-id",
         type=str,
         default=None,
         help="Existing goal id to update. If omitted, a new goal is created.",
     )
-    parser.add_argument(
+    send_parser.add_argument(
         "--base-url",
         type=str,
         default="http://127.0.0.1:8000",
         help="Base URL for the API server.",
     )
-    args = parser.parse_args()
+    send_parser.add_argument(
+        "--binary",
+        action="store_true",
+        help="Upload raw image bytes and receive artifact URLs instead of base64.",
+    )
+    send_parser.add_argument(
+        "--download-dir",
+        type=Path,
+        default=None,
+        help="With --binary, save the returned artifacts into this directory.",
+    )
+    send_parser.add_argument(
+        "--base-revision",
+        type=int,
+        default=None,
+        help="With --goal-id, request only the changes since this plan revision.",
+    )
+
+    load_parser = subparsers.add_parser(
+        LOAD_COMMAND, help="Load-test the API with concurrent goal sessions."
+    )
+    load_parser.add_argument(
+        "frames_dir", type=Path, help="Directory of frames to upload in turn."
+    )
+    load_parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    load_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Closed loop: number of sessions running back to back.",
+    )
+    load_parser.add_argument(
+        "--rps",
+        type=float,
+        default=None,
+        help="Open loop: target requests per second instead of --concurrency.",
+    )
+    load_parser.add_argument("--duration", type=float, default=30.0, help="Seconds.")
+    load_parser.add_argument(
+        "--updates-per-session",
+        type=int,
+        default=4,
+        help="PUT /goals/{id} requests that follow each POST /goals.",
+    )
+    load_parser.add_argument(
+        "--think-ms",
+        type=float,
+        default=0.0,
+        help="Closed loop: pause between the requests of a session.",
+    )
+    load_parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=512,
+        help="Open loop: arrivals beyond this many in-flight requests are dropped.",
+    )
+    load_parser.add_argument("--timeout", type=float, default=120.0, help="Seconds.")
+    load_parser.add_argument(
+        "--binary",
+        action="store_true",
+        help="Use the /upload endpoints with raw image bytes.",
+    )
+    load_parser.add_argument(
+        "--in-process",
+        action="store_true",
+        help="Call server.app in this process instead of --base-url.",
+    )
+    load_parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args(
+        _with_default_command(sys.argv[1:] if argv is None else argv)
+    )
+
+    if args.command == LOAD_COMMAND:
+        run_load_command(args)
+        return
+
+    if args.binary:
+        response = _send_upload(
+            base_url=args.base_url,
+            goal_id=args.goal_id,
+            image_path=args.image_path,
+            base_revision=args.base_revision,
+        )
+        if args.download_dir is not None:
+            _download_artifacts(response, args.download_dir)
+        print(json.dumps(response, indent=2))
+        return
 
     payload = {"image_base64": _encode_image(args.image_path)}
     response = _send_request(
         base_url=args.base_url,
         goal_id=args.goal_id,
         payload=payload,
+        base_revision=args.base_revision,
     )
+    if "images" in response:
+        response["images"] = {name: BASE64_PLACEHOLDER for name in response["images"]}
     redacted = _redact_base64_images(response)
     print(json.dumps(redacted, indent=2))
 
 
+def _with_default_command(argv: List[str]) -> List[str]:
+    """Treats `api_client.py <image> ...` as `api_client.py send <image> ...`."""
+    if argv and argv[0] not in COMMANDS and argv[0] not in ("-h", "--help"):
+        return [SEND_COMMAND, *argv]
+    return argv
+
+
 def _encode_image(image_path: Path) -> str:
     data = Path(image_path).read_bytes()
     return base64.b64encode(data).decode("ascii")
 
 
 def _send_request(
-    base_url: str, goal_id: Optional[str], payload: dict[str, str]
+    base_url: str,
+    goal_id: Optional[str],
+    payload: dict[str, str],
+    base_revision: Optional[int] = None,
 ) -> Any:
     body = json.dumps(payload).encode("utf-8")
     base = base_url.rstrip("/")
     if goal_id:
-        url = f"{base}/goals/{goal_id}"
+        url = _with_base_revision(f"{base}/goals/{goal_id}", base_revision)
         method = "PUT"
     else:
         url = f"{base}/goals"
@@ -55,9 +178,67 @@ def _send_request(
     req = request.Request(
         url, data=body, headers={"Content-Type": "application/json"}, method=method
     )
+    return json.loads(_open(req).decode("utf-8"))
+
+
+def _send_upload(
+    base_url: str,
+    goal_id: Optional[str],
+    image_path: Path,
+    base_revision: Optional[int] = None,
+) -> Any:
+    body = Path(image_path).read_bytes()
+    content_type = (
+        mimetypes.guess_type(str(image_path))[0] or "application/octet-stream"
+    )
+    base = base_url.rstrip("/")
+    if goal_id:
+        url = _with_base_revision(f"{base}/goals/{goal_id}/upload", base_revision)
+        method = "PUT"
+    else:
+        url = f"{base}/goals/upload"
+        method = "POST"
+
+    req = request.Request(
+        url, data=body, headers={"Content-Type": content_type}, method=method
+    )
+    return json.loads(_open(req).decode("utf-8"))
+
+
+def _with_base_revision(url: str, base_revision: Optional[int]) -> str:
+    if base_revision is None:
+        return url
+    return f"{url}?base_revision={base_revision}"
+
+
+def _download_artifacts(response: Any, download_dir: Path) -> None:
+    download_dir.mkdir(parents=True, exist_ok=True)
+    urls = dict(response.get("images") or {})
+    for name in ("highlight", "banana"):
+        urls.setdefault(name, response.get(f"{name}_image_url"))
+    for name, url in urls.items():
+        if not url:
+            continue
+        try:
+            with request.urlopen(f"{url}&wait=30") as resp:
+                if resp.status != 200:
+                    print(f"{name} not ready (status {resp.status}).")
+                    continue
+                content_type = resp.headers.get_content_type()
+                data = resp.read()
+        except error.HTTPError as exc:
+            print(f"{name} unavailable (status {exc.code}).")
+            continue
+        extension = mimetypes.guess_extension(content_type) or ".bin"
+        path = download_dir / f"{response['id']}_{name}{extension}"
+        path.write_bytes(data)
+        print(f"Saved {name} to {path}")
+
+
+def _open(req: request.Request) -> bytes:
     try:
         with request.urlopen(req) as resp:
-            return json.loads(resp.read().decode("utf-8"))
+            return resp.read()
     except error.HTTPError as exc:
         detail = exc.read().decode("utf-8", errors="ignore")
         raise SystemExit(f"Request failed with status {exc.code}: {detail}") from exc
@@ -86,5 +267,285 @@ def _should_redact_key(key: Any, value: Any) -> bool:
     return "base64" in lowered
 
 
+@dataclass
+class Frame:
+    data: bytes
+    content_type: str
+    base64_payload: bytes
+
+
+@dataclass
+class OperationStats:
+    latencies_s: List[float] = field(default_factory=list)
+    response_bytes: List[int] = field(default_factory=list)
+    statuses: Counter = field(default_factory=Counter)
+    errors: Counter = field(default_factory=Counter)
+
+    @property
+    def requests(self) -> int:
+        return sum(self.statuses.values()) + sum(self.errors.values())
+
+    @property
+    def failures(self) -> int:
+        failed = sum(n for status, n in self.statuses.items() if status >= 400)
+        return failed + sum(self.errors.values())
+
+
+@dataclass
+class LoadConfig:
+    base_url: str
+    frames: List[Frame]
+    binary: bool = False
+    concurrency: int = 8
+    rps: Optional[float] = None
+    duration_s: float = 30.0
+    updates_per_session: int = 4
+    think_s: float = 0.0
+    max_in_flight: int = 512
+    timeout_s: float = 120.0
+
+
+class LoadGenerator:
+    """Drives headset-like sessions (one POST, then PUTs) against the API.
+
+    Closed loop: `concurrency` workers each run sessions back to back, so the
+    offered load adapts to the server's speed. Open loop: requests arrive at
+    `rps` per second (Poisson arrivals) whether or not earlier ones finished;
+    each arrival updates an idle goal if one is waiting, or starts a new one.
+    """
+
+    def __init__(
+        self,
+        config: LoadConfig,
+        transport: Optional["httpx.AsyncBaseTransport"] = None,
+    ) -> None:
+        self.config = config
+        self.transport = transport
+        self.stats: Dict[str, OperationStats] = {
+            POST_OPERATION: OperationStats(),
+            PUT_OPERATION: OperationStats(),
+        }
+        self.dropped = 0
+        self._frame_index = 0
+
+    async def run(self) -> Dict[str, Any]:
+        # httpx is only needed for load tests; single requests use urllib.
+        import httpx
+
+        connections = (
+            self.config.max_in_flight if self.config.rps else self.config.concurrency
+        )
+        limits = httpx.Limits(
+            max_connections=connections, max_keepalive_connections=connections
+        )
+        async with httpx.AsyncClient(
+            base_url=self.config.base_url.rstrip("/"),
+            limits=limits,
+            timeout=self.config.timeout_s,
+            transport=self.transport,
+        ) as client:
+            started = time.perf_counter()
+            if self.config.rps:
+                await self._open_loop(client)
+            else:
+                await self._closed_loop(client)
+            elapsed_s = time.perf_counter() - started
+        return self.report(elapsed_s)
+
+    async def _closed_loop(self, client: "httpx.AsyncClient") -> None:
+        deadline = time.perf_counter() + self.config.duration_s
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                goal_id = await self._send(client, None)
+                for _ in range(self.config.updates_per_session):
+                    if goal_id is None or time.perf_counter() >= deadline:
+                        break
+                    if self.config.think_s > 0:
+                        await asyncio.sleep(self.config.think_s)
+                    await self._send(client, goal_id)
+
+        await asyncio.gather(*(worker() for _ in range(self.config.concurrency)))
+
+    async def _open_loop(self, client: "httpx.AsyncClient") -> None:
+        assert self.config.rps is not None
+        idle: Deque[tuple[str, int]] = deque()
+        in_flight: "set[asyncio.Task[None]]" = set()
+
+        async def session_step(goal_id: Optional[str], remaining: int) -> None:
+            result = await self._send(client, goal_id)
+            if result is not None and remaining > 0:
+                idle.append((result, remaining - 1))
+
+        deadline = time.perf_counter() + self.config.duration_s
+        next_arrival = time.perf_counter()
+        while next_arrival < deadline:
+            delay_s = next_arrival - time.perf_counter()
+            if delay_s > 0:
+                await asyncio.sleep(delay_s)
+            next_arrival += random.expovariate(self.config.rps)
+            if len(in_flight) >= self.config.max_in_flight:
+                self.dropped += 1
+                continue
+            if idle:
+                goal_id, remaining = idle.popleft()
+                step = session_step(goal_id, remaining)
+            else:
+                step = session_step(None, self.config.updates_per_session)
+            task = asyncio.create_task(step)
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        await asyncio.gather(*in_flight)
+
+    async def _send(
+        self, client: "httpx.AsyncClient", goal_id: Optional[str]
+    ) -> Optional[str]:
+        """Sends one POST (goal_id None) or PUT; returns the goal id on success."""
+        import httpx
+
+        frame = self._next_frame()
+        operation = POST_OPERATION if goal_id is None else PUT_OPERATION
+        suffix = "/upload" if self.config.binary else ""
+        url = f"/goals{suffix}" if goal_id is None else f"/goals/{goal_id}{suffix}"
+        if self.config.binary:
+            body, content_type = frame.data, frame.content_type
+        else:
+            body, content_type = frame.base64_payload, "application/json"
+
+        stats = self.stats[operation]
+        started = time.perf_counter()
+        try:
+            response = await client.request(
+                "POST" if goal_id is None else "PUT",
+                url,
+                content=body,
+                headers={"Content-Type": content_type},
+            )
+        except httpx.HTTPError as exc:
+            stats.errors[type(exc).__name__] += 1
+            return None
+        stats.latencies_s.append(time.perf_counter() - started)
+        stats.statuses[response.status_code] += 1
+        stats.response_bytes.append(len(response.content))
+        if response.status_code != 200:
+            return None
+        return goal_id or response.json()["id"]
+
+    def _next_frame(self) -> Frame:
+        frame = self.config.frames[self._frame_index % len(self.config.frames)]
+        self._frame_index += 1
+        return frame
+
+    def report(self, elapsed_s: float) -> Dict[str, Any]:
+        operations = {
+            name: _operation_report(stats, elapsed_s)
+            for name, stats in self.stats.items()
+        }
+        combined = OperationStats()
+        for stats in self.stats.values():
+            combined.latencies_s.extend(stats.latencies_s)
+            combined.response_bytes.extend(stats.response_bytes)
+            combined.statuses.update(stats.statuses)
+            combined.errors.update(stats.errors)
+        return {
+            "mode": "open" if self.config.rps else "closed",
+            "concurrency": None if self.config.rps else self.config.concurrency,
+            "target_rps": self.config.rps,
+            "duration_s": round(elapsed_s, 3),
+            "updates_per_session": self.config.updates_per_session,
+            "binary": self.config.binary,
+            "dropped_arrivals": self.dropped,
+            "total": _operation_report(combined, elapsed_s),
+            "operations": operations,
+        }
+
+
+def run_load_command(args: argparse.Namespace) -> None:
+    config = LoadConfig(
+        base_url="http://in-process" if args.in_process else args.base_url,
+        frames=load_frames(args.frames_dir),
+        binary=args.binary,
+        concurrency=args.concurrency,
+        rps=args.rps,
+        duration_s=args.duration,
+        updates_per_session=args.updates_per_session,
+        think_s=args.think_ms / 1000.0,
+        max_in_flight=args.max_in_flight,
+        timeout_s=args.timeout,
+    )
+    report = asyncio.run(_run_load(config, args.in_process))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        args.output.write_text(text)
+    print(text)
+
+
+async def _run_load(config: LoadConfig, in_process: bool) -> Dict[str, Any]:
+    if not in_process:
+        return await LoadGenerator(config).run()
+
+    import httpx
+
+    import server
+
+    async with server.lifespan(server.app):
+        transport = httpx.ASGITransport(app=server.app)
+        return await LoadGenerator(config, transport).run()
+
+
+def load_frames(frames_dir: Path) -> List[Frame]:
+    paths = sorted(
+        path
+        for path in Path(frames_dir).iterdir()
+        if path.suffix.lower() in FRAME_SUFFIXES
+    )
+    if not paths:
+        raise SystemExit(f"No frames ({', '.join(FRAME_SUFFIXES)}) in {frames_dir}.")
+    frames = []
+    for path in paths:
+        data = path.read_bytes()
+        payload = {"image_base64": base64.b64encode(data).decode("ascii")}
+        frames.append(
+            Frame(
+                data=data,
+                content_type=mimetypes.guess_type(str(path))[0]
+                or "application/octet-stream",
+                base64_payload=json.dumps(payload).encode("utf-8"),
+            )
+        )
+    return frames
+
+
+def _operation_report(stats: OperationStats, elapsed_s: float) -> Dict[str, Any]:
+    requests = stats.requests
+    report: Dict[str, Any] = {
+        "requests": requests,
+        "throughput_rps": round(requests / elapsed_s, 3) if elapsed_s > 0 else 0.0,
+        "error_rate": round(stats.failures / requests, 4) if requests else 0.0,
+        "statuses": {str(code): n for code, n in sorted(stats.statuses.items())},
+        "errors": dict(stats.errors),
+    }
+    if stats.latencies_s:
+        ordered = sorted(stats.latencies_s)
+        report["latency_ms"] = {
+            "mean": round(statistics.fmean(ordered) * 1000.0, 3),
+            "p50": round(_percentile(ordered, 0.5) * 1000.0, 3),
+            "p95": round(_percentile(ordered, 0.95) * 1000.0, 3),
+            "p99": round(_percentile(ordered, 0.99) * 1000.0, 3),
+            "max": round(ordered[-1] * 1000.0, 3),
+        }
+        report["response_bytes"] = {
+            "mean": round(statistics.fmean(stats.response_bytes), 1),
+            "max": max(stats.response_bytes),
+            "total": sum(stats.response_bytes),
+        }
+    return report
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
 if __name__ == "__main__":
     main()
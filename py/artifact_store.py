@@ -0,0 +1,347 @@
+import mimetypes
+import os
+import re
+import shutil
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from backends import GeneratedImage
+
+ARTIFACT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+REVISION_PREFIX = "r"
+DEFAULT_MAX_MB = float(os.environ.get("REALITYGUIDE_ARTIFACT_MAX_MB", "256"))
+DEFAULT_MAX_AGE_S = float(os.environ.get("REALITYGUIDE_ARTIFACT_MAX_AGE_S", "86400"))
+DEFAULT_GC_INTERVAL_S = 30.0
+
+
+@dataclass
+class StoredArtifact:
+    goal_id: str
+    revision: int
+    name: str
+    image: GeneratedImage
+
+    @property
+    def etag(self) -> str:
+        # Artifacts are written once per revision, so the key identifies the bytes.
+        return f'"{self.goal_id}-{REVISION_PREFIX}{self.revision}-{self.name}"'
+
+
+@dataclass
+class ArtifactStoreStats:
+    backend: str
+    goals: int = 0
+    revisions: int = 0
+    artifacts: int = 0
+    bytes: int = 0
+    max_bytes: int = 0
+    max_age_s: Optional[float] = None
+    evicted_revisions: int = 0
+
+
+class ArtifactStore(ABC):
+    """Generated images namespaced by goal id and revision.
+
+    Revisions only grow, so a new request never overwrites the artifacts of an
+    earlier one. Whole revisions are garbage-collected, oldest first, once the
+    store exceeds max_bytes or a revision is older than max_age_s.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_age_s: Optional[float],
+        gc_interval_s: float = DEFAULT_GC_INTERVAL_S,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_age_s = max_age_s
+        self.gc_interval_s = gc_interval_s
+        self.evicted_revisions = 0
+        self._last_gc = 0.0
+        self._gc_lock = threading.Lock()
+
+    @abstractmethod
+    def put(
+        self, goal_id: str, revision: int, name: str, image: GeneratedImage
+    ) -> StoredArtifact: ...
+
+    @abstractmethod
+    def get(
+        self, goal_id: str, name: str, revision: Optional[int] = None
+    ) -> Optional[StoredArtifact]: ...
+
+    @abstractmethod
+    def collect_garbage(self) -> int: ...
+
+    @abstractmethod
+    def stats(self) -> ArtifactStoreStats: ...
+
+    def _maybe_collect_garbage(self) -> None:
+        now = time.time()
+        if now - self._last_gc < self.gc_interval_s:
+            return
+        if not self._gc_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_gc = now
+            self.collect_garbage()
+        finally:
+            self._gc_lock.release()
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.max_age_s is not None and now - created_at > self.max_age_s
+
+
+@dataclass
+class _MemoryRevision:
+    created_at: float = field(default_factory=time.time)
+    artifacts: Dict[str, StoredArtifact] = field(default_factory=dict)
+    size: int = 0
+
+
+class MemoryArtifactStore(ArtifactStore):
+    """Per-process store; artifacts are only visible to the worker that wrote them."""
+
+    def __init__(
+        self,
+        max_bytes: int,
+        max_age_s: Optional[float],
+        gc_interval_s: float = DEFAULT_GC_INTERVAL_S,
+    ) -> None:
+        super().__init__(max_bytes, max_age_s, gc_interval_s)
+        self._revisions: "OrderedDict[Tuple[str, int], _MemoryRevision]" = OrderedDict()
+        self._latest: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def put(
+        self, goal_id: str, revision: int, name: str, image: GeneratedImage
+    ) -> StoredArtifact:
+        artifact = StoredArtifact(goal_id, revision, name, image)
+        with self._lock:
+            entry = self._revisions.setdefault((goal_id, revision), _MemoryRevision())
+            previous = entry.artifacts.get(name)
+            if previous is not None:
+                entry.size -= len(previous.image.data)
+                self._total_bytes -= len(previous.image.data)
+            entry.artifacts[name] = artifact
+            entry.size += len(image.data)
+            self._total_bytes += len(image.data)
+            if self._latest.get(goal_id, 0) < revision:
+                self._latest[goal_id] = revision
+        if self._total_bytes > self.max_bytes:
+            self.collect_garbage()
+        else:
+            self._maybe_collect_garbage()
+        return artifact
+
+    def get(
+        self, goal_id: str, name: str, revision: Optional[int] = None
+    ) -> Optional[StoredArtifact]:
+        with self._lock:
+            if revision is None:
+                revision = self._latest.get(goal_id)
+                if revision is None:
+                    return None
+            entry = self._revisions.get((goal_id, revision))
+            return entry.artifacts.get(name) if entry is not None else None
+
+    def collect_garbage(self) -> int:
+        removed = 0
+        now = time.time()
+        with self._lock:
+            while self._revisions:
+                key, entry = next(iter(self._revisions.items()))
+                over_size = self._total_bytes > self.max_bytes
+                if not over_size and not self._expired(entry.created_at, now):
+                    break
+                del self._revisions[key]
+                self._total_bytes -= entry.size
+                if self._latest.get(key[0]) == key[1]:
+                    del self._latest[key[0]]
+                removed += 1
+            self.evicted_revisions += removed
+        return removed
+
+    def stats(self) -> ArtifactStoreStats:
+        with self._lock:
+            return ArtifactStoreStats(
+                backend="memory",
+                goals=len({goal_id for goal_id, _ in self._revisions}),
+                revisions=len(self._revisions),
+                artifacts=sum(len(e.artifacts) for e in self._revisions.values()),
+                bytes=self._total_bytes,
+                max_bytes=self.max_bytes,
+                max_age_s=self.max_age_s,
+                evicted_revisions=self.evicted_revisions,
+            )
+
+
+class LocalArtifactStore(ArtifactStore):
+    """Directory-backed store shared by every worker pointed at the same root.
+
+    Layout is <root>/<goal_id>/r<revision>/<name>.<ext>, where the revision is
+    the goal store's, so concurrent workers never write into the same one. Files
+    are written to a temporary name and renamed into place.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        max_bytes: int,
+        max_age_s: Optional[float],
+        gc_interval_s: float = DEFAULT_GC_INTERVAL_S,
+    ) -> None:
+        super().__init__(max_bytes, max_age_s, gc_interval_s)
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def put(
+        self, goal_id: str, revision: int, name: str, image: GeneratedImage
+    ) -> StoredArtifact:
+        _check_id(name)
+        revision_dir = self._revision_dir(goal_id, revision)
+        revision_dir.mkdir(parents=True, exist_ok=True)
+        extension = mimetypes.guess_extension(image.mime_type) or ".bin"
+        path = revision_dir / f"{name}{extension}"
+        tmp_path = path.with_name(
+            f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp"
+        )
+        tmp_path.write_bytes(image.data)
+        os.replace(tmp_path, path)
+        self._maybe_collect_garbage()
+        return StoredArtifact(goal_id, revision, name, image)
+
+    def get(
+        self, goal_id: str, name: str, revision: Optional[int] = None
+    ) -> Optional[StoredArtifact]:
+        _check_id(name)
+        if revision is None:
+            revisions = self._revisions(self._goal_dir(goal_id))
+            if not revisions:
+                return None
+            revision = max(revisions)
+        revision_dir = self._revision_dir(goal_id, revision)
+        for path in _artifact_files(revision_dir):
+            if path.stem != name:
+                continue
+            try:
+                data = path.read_bytes()
+            except FileNotFoundError:
+                return None
+            mime_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+            return StoredArtifact(
+                goal_id, revision, name, GeneratedImage(data, mime_type)
+            )
+        return None
+
+    def collect_garbage(self) -> int:
+        now = time.time()
+        revisions = sorted(self._scan(), key=lambda item: item[1])
+        total_bytes = sum(size for _, _, size in revisions)
+        removed = 0
+        for revision_dir, created_at, size in revisions:
+            if total_bytes <= self.max_bytes and not self._expired(created_at, now):
+                break
+            shutil.rmtree(revision_dir, ignore_errors=True)
+            total_bytes -= size
+            removed += 1
+            try:
+                revision_dir.parent.rmdir()
+            except OSError:
+                pass
+        self.evicted_revisions += removed
+        return removed
+
+    def stats(self) -> ArtifactStoreStats:
+        revisions = self._scan()
+        return ArtifactStoreStats(
+            backend="local",
+            goals=len({revision_dir.parent for revision_dir, _, _ in revisions}),
+            revisions=len(revisions),
+            artifacts=sum(
+                len(_artifact_files(revision_dir)) for revision_dir, _, _ in revisions
+            ),
+            bytes=sum(size for _, _, size in revisions),
+            max_bytes=self.max_bytes,
+            max_age_s=self.max_age_s,
+            evicted_revisions=self.evicted_revisions,
+        )
+
+    def _scan(self) -> List[Tuple[Path, float, int]]:
+        found: List[Tuple[Path, float, int]] = []
+        for goal_dir in _subdirectories(self.root):
+            for revision in self._revisions(goal_dir):
+                revision_dir = goal_dir / f"{REVISION_PREFIX}{revision}"
+                try:
+                    created_at = revision_dir.stat().st_mtime
+                    size = sum(p.stat().st_size for p in _artifact_files(revision_dir))
+                except FileNotFoundError:
+                    continue
+                found.append((revision_dir, created_at, size))
+        return found
+
+    def _revisions(self, goal_dir: Path) -> List[int]:
+        revisions: List[int] = []
+        for revision_dir in _subdirectories(goal_dir):
+            suffix = revision_dir.name[len(REVISION_PREFIX) :]
+            if revision_dir.name.startswith(REVISION_PREFIX) and suffix.isdigit():
+                revisions.append(int(suffix))
+        return revisions
+
+    def _goal_dir(self, goal_id: str) -> Path:
+        _check_id(goal_id)
+        return self.root / goal_id
+
+    def _revision_dir(self, goal_id: str, revision: int) -> Path:
+        return self._goal_dir(goal_id) / f"{REVISION_PREFIX}{revision}"
+
+
+def artifact_store_from_env() -> ArtifactStore:
+    artifact_dir = os.environ.get("REALITYGUIDE_ARTIFACT_DIR")
+    default_kind = "local" if artifact_dir else "memory"
+    kind = os.environ.get("REALITYGUIDE_ARTIFACT_STORE", default_kind).strip().lower()
+    max_bytes = int(DEFAULT_MAX_MB * 1024 * 1024)
+    max_age_s = DEFAULT_MAX_AGE_S if DEFAULT_MAX_AGE_S > 0 else None
+    if kind == "memory":
+        workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+        if workers > 1:
+            # Each worker would only see its own artifacts, so URLs handed out by
+            # one worker 404 on the others.
+            raise RuntimeError(
+                f"REALITYGUIDE_ARTIFACT_STORE=memory cannot be shared by "
+                f"WEB_CONCURRENCY={workers} workers; use the local store."
+            )
+        return MemoryArtifactStore(max_bytes, max_age_s)
+    if kind == "local":
+        root = Path(artifact_dir or "data/artifacts")
+        return LocalArtifactStore(root, max_bytes, max_age_s)
+    raise RuntimeError(f"Unknown REALITYGUIDE_ARTIFACT_STORE '{kind}'.")
+
+
+def _check_id(value: str) -> None:
+    if not ARTIFACT_ID_PATTERN.fullmatch(value):
+        raise ValueError(f"Invalid artifact path component '{value}'.")
+
+
+def _subdirectories(directory: Path) -> List[Path]:
+    try:
+        return [Path(entry.path) for entry in os.scandir(directory) if entry.is_dir()]
+    except FileNotFoundError:
+        return []
+
+
+def _artifact_files(directory: Path) -> List[Path]:
+    try:
+        return [
+            Path(entry.path)
+            for entry in os.scandir(directory)
+            if entry.is_file() and not entry.name.startswith(".")
+        ]
+    except FileNotFoundError:
+        return []
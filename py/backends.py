@@ -0,0 +1,421 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+from PIL import Image
+
+from tracing import record_token_usage, stage_timer
+
+if TYPE_CHECKING:
+    # The SDK takes most of a second to import; it is loaded on first use.
+    from google import genai
+    from google.genai import types
+
+ANALYSIS_STAGE = "analysis"
+STEPS_STAGE = "steps"
+PLAN_STAGE = "plan"
+COMPLETION_STAGE = "completion"
+COMPACT_COMPLETION_STAGE = "compact_completion"
+BANANA_STAGE = "banana"
+
+CONFIG_JSON_CACHE_ENTRIES = 64
+
+B = TypeVar("B", bound="ModelBackend")
+
+
+@dataclass
+class ModelRequest:
+    """A single generate_content call, tagged with the workflow stage issuing it."""
+
+    stage: str
+    model: str
+    contents: List[Any]
+    config: "types.GenerateContentConfig"
+
+
+@dataclass
+class GeneratedImage:
+    data: bytes
+    mime_type: str = "image/png"
+
+
+@dataclass
+class ModelResponse:
+    text: Optional[str]
+    images: List[GeneratedImage] = field(default_factory=list)
+
+
+class ModelBackend(ABC):
+    @abstractmethod
+    def generate(self, request: ModelRequest) -> ModelResponse: ...
+
+    @abstractmethod
+    async def agenerate(self, request: ModelRequest) -> ModelResponse: ...
+
+    async def awarm_up(self) -> None:
+        """Gets ready for the first call; wrapping backends pass it on."""
+        inner = getattr(self, "inner", None)
+        if isinstance(inner, ModelBackend):
+            await inner.awarm_up()
+
+
+class GeminiBackend(ModelBackend):
+    """Calls Gemini through the google-genai SDK.
+
+    The SDK is imported and the client built on first use, so building the
+    backend needs neither the import time nor credentials.
+    """
+
+    def __init__(self, client: Optional["genai.Client"] = None) -> None:
+        self._client = client
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self) -> "genai.Client":
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from google import genai
+
+                    self._client = genai.Client()
+        return self._client
+
+    async def awarm_up(self) -> None:
+        client = await asyncio.to_thread(lambda: self.client)
+        # Listing one model opens the async client's connection pool, so the
+        # first plan does not pay for DNS and TLS.
+        await client.aio.models.list(config={"page_size": 1})
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        response = self.client.models.generate_content(
+            model=request.model, contents=request.contents, config=request.config
+        )
+        _record_usage(request, response)
+        return _response_from_sdk(response)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        response = await self.client.aio.models.generate_content(
+            model=request.model, contents=request.contents, config=request.config
+        )
+        _record_usage(request, response)
+        return _response_from_sdk(response)
+
+
+class ReplayBackend(ModelBackend):
+    """Serves recorded responses from cassette files instead of calling a model.
+
+    Interactions are matched by request fingerprint first and fall back to the
+    first recording for the same stage, so synthetic cassettes only need one
+    entry per stage.
+    """
+
+    def __init__(
+        self,
+        cassette_dir: Path,
+        latency_s: float = 0.0,
+        latency_jitter_s: float = 0.0,
+    ) -> None:
+        self.latency_s = latency_s
+        self.latency_jitter_s = latency_jitter_s
+        self._by_fingerprint: Dict[str, ModelResponse] = {}
+        self._by_stage: Dict[str, ModelResponse] = {}
+        for path in sorted(Path(cassette_dir).glob("*.json")):
+            for interaction in load_cassette(path):
+                response = response_from_interaction(interaction)
+                fingerprint = interaction.get("fingerprint")
+                if fingerprint:
+                    self._by_fingerprint.setdefault(fingerprint, response)
+                self._by_stage.setdefault(interaction["stage"], response)
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        time.sleep(self._latency())
+        return self._lookup(request)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        await asyncio.sleep(self._latency())
+        return self._lookup(request)
+
+    def _latency(self) -> float:
+        if self.latency_jitter_s <= 0:
+            return self.latency_s
+        return max(0.0, self.latency_s + random.uniform(0, self.latency_jitter_s))
+
+    def _lookup(self, request: ModelRequest) -> ModelResponse:
+        if self._by_fingerprint:
+            match = self._by_fingerprint.get(request_fingerprint(request))
+            if match is not None:
+                return match
+        match = self._by_stage.get(request.stage)
+        if match is None:
+            raise RuntimeError(
+                f"No recorded response for stage '{request.stage}' in the cassettes."
+            )
+        return match
+
+
+class RecordingBackend(ModelBackend):
+    """Forwards calls to another backend and writes every exchange to a cassette."""
+
+    def __init__(self, inner: ModelBackend, cassette_dir: Path) -> None:
+        self.inner = inner
+        self.cassette_dir = Path(cassette_dir)
+        self._lock = threading.Lock()
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        response = self.inner.generate(request)
+        self._record(request, response)
+        return response
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        response = await self.inner.agenerate(request)
+        self._record(request, response)
+        return response
+
+    def _record(self, request: ModelRequest, response: ModelResponse) -> None:
+        fingerprint = request_fingerprint(request)
+        interaction = interaction_from_response(
+            request.stage, response, fingerprint=fingerprint, model=request.model
+        )
+        path = self.cassette_dir / f"{request.stage}_{fingerprint[:16]}.json"
+        with self._lock:
+            write_cassette(path, [interaction])
+
+
+class TracingBackend(ModelBackend):
+    """Times every model call as the workflow sees it, cache hits included."""
+
+    def __init__(self, inner: ModelBackend) -> None:
+        self.inner = inner
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        with stage_timer(request.stage):
+            return self.inner.generate(request)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        with stage_timer(request.stage):
+            return await self.inner.agenerate(request)
+
+
+_config_json_cache: Dict[int, Tuple["types.GenerateContentConfig", bytes]] = {}
+
+
+def request_fingerprint(request: ModelRequest) -> str:
+    digest = hashlib.sha256()
+    digest.update(request.stage.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(request.model.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(_config_json(request.config))
+    for item in request.contents:
+        digest.update(b"\0")
+        _update_digest_with_content(digest, item)
+    return digest.hexdigest()
+
+
+def _config_json(config: "types.GenerateContentConfig") -> bytes:
+    """Canonical JSON of a generation config.
+
+    The workflow builds each config once and reuses it, so the encoding is
+    cached by identity; the cached entry keeps its config alive so the id
+    cannot be reused.
+    """
+    cached = _config_json_cache.get(id(config))
+    if cached is not None and cached[0] is config:
+        return cached[1]
+    encoded = json.dumps(
+        config.model_dump(mode="json", exclude_none=True), sort_keys=True
+    ).encode("utf-8")
+    if len(_config_json_cache) >= CONFIG_JSON_CACHE_ENTRIES:
+        _config_json_cache.clear()
+    _config_json_cache[id(config)] = (config, encoded)
+    return encoded
+
+
+def load_cassette(path: Path) -> List[Dict[str, Any]]:
+    data = json.loads(Path(path).read_text())
+    return list(data.get("interactions", []))
+
+
+def write_cassette(path: Path, interactions: Sequence[Dict[str, Any]]) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({"interactions": list(interactions)}, indent=2))
+    return path
+
+
+def interaction_from_response(
+    stage: str,
+    response: ModelResponse,
+    fingerprint: Optional[str] = None,
+    model: Optional[str] = None,
+) -> Dict[str, Any]:
+    interaction: Dict[str, Any] = {"stage": stage, "text": response.text}
+    if model:
+        interaction["model"] = model
+    if fingerprint:
+        interaction["fingerprint"] = fingerprint
+    if response.images:
+        interaction["images"] = [
+            {
+                "mime_type": image.mime_type,
+                "data_base64": base64.b64encode(image.data).decode("ascii"),
+            }
+            for image in response.images
+        ]
+    return interaction
+
+
+def response_from_interaction(interaction: Dict[str, Any]) -> ModelResponse:
+    images = [
+        GeneratedImage(
+            data=base64.b64decode(image["data_base64"]),
+            mime_type=image.get("mime_type", "image/png"),
+        )
+        for image in interaction.get("images", [])
+    ]
+    return ModelResponse(text=interaction.get("text"), images=images)
+
+
+def get_backend() -> ModelBackend:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _backend_from_env()
+    return _backend
+
+
+def set_backend(backend: Optional[ModelBackend]) -> None:
+    global _backend
+    _backend = backend
+
+
+async def warm_up_backend() -> None:
+    await get_backend().awarm_up()
+
+
+def find_backend(backend_type: Type[B]) -> Optional[B]:
+    backend: Any = get_backend()
+    while backend is not None:
+        if isinstance(backend, backend_type):
+            return backend
+        backend = getattr(backend, "inner", None)
+    return None
+
+
+_backend: Optional[ModelBackend] = None
+_backend_lock = threading.Lock()
+
+
+def _backend_from_env() -> ModelBackend:
+    from model_cache import CachingBackend, response_cache_from_env
+    from resilience import resilient_backend_from_env
+    from scheduler import scheduled_backend_from_env
+
+    # Resilience sits inside the scheduler, so a stage's timeout starts when its
+    # call is dispatched and a retry keeps the slot instead of queueing again.
+    backend = scheduled_backend_from_env(
+        resilient_backend_from_env(_model_backend_from_env())
+    )
+    cache = response_cache_from_env()
+    if cache is not None:
+        backend = CachingBackend(backend, cache)
+    return TracingBackend(backend)
+
+
+def _model_backend_from_env() -> ModelBackend:
+    kind = os.environ.get("REALITYGUIDE_BACKEND", "gemini").strip().lower()
+    if kind == "replay":
+        cassette_dir = os.environ.get("REALITYGUIDE_CASSETTE_DIR")
+        if not cassette_dir:
+            raise RuntimeError(
+                "REALITYGUIDE_CASSETTE_DIR must be set when REALITYGUIDE_BACKEND=replay."
+            )
+        latency_ms = float(os.environ.get("REALITYGUIDE_REPLAY_LATENCY_MS", "0"))
+        jitter_ms = float(os.environ.get("REALITYGUIDE_REPLAY_JITTER_MS", "0"))
+        return ReplayBackend(
+            Path(cassette_dir),
+            latency_s=latency_ms / 1000.0,
+            latency_jitter_s=jitter_ms / 1000.0,
+        )
+    if kind != "gemini":
+        raise RuntimeError(f"Unknown REALITYGUIDE_BACKEND '{kind}'.")
+
+    backend: ModelBackend = GeminiBackend()
+    record_dir = os.environ.get("REALITYGUIDE_RECORD_DIR")
+    if record_dir:
+        backend = RecordingBackend(backend, Path(record_dir))
+    return backend
+
+
+def _record_usage(
+    request: ModelRequest, response: "types.GenerateContentResponse"
+) -> None:
+    usage = response.usage_metadata
+    if usage is None:
+        return
+    record_token_usage(
+        request.model,
+        request.stage,
+        {
+            "prompt": usage.prompt_token_count,
+            "cached": usage.cached_content_token_count,
+            "output": usage.candidates_token_count,
+            "thoughts": usage.thoughts_token_count,
+        },
+    )
+
+
+def _response_from_sdk(response: "types.GenerateContentResponse") -> ModelResponse:
+    texts: List[str] = []
+    images: List[GeneratedImage] = []
+    for part in response.parts or []:
+        if part.inline_data is not None and part.inline_data.data:
+            images.append(
+                GeneratedImage(
+                    data=part.inline_data.data,
+                    mime_type=part.inline_data.mime_type or "image/png",
+                )
+            )
+        elif part.text is not None and not part.thought:
+            texts.append(part.text)
+    return ModelResponse(text="".join(texts) if texts else None, images=images)
+
+
+def _update_digest_with_content(digest: Any, item: Any) -> None:
+    from google.genai import types
+
+    if isinstance(item, str):
+        digest.update(b"text:")
+        digest.update(item.encode("utf-8"))
+    elif isinstance(item, Image.Image):
+        digest.update(f"pil:{item.mode}:{item.size}:".encode("utf-8"))
+        digest.update(item.tobytes())
+    elif isinstance(item, types.Part):
+        if item.inline_data is not None:
+            digest.update(f"blob:{item.inline_data.mime_type}:".encode("utf-8"))
+            digest.update(item.inline_data.data or b"")
+        else:
+            digest.update(b"text:")
+            digest.update((item.text or "").encode("utf-8"))
+    else:
+        digest.update(repr(item).encode("utf-8"))
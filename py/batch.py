@@ -0,0 +1,288 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, TextIO
+
+from input_prep import decode_image
+from resilience import deadline_scope
+from shared import OutputSchema, run_cpu_bound
+from workflow import (
+    COMPLETION_MODES,
+    DEFAULT_COMPLETION_MODE,
+    DEFAULT_PLAN_MODE,
+    PLAN_MODES,
+    ArtifactPaths,
+    WorkflowOptions,
+    generate_plan_from_image_async,
+    refresh_plan_from_image_async,
+)
+
+IMAGE_SUFFIXES = (".jpg", ".jpeg", ".png", ".webp")
+PLAN_MODE = "plan"
+REFRESH_MODE = "refresh"
+
+
+@dataclass
+class BatchEntry:
+    """One image to plan, or to check against prior_plan when one is given."""
+
+    id: str
+    image: Path
+    prior_plan: Optional[Path] = None
+
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    skipped: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+
+    def report(self, latencies_s: List[float]) -> Dict[str, Any]:
+        processed = self.succeeded + self.failed
+        report: Dict[str, Any] = {
+            "total": self.total,
+            "skipped": self.skipped,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "elapsed_s": round(self.elapsed_s, 3),
+            "images_per_s": (
+                round(processed / self.elapsed_s, 3) if self.elapsed_s > 0 else 0.0
+            ),
+        }
+        if latencies_s:
+            ordered = sorted(latencies_s)
+            report["latency_s"] = {
+                "mean": round(statistics.fmean(ordered), 3),
+                "p50": round(ordered[len(ordered) // 2], 3),
+                "p95": round(
+                    ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3
+                ),
+                "max": round(ordered[-1], 3),
+            }
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Plan (or check progress on) many images in one process."
+    )
+    parser.add_argument(
+        "source",
+        type=Path,
+        help=(
+            "A directory of images, or a JSONL manifest of "
+            '{"image": ..., "plan": optional prior plan JSON, "id": optional}.'
+        ),
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        required=True,
+        help="JSONL results file; entries already completed in it are skipped.",
+    )
+    parser.add_argument(
+        "--plans-dir",
+        type=Path,
+        default=None,
+        help="With a directory source, check each image against <stem>.json here.",
+    )
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--plan-mode", choices=PLAN_MODES, default=DEFAULT_PLAN_MODE)
+    parser.add_argument(
+        "--completion-mode", choices=COMPLETION_MODES, default=DEFAULT_COMPLETION_MODE
+    )
+    parser.add_argument(
+        "--skip-banana",
+        action="store_true",
+        help="Do not generate banana images.",
+    )
+    parser.add_argument(
+        "--artifacts-dir",
+        type=Path,
+        default=None,
+        help="Save each entry's highlight and banana image as <id>_<name>.png here.",
+    )
+    args = parser.parse_args()
+
+    entries = list(read_entries(args.source, args.plans_dir))
+    summary, latencies_s = asyncio.run(
+        run_batch(
+            entries,
+            args.output,
+            concurrency=args.concurrency,
+            options=WorkflowOptions(
+                generate_banana=not args.skip_banana,
+                plan_mode=args.plan_mode,
+                completion_mode=args.completion_mode,
+            ),
+            artifacts_dir=args.artifacts_dir,
+        )
+    )
+    print(json.dumps(summary.report(latencies_s), indent=2))
+
+
+def read_entries(
+    source: Path, plans_dir: Optional[Path] = None
+) -> Iterator[BatchEntry]:
+    source = Path(source)
+    if source.is_dir():
+        for image in sorted(source.rglob("*")):
+            if image.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            prior_plan = None
+            if plans_dir is not None:
+                candidate = Path(plans_dir) / f"{image.stem}.json"
+                prior_plan = candidate if candidate.is_file() else None
+            yield BatchEntry(
+                id=image.relative_to(source).as_posix(),
+                image=image,
+                prior_plan=prior_plan,
+            )
+        return
+
+    for line in source.read_text().splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        # Relative paths in a manifest are relative to the manifest itself.
+        image = source.parent / item["image"]
+        plan = item.get("plan")
+        yield BatchEntry(
+            id=item.get("id") or item["image"],
+            image=image,
+            prior_plan=source.parent / plan if plan else None,
+        )
+
+
+def completed_ids(output: Path) -> Set[str]:
+    done: Set[str] = set()
+    if not output.is_file():
+        return done
+    for line in output.read_text().splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # A line cut short by an interrupted run.
+            continue
+        if record.get("ok"):
+            done.add(record["id"])
+    return done
+
+
+async def run_batch(
+    entries: List[BatchEntry],
+    output: Path,
+    concurrency: int = 8,
+    options: Optional[WorkflowOptions] = None,
+    artifacts_dir: Optional[Path] = None,
+) -> tuple[BatchSummary, List[float]]:
+    """Processes entries with at most `concurrency` in flight, appending one JSONL
+    record per entry as soon as it finishes."""
+    options = options or WorkflowOptions()
+    done = completed_ids(output)
+    pending = [entry for entry in entries if entry.id not in done]
+    summary = BatchSummary(total=len(entries), skipped=len(entries) - len(pending))
+    latencies_s: List[float] = []
+    queue: "asyncio.Queue[BatchEntry]" = asyncio.Queue()
+    for entry in pending:
+        queue.put_nowait(entry)
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    _end_partial_line(output)
+    started = time.perf_counter()
+    with output.open("a") as sink:
+
+        async def worker() -> None:
+            while not queue.empty():
+                entry = queue.get_nowait()
+                record = await _process(entry, options, artifacts_dir)
+                if record["ok"]:
+                    summary.succeeded += 1
+                    latencies_s.append(record["elapsed_s"])
+                else:
+                    summary.failed += 1
+                _write_record(sink, record)
+
+        await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+    summary.elapsed_s = time.perf_counter() - started
+    return summary, latencies_s
+
+
+async def _process(
+    entry: BatchEntry, options: WorkflowOptions, artifacts_dir: Optional[Path]
+) -> Dict[str, Any]:
+    mode = PLAN_MODE if entry.prior_plan is None else REFRESH_MODE
+    record: Dict[str, Any] = {"id": entry.id, "image": str(entry.image), "mode": mode}
+    started = time.perf_counter()
+    try:
+        # Each entry gets the same deadline an HTTP request would.
+        with deadline_scope():
+            image = await run_cpu_bound(_load_image, entry.image)
+            entry_options = _entry_options(entry, options, artifacts_dir)
+            if entry.prior_plan is None:
+                artifacts = await generate_plan_from_image_async(image, entry_options)
+            else:
+                existing = OutputSchema.model_validate_json(
+                    entry.prior_plan.read_text()
+                )
+                artifacts = await refresh_plan_from_image_async(
+                    image, existing, entry_options
+                )
+    except Exception as exc:
+        record.update(ok=False, error=f"{type(exc).__name__}: {exc}")
+    else:
+        record.update(ok=True, plan=artifacts.output.model_dump(mode="json"))
+    record["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def _entry_options(
+    entry: BatchEntry, options: WorkflowOptions, artifacts_dir: Optional[Path]
+) -> WorkflowOptions:
+    if artifacts_dir is None:
+        return options
+    stem = entry.id.replace("/", "_").rsplit(".", 1)[0]
+    return WorkflowOptions(
+        generate_banana=options.generate_banana,
+        save_to=ArtifactPaths(
+            highlight=artifacts_dir / f"{stem}_highlight.png",
+            banana=artifacts_dir / f"{stem}_banana.png",
+        ),
+        completion_mode=options.completion_mode,
+        crop_mode=options.crop_mode,
+        plan_mode=options.plan_mode,
+    )
+
+
+def _load_image(path: Path) -> Any:
+    return decode_image(Path(path).read_bytes())
+
+
+def _end_partial_line(output: Path) -> None:
+    # An interrupted run can leave half a record; new records start on a new line.
+    if not output.is_file() or output.stat().st_size == 0:
+        return
+    with output.open("rb+") as file:
+        file.seek(-1, 2)
+        if file.read(1) != b"\n":
+            file.write(b"\n")
+
+
+def _write_record(sink: TextIO, record: Dict[str, Any]) -> None:
+    sink.write(json.dumps(record) + "\n")
+    sink.flush()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with the same --output to resume.", file=sys.stderr)
+        sys.exit(130)
@@ -0,0 +1,837 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import resource
+import sys
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, redirect_stdout
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from PIL import Image
+
+import workflow
+from input_prep import decode_image, encode_image, resize_to_width
+from model_cache import CachingBackend
+from backends import (
+    ANALYSIS_STAGE,
+    BANANA_STAGE,
+    COMPACT_COMPLETION_STAGE,
+    COMPLETION_STAGE,
+    PLAN_STAGE,
+    STEPS_STAGE,
+    GeneratedImage,
+    ModelBackend,
+    ModelRequest,
+    ModelResponse,
+    ReplayBackend,
+    find_backend,
+    get_backend,
+    set_backend,
+    write_cassette,
+)
+from shared import (
+    AnalysisSchema,
+    CompactCompletionSchema,
+    ObjectItem,
+    OutputSchema,
+    StepItem,
+    StepStatusItem,
+    StepsSchema,
+    encode_png,
+)
+
+# Entry points timed by the startup benchmark, each in a fresh interpreter.
+STARTUP_COMMANDS = {
+    "import_shared": ["-c", "import shared"],
+    "import_workflow": ["-c", "import workflow"],
+    "import_server": ["-c", "import server"],
+    "main_help": ["main.py", "--help"],
+    "check_completion_bad_args": ["check_completion.py"],
+}
+DEFAULT_SIZES = "640x480,1280x960,1920x1440,4032x3024"
+DEFAULT_OBJECT_COUNTS = "1,5,15"
+TIMED_WORKFLOW_HELPERS = (
+    "prepare_image",
+    "_prepare_inputs",
+    "build_crop_atlas",
+    "crop_objects",
+    "_highlight_first_step",
+    "_generate_banana_image",
+)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks for the RealityGuide hot path."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    workflow_parser = subparsers.add_parser(
+        "workflow",
+        help="Run the planning workflows and HTTP endpoints against a replay backend.",
+    )
+    workflow_parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    workflow_parser.add_argument("--objects", default=DEFAULT_OBJECT_COUNTS)
+    workflow_parser.add_argument("--iterations", type=int, default=5)
+    workflow_parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="Concurrent POST /goals requests per batch in the throughput scenario.",
+    )
+    workflow_parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=0.0,
+        help="Latency injected into every replayed model call.",
+    )
+    workflow_parser.add_argument(
+        "--cassette-dir",
+        type=Path,
+        default=None,
+        help="Replay recorded cassettes instead of generating synthetic ones.",
+    )
+    workflow_parser.add_argument("--output", type=Path, default=None)
+
+    prepare_parser = subparsers.add_parser(
+        "prepare",
+        help="Time decode, resize and encode of one uploaded JPEG frame per size.",
+    )
+    prepare_parser.add_argument("--sizes", default=DEFAULT_SIZES)
+    prepare_parser.add_argument("--iterations", type=int, default=10)
+    prepare_parser.add_argument("--output", type=Path, default=None)
+
+    modes_parser = subparsers.add_parser(
+        "modes",
+        help="Compare fast and two-pass planning on real images with the configured backend.",
+    )
+    modes_parser.add_argument("image_paths", type=Path, nargs="+")
+    modes_parser.add_argument("--iterations", type=int, default=3)
+    modes_parser.add_argument("--output", type=Path, default=None)
+
+    serialization_parser = subparsers.add_parser(
+        "serialization",
+        help="Time schema, response and plan encode/decode paths, before and after caching.",
+    )
+    serialization_parser.add_argument("--objects", default=DEFAULT_OBJECT_COUNTS)
+    serialization_parser.add_argument("--iterations", type=int, default=200)
+    serialization_parser.add_argument("--output", type=Path, default=None)
+
+    startup_parser = subparsers.add_parser(
+        "startup",
+        help="Time imports and CLI start-up in fresh interpreters.",
+    )
+    startup_parser.add_argument("--iterations", type=int, default=5)
+    startup_parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+    output = args.output.resolve() if args.output else None
+
+    if args.command == "prepare":
+        report = run_prepare_benchmark(_parse_sizes(args.sizes), args.iterations)
+        _emit_report(report, output)
+        return
+    if args.command == "startup":
+        with _scratch_workdir():
+            report = run_startup_benchmark(args.iterations)
+        _emit_report(report, output)
+        return
+    if args.command == "serialization":
+        with _scratch_workdir(), redirect_stdout(sys.stderr):
+            report = run_serialization_benchmark(
+                [int(value) for value in args.objects.split(",")], args.iterations
+            )
+        _emit_report(report, output)
+        return
+    if args.command == "modes":
+        with redirect_stdout(sys.stderr):
+            report = run_modes_benchmark(args.image_paths, args.iterations)
+        _emit_report(report, output)
+        return
+
+    cassette_dir = args.cassette_dir.resolve() if args.cassette_dir else None
+    with _scratch_workdir(), redirect_stdout(sys.stderr):
+        report = run_workflow_benchmark(
+            sizes=_parse_sizes(args.sizes),
+            object_counts=[int(value) for value in args.objects.split(",")],
+            iterations=args.iterations,
+            latency_ms=args.latency_ms,
+            cassette_dir=cassette_dir,
+            concurrency=args.concurrency,
+        )
+    _emit_report(report, output)
+
+
+def run_workflow_benchmark(
+    sizes: List[Tuple[int, int]],
+    object_counts: List[int],
+    iterations: int,
+    latency_ms: float,
+    cassette_dir: Optional[Path] = None,
+    concurrency: int = 8,
+) -> Dict[str, Any]:
+    from fastapi.testclient import TestClient
+
+    import server
+
+    http = TestClient(server.app)
+    # Every PUT sends the same frame; with dedupe on, put_goal would only time
+    # the reuse of the first result instead of a refresh.
+    server.frame_dedupe.max_distance = -1
+    compact_options = workflow.WorkflowOptions(
+        completion_mode=workflow.COMPACT_COMPLETION
+    )
+    atlas_options = workflow.WorkflowOptions(crop_mode=workflow.CROP_ATLAS)
+    fast_options = workflow.WorkflowOptions(plan_mode=workflow.FAST_PLANNING)
+    scenarios: List[Dict[str, Any]] = []
+    for object_count in object_counts:
+        scenario_cassettes = cassette_dir or Path(f"cassettes/{object_count}")
+        if cassette_dir is None:
+            write_synthetic_cassettes(scenario_cassettes, object_count)
+        backend = StageTimingBackend(
+            ReplayBackend(scenario_cassettes, latency_s=latency_ms / 1000.0)
+        )
+        set_backend(backend)
+
+        for width, height in sizes:
+            image = synthetic_scene(width, height)
+            existing = workflow.generate_plan_from_image(image).output
+            payload = {"image_base64": _encode_jpeg_base64(image)}
+
+            scenarios.append(
+                {
+                    "width": width,
+                    "height": height,
+                    "objects": object_count,
+                    "generate_plan": _measure(
+                        lambda: workflow.generate_plan_from_image(image),
+                        iterations,
+                        backend,
+                    ),
+                    "generate_plan_atlas": _measure(
+                        lambda: workflow.generate_plan_from_image(image, atlas_options),
+                        iterations,
+                        backend,
+                    ),
+                    "generate_plan_fast": _measure(
+                        lambda: workflow.generate_plan_from_image(image, fast_options),
+                        iterations,
+                        backend,
+                    ),
+                    "crop_input_bytes": {
+                        mode: _crop_input_bytes(image, existing, mode)
+                        for mode in workflow.CROP_MODES
+                    },
+                    "refresh_plan": _measure(
+                        lambda: workflow.refresh_plan_from_image(image, existing),
+                        iterations,
+                        backend,
+                    ),
+                    "refresh_plan_compact": _measure(
+                        lambda: workflow.refresh_plan_from_image(
+                            image, existing, compact_options
+                        ),
+                        iterations,
+                        backend,
+                    ),
+                    "completion_prompt_chars": {
+                        workflow.FULL_COMPLETION: len(
+                            workflow._build_completion_prompt(existing)
+                        ),
+                        workflow.COMPACT_COMPLETION: len(
+                            workflow._build_compact_completion_prompt(existing)
+                        ),
+                    },
+                    "post_goals": _measure(
+                        lambda: _checked(http.post("/goals", json=payload)),
+                        iterations,
+                        backend,
+                    ),
+                    "put_goal": _measure_put(http, payload, iterations, backend),
+                    "post_goals_concurrent": _measure_concurrent(
+                        server.app, payload, concurrency, iterations
+                    ),
+                }
+            )
+
+    set_backend(None)
+    return {
+        "latency_ms": latency_ms,
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "scenarios": scenarios,
+    }
+
+
+def run_modes_benchmark(image_paths: List[Path], iterations: int) -> Dict[str, Any]:
+    """Plans each image in every plan mode and diffs the outputs against two-pass.
+
+    The response cache is bypassed so repeated iterations reach the model.
+    """
+    caching = find_backend(CachingBackend)
+    inner = caching.inner if caching is not None else get_backend()
+    backend = StageTimingBackend(inner)
+    set_backend(backend)
+    results: List[Dict[str, Any]] = []
+    try:
+        for path in image_paths:
+            with Image.open(path) as opened:
+                image = opened.convert("RGB")
+            result: Dict[str, Any] = {"image": str(path), "size": list(image.size)}
+            outputs: Dict[str, OutputSchema] = {}
+            for mode in workflow.PLAN_MODES:
+                options = workflow.WorkflowOptions(
+                    generate_banana=False, plan_mode=mode
+                )
+                backend.timings.clear()
+                wall_times: List[float] = []
+                for _ in range(max(1, iterations)):
+                    start = time.perf_counter()
+                    outputs[mode] = workflow.generate_plan_from_image(
+                        image, options
+                    ).output
+                    wall_times.append(time.perf_counter() - start)
+                result[mode] = {
+                    "wall_ms": _summarize(wall_times),
+                    "stages_ms": {
+                        name: _summarize(values)
+                        for name, values in sorted(backend.timings.items())
+                    },
+                    "objects": len(outputs[mode].objects),
+                    "steps": len(outputs[mode].steps),
+                }
+            result["fast_vs_two_pass"] = plan_differences(
+                outputs[workflow.TWO_PASS_PLANNING], outputs[workflow.FAST_PLANNING]
+            )
+            results.append(result)
+    finally:
+        set_backend(None)
+    return {"iterations": iterations, "images": results}
+
+
+def plan_differences(
+    reference: OutputSchema, candidate: OutputSchema
+) -> Dict[str, Any]:
+    """Summarizes how far candidate strays from reference, matching objects by label."""
+    reference_boxes = {
+        obj.label.strip().lower(): obj.box_2d for obj in reference.objects
+    }
+    candidate_boxes = {
+        obj.label.strip().lower(): obj.box_2d for obj in candidate.objects
+    }
+    shared = sorted(set(reference_boxes) & set(candidate_boxes))
+    box_pairs = [(reference_boxes[label], candidate_boxes[label]) for label in shared]
+    ious = [
+        _box_iou(first, second)
+        for first, second in box_pairs
+        if first is not None and second is not None
+    ]
+    reference_first = reference.steps[0].object_label if reference.steps else None
+    candidate_first = candidate.steps[0].object_label if candidate.steps else None
+    return {
+        "same_goal": reference.goal.strip().lower() == candidate.goal.strip().lower(),
+        "shared_labels": len(shared),
+        "missing_labels": sorted(set(reference_boxes) - set(candidate_boxes)),
+        "extra_labels": sorted(set(candidate_boxes) - set(reference_boxes)),
+        "mean_box_iou": round(statistics.fmean(ious), 3) if ious else None,
+        "step_count_delta": len(candidate.steps) - len(reference.steps),
+        "same_first_step_object": reference_first is not None
+        and candidate_first is not None
+        and reference_first.strip().lower() == candidate_first.strip().lower(),
+    }
+
+
+def _box_iou(
+    first: Tuple[int, int, int, int], second: Tuple[int, int, int, int]
+) -> float:
+    ymin = max(first[0], second[0])
+    xmin = max(first[1], second[1])
+    ymax = min(first[2], second[2])
+    xmax = min(first[3], second[3])
+    intersection = max(0, ymax - ymin) * max(0, xmax - xmin)
+    area_first = max(0, first[2] - first[0]) * max(0, first[3] - first[1])
+    area_second = max(0, second[2] - second[0]) * max(0, second[3] - second[1])
+    union = area_first + area_second - intersection
+    return intersection / union if union else 0.0
+
+
+def run_prepare_benchmark(
+    sizes: List[Tuple[int, int]], iterations: int
+) -> Dict[str, Any]:
+    """Compares full decode + LANCZOS + PNG with the input-preparation stage."""
+    profile = workflow.ROBOTICS_INPUT_PROFILE
+    pipelines: Dict[str, Tuple[Callable[..., Any], ...]] = {
+        "baseline": (
+            _full_decode,
+            lambda image: image.resize(
+                (profile.width, int(profile.width * image.height / image.width)),
+                Image.Resampling.LANCZOS,
+            ),
+            encode_png,
+        ),
+        "prepared": (
+            decode_image,
+            lambda image: resize_to_width(image, profile.width),
+            lambda image: encode_image(image, profile).data,
+        ),
+    }
+    results: List[Dict[str, Any]] = []
+    for width, height in sizes:
+        buffer = BytesIO()
+        synthetic_scene(width, height).save(buffer, format="JPEG", quality=90)
+        frame = buffer.getvalue()
+        result: Dict[str, Any] = {
+            "width": width,
+            "height": height,
+            "frame_bytes": len(frame),
+        }
+        for name, pipeline in pipelines.items():
+            result[name] = _measure_pipeline(frame, pipeline, iterations)
+        results.append(result)
+    return {
+        "iterations": iterations,
+        "input_format": profile.format,
+        "input_quality": profile.quality,
+        "sizes": results,
+    }
+
+
+def run_startup_benchmark(iterations: int) -> Dict[str, Any]:
+    """Times each STARTUP_COMMANDS entry from process launch to exit.
+
+    Runs in the current directory with this directory on PYTHONPATH, so the
+    server's stores are created in scratch space.
+    """
+    source_dir = Path(__file__).resolve().parent
+    env = {**os.environ, "PYTHONPATH": str(source_dir)}
+    commands: Dict[str, Any] = {}
+    for name, command in STARTUP_COMMANDS.items():
+        argv = [sys.executable, *command]
+        if command[0].endswith(".py"):
+            argv[1] = str(source_dir / command[0])
+        timings: List[float] = []
+        exit_code: Optional[int] = None
+        for _ in range(max(1, iterations)):
+            started = time.perf_counter()
+            completed = subprocess.run(argv, env=env, capture_output=True)
+            timings.append(time.perf_counter() - started)
+            exit_code = completed.returncode
+        commands[name] = {
+            "exit_code": exit_code,
+            "sdk_imported": _imports_sdk(argv, env),
+            "timings_ms": _summarize(timings),
+        }
+    return {"iterations": iterations, "commands": commands}
+
+
+def _imports_sdk(argv: List[str], env: Dict[str, str]) -> bool:
+    """Whether the command imports google.genai, per python -X importtime."""
+    completed = subprocess.run(
+        [argv[0], "-X", "importtime", *argv[1:]],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    return "google.genai" in completed.stderr
+
+
+def run_serialization_benchmark(
+    object_counts: List[int], iterations: int
+) -> Dict[str, Any]:
+    """Compares the generic encode/decode paths with the cached ones.
+
+    The response_model path repeats what FastAPI does with a returned model:
+    dump it, validate the dump against response_model, dump that to JSON-able
+    values and json.dumps the result.
+    """
+    from fastapi.responses import JSONResponse
+
+    import server
+    from goal_store import GoalStore
+    from serialization import dump_payload, json_schema
+
+    highlight = GeneratedImage(encode_png(synthetic_scene(1280, 960)))
+    banana = GeneratedImage(encode_png(synthetic_scene(1024, 768)))
+    store = GoalStore(Path("goals.sqlite3"))
+    cases: Dict[str, Tuple[Callable[[], Any], Callable[[], Any]]] = {
+        "plan_schema": (
+            OutputSchema.model_json_schema,
+            lambda: json_schema(OutputSchema),
+        ),
+        "plan_config": (workflow._plan_config.__wrapped__, workflow._plan_config),
+    }
+    scenarios: List[Dict[str, Any]] = []
+    for object_count in object_counts:
+        plan = synthetic_plan(object_count)
+        plan_json = plan.model_dump_json()
+        goal_id = f"bench-{object_count}"
+        store.create(goal_id, plan)
+        result = server.GoalResult(
+            goal_id, plan, highlight, banana, revision=1, image_size=(1280, 960)
+        )
+
+        def response_model_path() -> bytes:
+            response = server.GoalResponse(
+                id=result.goal_id,
+                revision=result.revision,
+                plan=result.plan,
+                highlight_image_base64=server._encode_base64(result.highlight),
+                banana_image_base64=server._encode_base64(result.banana),
+            )
+            validated = server.GoalResponse.model_validate(response.model_dump())
+            return bytes(JSONResponse(validated.model_dump(mode="json")).body)
+
+        def stream_event_dict() -> bytes:
+            payload = {
+                "event": "done",
+                "id": goal_id,
+                "data": plan.model_dump(mode="json"),
+            }
+            return json.dumps(payload).encode("utf-8")
+
+        scenario_cases = {
+            **cases,
+            "goal_response": (
+                response_model_path,
+                lambda: server._json_response(result).body,
+            ),
+            "plan_decode": (
+                lambda: OutputSchema.model_validate_json(plan_json),
+                lambda: store.revision(goal_id, 1),
+            ),
+            "stream_event": (
+                stream_event_dict,
+                lambda: dump_payload({"event": "done", "id": goal_id, "data": plan}),
+            ),
+        }
+        timings: Dict[str, List[float]] = defaultdict(list)
+        for _ in range(max(1, iterations)):
+            for name, (before, after) in scenario_cases.items():
+                with _timed(timings, f"{name}.before"):
+                    before()
+                with _timed(timings, f"{name}.after"):
+                    after()
+        scenarios.append(
+            {
+                "objects": object_count,
+                "response_bytes": len(server._json_response(result).body),
+                "timings_ms": {
+                    name: _summarize(values) for name, values in timings.items()
+                },
+            }
+        )
+    return {"iterations": iterations, "scenarios": scenarios}
+
+
+def _crop_input_bytes(image: Image.Image, plan: OutputSchema, crop_mode: str) -> int:
+    _, parts = workflow._crop_object_parts(image, plan.objects, None, crop_mode)
+    return sum(
+        len(part.inline_data.data)
+        for part in parts
+        if part.inline_data is not None and part.inline_data.data is not None
+    )
+
+
+def _full_decode(data: bytes) -> Image.Image:
+    with Image.open(BytesIO(data)) as image:
+        return image.convert("RGB")
+
+
+def _measure_pipeline(
+    frame: bytes, pipeline: Tuple[Callable[..., Any], ...], iterations: int
+) -> Dict[str, Any]:
+    decode, resize, encode = pipeline
+    timings: Dict[str, List[float]] = defaultdict(list)
+    encoded = b""
+    decoded_size: Tuple[int, int] = (0, 0)
+    for _ in range(max(1, iterations)):
+        with _timed(timings, "decode"):
+            image = decode(frame)
+        with _timed(timings, "resize"):
+            resized = resize(image)
+        with _timed(timings, "encode"):
+            encoded = encode(resized)
+        decoded_size = image.size
+    totals = [sum(values) for values in zip(*timings.values())]
+    report: Dict[str, Any] = {
+        f"{name}_ms": round(statistics.median(values) * 1000, 3)
+        for name, values in timings.items()
+    }
+    report["total_ms"] = round(statistics.median(totals) * 1000, 3)
+    report["decoded_size"] = list(decoded_size)
+    report["input_bytes"] = len(encoded)
+    return report
+
+
+class StageTimingBackend(ModelBackend):
+    def __init__(self, inner: ModelBackend) -> None:
+        self.inner = inner
+        self.timings: Dict[str, List[float]] = defaultdict(list)
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        with _timed(self.timings, f"model.{request.stage}"):
+            return self.inner.generate(request)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        with _timed(self.timings, f"model.{request.stage}"):
+            return await self.inner.agenerate(request)
+
+
+def synthetic_scene(width: int, height: int) -> Image.Image:
+    noise = Image.effect_noise((width, height), 64)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    return Image.merge(
+        "RGB", (noise, gradient, noise.transpose(Image.Transpose.FLIP_LEFT_RIGHT))
+    )
+
+
+def synthetic_plan(object_count: int) -> OutputSchema:
+    objects: List[ObjectItem] = []
+    for index in range(object_count):
+        column = index % 5
+        row = index // 5
+        ymin = min(900, 50 + row * 180)
+        xmin = 20 + column * 190
+        objects.append(
+            ObjectItem(
+                label=f"object {index + 1}", box_2d=(ymin, xmin, ymin + 150, xmin + 160)
+            )
+        )
+    steps = [
+        StepItem(text=f"Move {obj.label} to the tray.", object_label=obj.label)
+        for obj in objects
+    ]
+    return OutputSchema(goal="Tidy the table.", objects=objects, steps=steps)
+
+
+def write_synthetic_cassettes(
+    cassette_dir: Union[str, Path], object_count: int
+) -> Path:
+    cassette_dir = Path(cassette_dir)
+    plan = synthetic_plan(object_count)
+    completed_steps = [
+        StepItem(text=f"[DONE] {step.text}", object_label=step.object_label)
+        if index == 0
+        else step
+        for index, step in enumerate(plan.steps)
+    ]
+    completion = OutputSchema(
+        goal=plan.goal, objects=plan.objects, steps=completed_steps
+    )
+    banana_png = encode_png(synthetic_scene(1000, 750))
+    interactions = [
+        {
+            "stage": ANALYSIS_STAGE,
+            "text": AnalysisSchema(
+                goal=plan.goal, objects=plan.objects
+            ).model_dump_json(),
+        },
+        {
+            "stage": STEPS_STAGE,
+            "text": StepsSchema(goal=plan.goal, steps=plan.steps).model_dump_json(),
+        },
+        {"stage": PLAN_STAGE, "text": plan.model_dump_json()},
+        {"stage": COMPLETION_STAGE, "text": completion.model_dump_json()},
+        {
+            "stage": COMPACT_COMPLETION_STAGE,
+            "text": CompactCompletionSchema(
+                objects=plan.objects,
+                steps=[StepStatusItem(id=1, done=True)],
+            ).model_dump_json(),
+        },
+        {
+            "stage": BANANA_STAGE,
+            "text": None,
+            "images": [
+                {
+                    "mime_type": "image/png",
+                    "data_base64": base64.b64encode(banana_png).decode("ascii"),
+                }
+            ],
+        },
+    ]
+    return write_cassette(cassette_dir / "synthetic.json", interactions)
+
+
+def _measure(
+    func: Callable[[], Any], iterations: int, backend: StageTimingBackend
+) -> Dict[str, Any]:
+    func()
+    backend.timings.clear()
+    stage_timings: Dict[str, List[float]] = defaultdict(list)
+    wall_times: List[float] = []
+    with _timed_workflow_helpers(stage_timings):
+        for _ in range(iterations):
+            start = time.perf_counter()
+            func()
+            wall_times.append(time.perf_counter() - start)
+    for name, values in backend.timings.items():
+        stage_timings[name].extend(values)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    total = sum(wall_times)
+    return {
+        "wall_ms": _summarize(wall_times),
+        "stages_ms": {
+            name: round(sum(values) * 1000.0 / iterations, 3)
+            for name, values in sorted(stage_timings.items())
+        },
+        "throughput_per_s": round(iterations / total, 3) if total else None,
+        "peak_python_heap_mb": round(peak / (1024 * 1024), 3),
+        "max_rss_mb": round(_max_rss_bytes() / (1024 * 1024), 3),
+    }
+
+
+def _measure_put(
+    http: Any, payload: Dict[str, str], iterations: int, backend: StageTimingBackend
+) -> Dict[str, Any]:
+    goal_id = _checked(http.post("/goals", json=payload))["id"]
+    return _measure(
+        lambda: _checked(http.put(f"/goals/{goal_id}", json=payload)),
+        iterations,
+        backend,
+    )
+
+
+def _measure_concurrent(
+    app: Any, payload: Dict[str, str], concurrency: int, iterations: int
+) -> Dict[str, Any]:
+    import httpx
+
+    async def batch(client: httpx.AsyncClient) -> None:
+        responses = await asyncio.gather(
+            *(client.post("/goals", json=payload) for _ in range(concurrency))
+        )
+        for response in responses:
+            _checked(response)
+
+    async def run() -> List[float]:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://benchmark", timeout=None
+        ) as client:
+            await batch(client)
+            wall_times: List[float] = []
+            for _ in range(iterations):
+                start = time.perf_counter()
+                await batch(client)
+                wall_times.append(time.perf_counter() - start)
+            return wall_times
+
+    wall_times = asyncio.run(run())
+    total = sum(wall_times)
+    return {
+        "wall_ms": _summarize(wall_times),
+        "requests": concurrency * iterations,
+        "throughput_per_s": round(concurrency * iterations / total, 3)
+        if total
+        else None,
+        "max_rss_mb": round(_max_rss_bytes() / (1024 * 1024), 3),
+    }
+
+
+@contextmanager
+def _timed_workflow_helpers(timings: Dict[str, List[float]]) -> Iterator[None]:
+    originals = {name: getattr(workflow, name) for name in TIMED_WORKFLOW_HELPERS}
+
+    def wrap(name: str, func: Callable[..., Any]) -> Callable[..., Any]:
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            with _timed(timings, name):
+                return func(*args, **kwargs)
+
+        return timed
+
+    for name, func in originals.items():
+        setattr(workflow, name, wrap(name, func))
+    try:
+        yield
+    finally:
+        for name, func in originals.items():
+            setattr(workflow, name, func)
+
+
+@contextmanager
+def _timed(timings: Dict[str, List[float]], name: str) -> Iterator[None]:
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name].append(time.perf_counter() - start)
+
+
+def _max_rss_bytes() -> int:
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def _summarize(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+    return {
+        "mean": round(statistics.fmean(ordered) * 1000.0, 3),
+        "p50": round(_percentile(ordered, 0.5) * 1000.0, 3),
+        "p95": round(_percentile(ordered, 0.95) * 1000.0, 3),
+        "max": round(ordered[-1] * 1000.0, 3),
+    }
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _checked(response: Any) -> Any:
+    if response.status_code != 200:
+        raise RuntimeError(
+            f"Request failed with status {response.status_code}: {response.text}"
+        )
+    return response.json()
+
+
+def _encode_jpeg_base64(image: Image.Image) -> str:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def _parse_sizes(value: str) -> List[Tuple[int, int]]:
+    sizes: List[Tuple[int, int]] = []
+    for item in value.split(","):
+        width, height = item.lower().split("x", 1)
+        sizes.append((int(width), int(height)))
+    return sizes
+
+
+@contextmanager
+def _scratch_workdir() -> Iterator[None]:
+    previous = Path.cwd()
+    with tempfile.TemporaryDirectory(prefix="realityguide-bench-") as workdir:
+        os.chdir(workdir)
+        try:
+            yield
+        finally:
+            os.chdir(previous)
+
+
+def _emit_report(report: Dict[str, Any], output: Optional[Path]) -> None:
+    text = json.dumps(report, indent=2)
+    if output:
+        output.write_text(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
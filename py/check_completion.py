@@ -1,10 +1,20 @@
 import argparse
+from contextlib import nullcontext
 from pathlib import Path
 
 from PIL import Image
 
+from profiling import PROFILE_DIR, profile_session
 from shared import OutputSchema
-from workflow import WorkflowArtifacts, actionable_steps, refresh_plan_from_image
+from workflow import (
+    COMPLETION_MODES,
+    DEFAULT_COMPLETION_MODE,
+    REFRESH_ARTIFACT_PATHS,
+    WorkflowArtifacts,
+    WorkflowOptions,
+    actionable_steps,
+    refresh_plan_from_image,
+)
 
 
 def main() -> None:
@@ -21,18 +31,48 @@ def main() -> None:
         type=Path,
         help="Path to the JSON file produced by main.py that captures the previous plan.",
     )
+    parser.add_argument(
+        "--completion-mode",
+        choices=COMPLETION_MODES,
+        default=DEFAULT_COMPLETION_MODE,
+        help="'compact' only sends the unfinished steps to the model.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Write a CPU profile and allocation snapshot to {PROFILE_DIR}/.",
+    )
     args = parser.parse_args()
 
-    output = check_completion(args.image_path, args.progress_json)
+    with (
+        profile_session("check_completion")
+        if args.profile
+        else nullcontext() as profile
+    ):
+        output = check_completion(
+            args.image_path, args.progress_json, args.completion_mode
+        )
     print(output.model_dump_json(indent=2))
+    if profile is not None:
+        print(f"Saved profile {profile} to {PROFILE_DIR}/")
 
 
-def check_completion(image_path: Path, progress_json_path: Path) -> OutputSchema:
+def check_completion(
+    image_path: Path,
+    progress_json_path: Path,
+    completion_mode: str = DEFAULT_COMPLETION_MODE,
+) -> OutputSchema:
     progress_json_path = Path(progress_json_path)
     existing = OutputSchema.model_validate_json(progress_json_path.read_text())
 
     image = _load_image(image_path)
-    artifacts = refresh_plan_from_image(image, existing)
+    artifacts = refresh_plan_from_image(
+        image,
+        existing,
+        WorkflowOptions(
+            save_to=REFRESH_ARTIFACT_PATHS, completion_mode=completion_mode
+        ),
+    )
     _log_continuation_artifacts(artifacts)
     return artifacts.output
 
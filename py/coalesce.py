@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    TypeVar,
+)
+
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R")
+
+Run = Callable[[], Awaitable[R]]
+
+COALESCE_ENABLED = os.environ.get("REALITYGUIDE_COALESCE_UPDATES", "1") == "1"
+
+
+@dataclass
+class _Slot(Generic[R]):
+    pending: Optional[Run[R]] = None
+    waiters: List["asyncio.Future[R]"] = field(default_factory=list)
+    task: Optional["asyncio.Task[None]"] = None
+
+
+@dataclass
+class _Turn:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    holders: int = 0
+
+
+class LatestFrameCoalescer(Generic[R]):
+    """Single-flight per key where the newest submission wins.
+
+    At most one run is in flight for a key. Runs submitted while one is in
+    flight wait in a single pending slot, and each new submission replaces the
+    pending one. Callers whose run was replaced receive the result of the run
+    that replaced it, which processes a newer frame than theirs. Runs happen in
+    a task of their own, so a caller that disconnects does not cancel the work
+    other callers are waiting for. Work that cannot be coalesced, like a
+    streamed refresh, takes the same per-key turn through exclusive().
+    """
+
+    def __init__(self, enabled: bool = COALESCE_ENABLED) -> None:
+        self.enabled = enabled
+        self._slots: Dict[str, _Slot[R]] = {}
+        self._turns: Dict[str, _Turn] = {}
+        self._submitted = 0
+        self._runs = 0
+        self._superseded = 0
+
+    async def submit(self, key: str, run: Run[R]) -> R:
+        if not self.enabled:
+            return await run()
+        self._submitted += 1
+        slot = self._slots.setdefault(key, _Slot())
+        if slot.pending is not None:
+            self._superseded += 1
+        slot.pending = run
+        waiter: "asyncio.Future[R]" = asyncio.get_running_loop().create_future()
+        slot.waiters.append(waiter)
+        if slot.task is None:
+            slot.task = asyncio.create_task(self._drain(key, slot))
+        return await waiter
+
+    @asynccontextmanager
+    async def exclusive(self, key: str) -> AsyncIterator[None]:
+        """Runs the block when no run or other exclusive block for key is active."""
+        if not self.enabled:
+            yield
+            return
+        turn = self._turns.setdefault(key, _Turn())
+        turn.holders += 1
+        try:
+            async with turn.lock:
+                yield
+        finally:
+            turn.holders -= 1
+            if not turn.holders and self._turns.get(key) is turn:
+                del self._turns[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "enabled": int(self.enabled),
+            "in_flight": sum(1 for slot in self._slots.values() if slot.task),
+            "pending": sum(1 for slot in self._slots.values() if slot.pending),
+            "submitted": self._submitted,
+            "runs": self._runs,
+            "superseded": self._superseded,
+        }
+
+    async def _drain(self, key: str, slot: _Slot[R]) -> None:
+        waiters: List["asyncio.Future[R]"] = []
+        try:
+            while slot.pending is not None:
+                run, waiters = slot.pending, slot.waiters
+                slot.pending, slot.waiters = None, []
+                waiters = [waiter for waiter in waiters if not waiter.done()]
+                if not waiters:
+                    # Every caller of this frame went away; skip the model call.
+                    continue
+                self._runs += 1
+                try:
+                    async with self.exclusive(key):
+                        result = await run()
+                except Exception as exc:
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(exc)
+                    continue
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(result)
+        except asyncio.CancelledError:
+            for waiter in waiters + slot.waiters:
+                waiter.cancel()
+            raise
+        finally:
+            slot.task = None
+            if self._slots.get(key) is slot:
+                del self._slots[key]
+
+    async def shutdown(self) -> None:
+        tasks = [slot.task for slot in self._slots.values() if slot.task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
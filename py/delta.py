@@ -0,0 +1,89 @@
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+from shared import ObjectItem, OutputSchema, StepItem
+from workflow import actionable_steps, is_step_done
+
+
+class StepUpdate(BaseModel):
+    index: int
+    text: Optional[str] = None
+    object_label: Optional[str] = None
+
+
+class PlanDelta(BaseModel):
+    """Changes that turn the client's copy of a plan into the current one.
+
+    Step indices refer to the remaining (not yet done) steps of the base plan,
+    which is the list the client received. The client drops completed_steps and
+    removed_steps, applies updated_steps, and appends added_steps. When the
+    change cannot be expressed that way, steps holds the full remaining list
+    instead. Objects are keyed by label: objects lists new or moved boxes and
+    removed_objects the labels that are gone.
+    """
+
+    goal: Optional[str] = None
+    completed_steps: List[int] = Field(default_factory=list)
+    removed_steps: List[int] = Field(default_factory=list)
+    updated_steps: List[StepUpdate] = Field(default_factory=list)
+    added_steps: List[StepItem] = Field(default_factory=list)
+    steps: Optional[List[StepItem]] = None
+    objects: List[ObjectItem] = Field(default_factory=list)
+    removed_objects: List[str] = Field(default_factory=list)
+
+
+def plan_delta(base: OutputSchema, current: OutputSchema) -> PlanDelta:
+    """Diffs two full plans, including their [DONE] steps.
+
+    The completion prompt keeps every step at its position, so steps are
+    compared by position in the full list.
+    """
+    delta = PlanDelta()
+    if current.goal != base.goal:
+        delta.goal = current.goal
+
+    base_objects = {obj.label: obj for obj in base.objects}
+    for obj in current.objects:
+        previous = base_objects.pop(obj.label, None)
+        if previous is None or previous.box_2d != obj.box_2d:
+            delta.objects.append(obj)
+    delta.removed_objects = list(base_objects)
+
+    if not _diff_steps(base.steps, current.steps, delta):
+        delta.completed_steps.clear()
+        delta.removed_steps.clear()
+        delta.updated_steps.clear()
+        delta.added_steps.clear()
+        delta.steps = actionable_steps(current.steps)
+    return delta
+
+
+def _diff_steps(
+    base: List[StepItem], current: List[StepItem], delta: PlanDelta
+) -> bool:
+    index = -1
+    for position, previous in enumerate(base):
+        step = current[position] if position < len(current) else None
+        if is_step_done(previous):
+            if step is not None and not is_step_done(step):
+                # A step the client already dropped came back.
+                return False
+            continue
+        index += 1
+        if step is None:
+            delta.removed_steps.append(index)
+        elif is_step_done(step):
+            delta.completed_steps.append(index)
+        elif step != previous:
+            delta.updated_steps.append(
+                StepUpdate(
+                    index=index,
+                    text=step.text if step.text != previous.text else None,
+                    object_label=step.object_label
+                    if step.object_label != previous.object_label
+                    else None,
+                )
+            )
+    delta.added_steps = actionable_steps(current[len(base) :])
+    return True
@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Generic, Optional, Tuple, TypeVar
+
+from PIL import Image
+
+R = TypeVar("R")
+
+HASH_SIZE = 8
+DEFAULT_MAX_DISTANCE = int(os.environ.get("REALITYGUIDE_DEDUPE_MAX_DISTANCE", "4"))
+DEFAULT_MAX_GOALS = int(os.environ.get("REALITYGUIDE_DEDUPE_MAX_GOALS", "4096"))
+
+
+def perceptual_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per adjacent pixel pair of a tiny grayscale thumbnail."""
+    thumbnail = image.resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = thumbnail.convert("L").tobytes()
+
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            left = pixels[offset + column]
+            right = pixels[offset + column + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+@dataclass
+class FrameRecord(Generic[R]):
+    frame_hash: int
+    image_size: Tuple[int, int]
+    result: R
+
+
+class FrameDedupeCache(Generic[R]):
+    """Remembers, per goal, the last processed frame and the result it produced."""
+
+    def __init__(
+        self,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        max_goals: int = DEFAULT_MAX_GOALS,
+    ) -> None:
+        self.max_distance = max_distance
+        self.max_goals = max_goals
+        self._records: "OrderedDict[str, FrameRecord[R]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_distance >= 0
+
+    def lookup(
+        self, goal_id: str, frame_hash: int, image_size: Tuple[int, int]
+    ) -> Optional[R]:
+        if not self.enabled:
+            return None
+        with self._lock:
+            record = self._records.get(goal_id)
+            if record is None or record.image_size != image_size:
+                return None
+            if hamming_distance(record.frame_hash, frame_hash) > self.max_distance:
+                return None
+            self._records.move_to_end(goal_id)
+            return record.result
+
+    def store(
+        self, goal_id: str, frame_hash: int, image_size: Tuple[int, int], result: R
+    ) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._records[goal_id] = FrameRecord(frame_hash, image_size, result)
+            self._records.move_to_end(goal_id)
+            while len(self._records) > self.max_goals:
+                self._records.popitem(last=False)
+
+    def forget(self, goal_id: str) -> None:
+        with self._lock:
+            self._records.pop(goal_id, None)
@@ -0,0 +1,317 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from shared import OutputSchema
+
+DEFAULT_DB_PATH = Path(os.environ.get("REALITYGUIDE_GOAL_DB", "goals/goals.sqlite3"))
+DEFAULT_HOT_ENTRIES = int(os.environ.get("REALITYGUIDE_GOAL_CACHE_ENTRIES", "1024"))
+# Parsed revisions kept per hot goal; delta responses diff against recent ones.
+REVISIONS_PER_HOT_GOAL = 4
+LIST_ORDERS = {"created": "created_at", "updated": "updated_at"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS goals (
+    id TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL,
+    goal TEXT NOT NULL,
+    plan TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS goals_created_at ON goals (created_at);
+CREATE INDEX IF NOT EXISTS goals_updated_at ON goals (updated_at);
+CREATE TABLE IF NOT EXISTS goal_revisions (
+    goal_id TEXT NOT NULL,
+    revision INTEGER NOT NULL,
+    plan TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (goal_id, revision)
+);
+"""
+
+
+@dataclass
+class GoalRecord:
+    goal_id: str
+    revision: int
+    plan: OutputSchema
+    created_at: float
+    updated_at: float
+
+
+@dataclass
+class GoalSummary:
+    id: str
+    revision: int
+    goal: str
+    created_at: float
+    updated_at: float
+
+
+class GoalNotFoundError(Exception):
+    pass
+
+
+class RevisionConflictError(Exception):
+    def __init__(self, goal_id: str, expected: int, actual: int) -> None:
+        super().__init__(
+            f"Goal {goal_id} is at revision {actual}, not the expected {expected}."
+        )
+        self.goal_id = goal_id
+        self.expected = expected
+        self.actual = actual
+
+
+class GoalStore:
+    """SQLite-backed goals with an append-only revision history.
+
+    The goals table holds the current plan of every goal and goal_revisions keeps
+    each plan ever written. Updates are compare-and-swap on the revision number,
+    so of two concurrent updates to one goal only the first commits. Recently
+    used goals and their recent revisions are kept parsed in memory, so a plan
+    that was validated on its way in is not parsed again. The database runs in
+    WAL mode so several worker processes can share it; a parsed goal is only
+    used after checking that no other worker has committed a newer revision.
+    """
+
+    def __init__(self, path: Path, hot_entries: int = DEFAULT_HOT_ENTRIES) -> None:
+        self.path = Path(path).resolve()
+        self.hot_entries = hot_entries
+        self._hot: "OrderedDict[str, GoalRecord]" = OrderedDict()
+        self._revisions: "OrderedDict[Tuple[str, int], OutputSchema]" = OrderedDict()
+        self._hot_lock = threading.Lock()
+        self._local = threading.local()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def create(self, goal_id: str, plan: OutputSchema) -> GoalRecord:
+        now = time.time()
+        record = GoalRecord(goal_id, 1, plan, created_at=now, updated_at=now)
+        plan_json = plan.model_dump_json()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO goals (id, revision, goal, plan, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (goal_id, 1, plan.goal, plan_json, now, now),
+            )
+            connection.execute(
+                "INSERT INTO goal_revisions (goal_id, revision, plan, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (goal_id, 1, plan_json, now),
+            )
+        self._remember(record)
+        return record
+
+    def get(self, goal_id: str) -> Optional[GoalRecord]:
+        connection = self._connection()
+        record = self._cached(goal_id)
+        if record is not None:
+            current = connection.execute(
+                "SELECT revision FROM goals WHERE id = ?", (goal_id,)
+            ).fetchone()
+            if current is not None and current[0] == record.revision:
+                return record
+            self.forget(goal_id)
+        row = connection.execute(
+            "SELECT revision, plan, created_at, updated_at FROM goals WHERE id = ?",
+            (goal_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        revision, plan_json, created_at, updated_at = row
+        record = GoalRecord(
+            goal_id,
+            revision,
+            OutputSchema.model_validate_json(plan_json),
+            created_at=created_at,
+            updated_at=updated_at,
+        )
+        self._remember(record)
+        return record
+
+    def update(
+        self, goal_id: str, plan: OutputSchema, expected_revision: int
+    ) -> GoalRecord:
+        now = time.time()
+        revision = expected_revision + 1
+        plan_json = plan.model_dump_json()
+        with self._transaction() as connection:
+            updated = connection.execute(
+                "UPDATE goals SET revision = ?, goal = ?, plan = ?, updated_at = ?"
+                " WHERE id = ? AND revision = ? RETURNING created_at",
+                (revision, plan.goal, plan_json, now, goal_id, expected_revision),
+            ).fetchone()
+            if updated is None:
+                row = connection.execute(
+                    "SELECT revision FROM goals WHERE id = ?", (goal_id,)
+                ).fetchone()
+                self.forget(goal_id)
+                if row is None:
+                    raise GoalNotFoundError(goal_id)
+                raise RevisionConflictError(goal_id, expected_revision, row[0])
+            connection.execute(
+                "INSERT INTO goal_revisions (goal_id, revision, plan, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                (goal_id, revision, plan_json, now),
+            )
+        record = GoalRecord(goal_id, revision, plan, updated[0], updated_at=now)
+        self._remember(record)
+        return record
+
+    def revision(self, goal_id: str, revision: int) -> Optional[OutputSchema]:
+        with self._hot_lock:
+            plan = self._revisions.get((goal_id, revision))
+            if plan is not None:
+                self._revisions.move_to_end((goal_id, revision))
+                return plan
+        row = (
+            self._connection()
+            .execute(
+                "SELECT plan FROM goal_revisions WHERE goal_id = ? AND revision = ?",
+                (goal_id, revision),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        plan = OutputSchema.model_validate_json(row[0])
+        self._remember_revision(goal_id, revision, plan)
+        return plan
+
+    def history(self, goal_id: str) -> List[GoalRecord]:
+        rows = (
+            self._connection()
+            .execute(
+                "SELECT r.revision, r.plan, g.created_at, r.created_at"
+                " FROM goal_revisions r JOIN goals g ON g.id = r.goal_id"
+                " WHERE r.goal_id = ? ORDER BY r.revision",
+                (goal_id,),
+            )
+            .fetchall()
+        )
+        return [
+            GoalRecord(
+                goal_id,
+                revision,
+                OutputSchema.model_validate_json(plan_json),
+                created_at=created_at,
+                updated_at=updated_at,
+            )
+            for revision, plan_json, created_at, updated_at in rows
+        ]
+
+    def list_goals(
+        self, limit: int = 50, order: str = "updated", before: Optional[float] = None
+    ) -> List[GoalSummary]:
+        column = LIST_ORDERS[order]
+        query = "SELECT id, revision, goal, created_at, updated_at FROM goals"
+        params: List[object] = []
+        if before is not None:
+            query += f" WHERE {column} < ?"
+            params.append(before)
+        query += f" ORDER BY {column} DESC LIMIT ?"
+        params.append(limit)
+        rows = self._connection().execute(query, params).fetchall()
+        return [GoalSummary(*row) for row in rows]
+
+    def import_json_dir(self, directory: Path) -> int:
+        """Imports legacy goals/<id>.json files that are not in the store yet."""
+        imported = 0
+        connection = self._connection()
+        for path in sorted(Path(directory).glob("*.json")):
+            known = connection.execute(
+                "SELECT 1 FROM goals WHERE id = ?", (path.stem,)
+            ).fetchone()
+            if known is not None:
+                continue
+            try:
+                plan = OutputSchema.model_validate_json(path.read_text())
+            except (OSError, ValueError):
+                continue
+            created_at = path.stat().st_mtime
+            plan_json = plan.model_dump_json()
+            with self._transaction() as connection:
+                inserted = connection.execute(
+                    "INSERT OR IGNORE INTO goals"
+                    " (id, revision, goal, plan, created_at, updated_at)"
+                    " VALUES (?, 1, ?, ?, ?, ?)",
+                    (path.stem, plan.goal, plan_json, created_at, created_at),
+                ).rowcount
+                if inserted:
+                    connection.execute(
+                        "INSERT INTO goal_revisions"
+                        " (goal_id, revision, plan, created_at) VALUES (?, 1, ?, ?)",
+                        (path.stem, plan_json, created_at),
+                    )
+            imported += inserted
+        return imported
+
+    def forget(self, goal_id: str) -> None:
+        with self._hot_lock:
+            self._hot.pop(goal_id, None)
+
+    def _cached(self, goal_id: str) -> Optional[GoalRecord]:
+        with self._hot_lock:
+            record = self._hot.get(goal_id)
+            if record is not None:
+                self._hot.move_to_end(goal_id)
+            return record
+
+    def _remember(self, record: GoalRecord) -> None:
+        if self.hot_entries <= 0:
+            return
+        with self._hot_lock:
+            current = self._hot.get(record.goal_id)
+            if current is not None and current.revision > record.revision:
+                return
+            self._hot[record.goal_id] = record
+            self._hot.move_to_end(record.goal_id)
+            while len(self._hot) > self.hot_entries:
+                self._hot.popitem(last=False)
+        self._remember_revision(record.goal_id, record.revision, record.plan)
+
+    def _remember_revision(
+        self, goal_id: str, revision: int, plan: OutputSchema
+    ) -> None:
+        if self.hot_entries <= 0:
+            return
+        # Revisions never change once written, so they need no invalidation.
+        with self._hot_lock:
+            self._revisions[(goal_id, revision)] = plan
+            self._revisions.move_to_end((goal_id, revision))
+            while len(self._revisions) > self.hot_entries * REVISIONS_PER_HOT_GOAL:
+                self._revisions.popitem(last=False)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+
+def goal_store_from_env(legacy_dir: Optional[Path] = None) -> GoalStore:
+    store = GoalStore(DEFAULT_DB_PATH)
+    if legacy_dir is not None and legacy_dir.is_dir():
+        store.import_json_dir(legacy_dir)
+    return store
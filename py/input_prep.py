@@ -0,0 +1,120 @@
+import math
+import os
+from dataclasses import dataclass, field
+from io import BytesIO
+from typing import TYPE_CHECKING, Optional, Tuple
+
+from PIL import Image
+
+from tracing import traced
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+DEFAULT_TARGET_WIDTH = 1000
+DEFAULT_DECODE_MAX_SIDE = int(os.environ.get("REALITYGUIDE_DECODE_MAX_SIDE", "1600"))
+REDUCING_GAP = 3.0
+SOURCE_SIZE_KEY = "realityguide_source_size"
+MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+@dataclass(frozen=True)
+class InputProfile:
+    """How images are encoded before they are sent to one model."""
+
+    format: str = "JPEG"
+    quality: int = 90
+    width: int = DEFAULT_TARGET_WIDTH
+
+    @property
+    def mime_type(self) -> str:
+        return MIME_TYPES[self.format]
+
+
+def _format_from_env() -> str:
+    """Reads REALITYGUIDE_INPUT_FORMAT, refusing formats without a MIME type."""
+    image_format = os.environ.get("REALITYGUIDE_INPUT_FORMAT", "JPEG").strip().upper()
+    if image_format not in MIME_TYPES:
+        raise ValueError(
+            f"Unknown REALITYGUIDE_INPUT_FORMAT '{image_format}', "
+            f"expected one of {tuple(MIME_TYPES)}."
+        )
+    return image_format
+
+
+PHOTO_INPUT_PROFILE = InputProfile(
+    format=_format_from_env(),
+    quality=int(os.environ.get("REALITYGUIDE_INPUT_QUALITY", "90")),
+)
+LOSSLESS_INPUT_PROFILE = InputProfile(format="PNG")
+
+
+@dataclass
+class PreparedImage:
+    """A model input encoded once; reuse part across calls instead of the PIL image."""
+
+    data: bytes
+    mime_type: str
+    size: Tuple[int, int]
+    part: "types.Part" = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        from google.genai import types
+
+        self.part = types.Part.from_bytes(data=self.data, mime_type=self.mime_type)
+
+
+def decode_image(data: bytes, max_side: int = DEFAULT_DECODE_MAX_SIDE) -> Image.Image:
+    """Decodes an uploaded frame to RGB, at a reduced scale where the format allows.
+
+    JPEG frames larger than max_side are decoded in draft mode at 1/2, 1/4 or 1/8
+    scale, never below max_side. The uploaded size is kept in
+    image.info[SOURCE_SIZE_KEY] so boxes can still be reported against it.
+    """
+    with Image.open(BytesIO(data)) as image:
+        original_size = image.size
+        longest = max(image.size)
+        if max_side > 0 and image.format == "JPEG" and longest > max_side:
+            scale = max_side / longest
+            image.draft(
+                "RGB",
+                (math.ceil(image.width * scale), math.ceil(image.height * scale)),
+            )
+        decoded = image.convert("RGB")
+    decoded.info[SOURCE_SIZE_KEY] = original_size
+    return decoded
+
+
+def source_size(image: Image.Image) -> Tuple[int, int]:
+    return image.info.get(SOURCE_SIZE_KEY, image.size)
+
+
+def resize_to_width(image: Image.Image, target_width: int) -> Image.Image:
+    target_height = max(1, int(target_width * image.size[1] / image.size[0]))
+    return image.resize(
+        (target_width, target_height),
+        Image.Resampling.LANCZOS,
+        reducing_gap=REDUCING_GAP,
+    )
+
+
+def encode_image(image: Image.Image, profile: InputProfile) -> PreparedImage:
+    buffer = BytesIO()
+    if profile.format == "PNG":
+        image.save(buffer, format="PNG")
+    else:
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        image.save(buffer, format=profile.format, quality=profile.quality)
+    return PreparedImage(
+        data=buffer.getvalue(), mime_type=profile.mime_type, size=image.size
+    )
+
+
+@traced("prepare_input")
+def prepare_image(
+    image: Image.Image,
+    profile: InputProfile = PHOTO_INPUT_PROFILE,
+    target_width: Optional[int] = None,
+) -> PreparedImage:
+    return encode_image(resize_to_width(image, target_width or profile.width), profile)
@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import Enum
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+from backends import GeneratedImage
+
+logger = logging.getLogger(__name__)
+
+ArtifactWork = Callable[[], Coroutine[Any, Any, Optional[GeneratedImage]]]
+
+DEFAULT_MAX_PENDING = int(os.environ.get("REALITYGUIDE_JOB_QUEUE_SIZE", "64"))
+DEFAULT_WORKERS = int(os.environ.get("REALITYGUIDE_JOB_WORKERS", "4"))
+DEFAULT_MAX_RETAINED = int(os.environ.get("REALITYGUIDE_JOB_RETAINED", "1024"))
+NO_RESULT_ERROR = "The job finished without producing an artifact."
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class ArtifactJob:
+    """Background generation of a single named artifact for a goal."""
+
+    goal_id: str
+    name: str
+    work: ArtifactWork
+    revision: Optional[int] = None
+    job_id: str = field(default_factory=lambda: uuid4().hex)
+    status: JobStatus = JobStatus.PENDING
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    result: Optional[GeneratedImage] = None
+    error: Optional[str] = None
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+    _task: Optional["asyncio.Task[Optional[GeneratedImage]]"] = field(
+        default=None, repr=False
+    )
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.job_id}-{self.status.value}"'
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "job_id": self.job_id,
+            "goal_id": self.goal_id,
+            "name": self.name,
+            "revision": self.revision,
+            "status": self.status.value,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+    def _set_status(self, status: JobStatus) -> None:
+        self.status = status
+        if self.finished:
+            self.finished_at = time.time()
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class ArtifactJobQueue:
+    """Bounded background queue; a newer job for a goal supersedes its older ones."""
+
+    def __init__(
+        self,
+        max_pending: int = DEFAULT_MAX_PENDING,
+        workers: int = DEFAULT_WORKERS,
+        max_retained: int = DEFAULT_MAX_RETAINED,
+    ) -> None:
+        self.max_pending = max_pending
+        self.workers = workers
+        self.max_retained = max_retained
+        self._queue: Optional["asyncio.Queue[ArtifactJob]"] = None
+        self._worker_tasks: List["asyncio.Task[None]"] = []
+        self._latest: "OrderedDict[Tuple[str, str], ArtifactJob]" = OrderedDict()
+
+    def submit(
+        self,
+        goal_id: str,
+        name: str,
+        work: ArtifactWork,
+        revision: Optional[int] = None,
+    ) -> ArtifactJob:
+        queue = self._ensure_started()
+        job = ArtifactJob(goal_id=goal_id, name=name, work=work, revision=revision)
+        try:
+            queue.put_nowait(job)
+        except asyncio.QueueFull as exc:
+            raise QueueFullError("Artifact job queue is full.") from exc
+
+        self.cancel(goal_id, name)
+        key = (goal_id, name)
+        self._latest[key] = job
+        self._latest.move_to_end(key)
+        while len(self._latest) > self.max_retained:
+            _, evicted = self._latest.popitem(last=False)
+            self._cancel_job(evicted)
+        return job
+
+    def latest(self, goal_id: str, name: str) -> Optional[ArtifactJob]:
+        return self._latest.get((goal_id, name))
+
+    def cancel(self, goal_id: str, name: str) -> Optional[ArtifactJob]:
+        job = self._latest.get((goal_id, name))
+        if job is not None:
+            self._cancel_job(job)
+        return job
+
+    async def wait(self, job: ArtifactJob, timeout_s: float) -> ArtifactJob:
+        if job.finished or timeout_s <= 0:
+            return job
+        try:
+            await asyncio.wait_for(job._changed.wait(), timeout=timeout_s)
+        except asyncio.TimeoutError:
+            pass
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        counts = {status.value: 0 for status in JobStatus}
+        for job in self._latest.values():
+            counts[job.status.value] += 1
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_pending": self.max_pending,
+            "workers": self.workers,
+            **counts,
+        }
+
+    async def shutdown(self) -> None:
+        """Cancels pending and running jobs and waits for the running ones to stop,
+        so none of them writes to a store after shutdown."""
+        running = [
+            job._task
+            for job in self._latest.values()
+            if job._task is not None and not job.finished
+        ]
+        for job in list(self._latest.values()):
+            self._cancel_job(job)
+        await asyncio.gather(*running, return_exceptions=True)
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._queue = None
+
+    def _ensure_started(self) -> "asyncio.Queue[ArtifactJob]":
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._worker_tasks = [
+                asyncio.create_task(self._worker(self._queue))
+                for _ in range(self.workers)
+            ]
+        return self._queue
+
+    async def _worker(self, queue: "asyncio.Queue[ArtifactJob]") -> None:
+        while True:
+            job = await queue.get()
+            try:
+                await self._run(job)
+            finally:
+                queue.task_done()
+
+    async def _run(self, job: ArtifactJob) -> None:
+        if job.status is not JobStatus.PENDING:
+            return
+        job._task = asyncio.create_task(job.work())
+        job._set_status(JobStatus.RUNNING)
+        try:
+            job.result = await job._task
+        except asyncio.CancelledError:
+            job._set_status(JobStatus.CANCELLED)
+            task = asyncio.current_task()
+            if task is not None and task.cancelling():
+                raise
+            return
+        except Exception as exc:
+            logger.exception(
+                "Artifact job %s for goal %s failed", job.name, job.goal_id
+            )
+            job.error = str(exc) or exc.__class__.__name__
+            job._set_status(JobStatus.FAILED)
+            return
+        if job.result is None:
+            job.error = NO_RESULT_ERROR
+        job._set_status(JobStatus.DONE)
+
+    def _cancel_job(self, job: ArtifactJob) -> None:
+        if job.finished:
+            return
+        if job._task is not None:
+            job._task.cancel()
+        else:
+            job._set_status(JobStatus.CANCELLED)
@@ -1,10 +1,19 @@
 import argparse
+from contextlib import nullcontext
 from pathlib import Path
 
 from PIL import Image
 
+from profiling import PROFILE_DIR, profile_session
 from shared import OutputSchema
-from workflow import WorkflowArtifacts, generate_plan_from_image
+from workflow import (
+    DEFAULT_PLAN_MODE,
+    PLAN_ARTIFACT_PATHS,
+    PLAN_MODES,
+    WorkflowArtifacts,
+    WorkflowOptions,
+    generate_plan_from_image,
+)
 
 
 def main() -> None:
@@ -14,15 +23,31 @@ def main() -> None:
     parser.add_argument(
         "image_path", type=Path, help="Path to the source scene image to analyze."
     )
+    parser.add_argument(
+        "--plan-mode",
+        choices=PLAN_MODES,
+        default=DEFAULT_PLAN_MODE,
+        help="'fast' plans in a single model call without object crops.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help=f"Write a CPU profile and allocation snapshot to {PROFILE_DIR}/.",
+    )
     args = parser.parse_args()
 
-    json = plan(args.image_path)
+    with profile_session("plan") if args.profile else nullcontext() as profile:
+        json = plan(args.image_path, args.plan_mode)
     print(json.model_dump_json(indent=2))
+    if profile is not None:
+        print(f"Saved profile {profile} to {PROFILE_DIR}/")
 
 
-def plan(image_path: Path) -> OutputSchema:
+def plan(image_path: Path, plan_mode: str = DEFAULT_PLAN_MODE) -> OutputSchema:
     image = _load_image(image_path)
-    artifacts = generate_plan_from_image(image)
+    artifacts = generate_plan_from_image(
+        image, WorkflowOptions(save_to=PLAN_ARTIFACT_PATHS, plan_mode=plan_mode)
+    )
     _log_plan_artifacts(artifacts)
     return artifacts.output
 
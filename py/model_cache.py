@@ -0,0 +1,285 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from backends import (
+    ModelBackend,
+    ModelRequest,
+    ModelResponse,
+    interaction_from_response,
+    request_fingerprint,
+    response_from_interaction,
+)
+
+
+@dataclass
+class CacheStats:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    inflight_joins: int = 0
+    stores: int = 0
+    memory_evictions: int = 0
+    disk_evictions: int = 0
+    memory_entries: int = 0
+    disk_entries: int = 0
+    disk_bytes: int = 0
+
+
+class MemoryTier:
+    def __init__(self, max_entries: int, ttl_s: Optional[float]) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.evictions = 0
+        self._entries: "OrderedDict[str, Tuple[float, ModelResponse]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, response = entry
+            if _expired(stored_at, self.ttl_s):
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key: str, response: ModelResponse) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+class DiskTier:
+    """One JSON file per key; the oldest files go first past the size or age limit."""
+
+    def __init__(self, directory: Path, max_bytes: int, ttl_s: Optional[float]) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.evictions = 0
+        self._index: Dict[str, Tuple[float, int]] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for path in self.directory.glob("*.json"):
+            stat = path.stat()
+            self._index[path.stem] = (stat.st_mtime, stat.st_size)
+            self._total_bytes += stat.st_size
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        path = self._path(key)
+        try:
+            stored_at = path.stat().st_mtime
+            if _expired(stored_at, self.ttl_s):
+                self._remove(key)
+                return None
+            interaction = json.loads(path.read_text())
+        except (OSError, ValueError):
+            return None
+        return response_from_interaction(interaction)
+
+    def put(self, key: str, request: ModelRequest, response: ModelResponse) -> None:
+        data = json.dumps(
+            interaction_from_response(request.stage, response, model=request.model)
+        ).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            previous = self._index.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[1]
+            self._index[key] = (time.time(), len(data))
+            self._total_bytes += len(data)
+        self._evict()
+
+    def _evict(self) -> None:
+        with self._lock:
+            now = time.time()
+            ordered = sorted(self._index.items(), key=lambda item: item[1][0])
+            for key, (stored_at, _) in ordered:
+                within_ttl = self.ttl_s is None or now - stored_at <= self.ttl_s
+                if self._total_bytes <= self.max_bytes and within_ttl:
+                    break
+                self._remove_locked(key)
+                self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str) -> None:
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[1]
+        try:
+            self._path(key).unlink()
+        except FileNotFoundError:
+            pass
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+
+class ResponseCache:
+    def __init__(self, memory: MemoryTier, disk: Optional[DiskTier] = None) -> None:
+        self.memory = memory
+        self.disk = disk
+        self._stats = CacheStats()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[ModelResponse]:
+        response = self.memory.get(key)
+        if response is not None:
+            self._count("memory_hits")
+            return response
+        if self.disk is not None:
+            response = self.disk.get(key)
+            if response is not None:
+                self.memory.put(key, response)
+                self._count("disk_hits")
+                return response
+        self._count("misses")
+        return None
+
+    def put(self, key: str, request: ModelRequest, response: ModelResponse) -> None:
+        if response.text is None and not response.images:
+            return
+        self.memory.put(key, response)
+        if self.disk is not None:
+            self.disk.put(key, request, response)
+        self._count("stores")
+
+    def record_inflight_join(self) -> None:
+        self._count("inflight_joins")
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            stats = CacheStats(**asdict(self._stats))
+        stats.memory_evictions = self.memory.evictions
+        stats.memory_entries = len(self.memory)
+        if self.disk is not None:
+            stats.disk_evictions = self.disk.evictions
+            stats.disk_entries = len(self.disk)
+            stats.disk_bytes = self.disk.total_bytes
+        return stats
+
+    def _count(self, field_name: str) -> None:
+        with self._lock:
+            setattr(self._stats, field_name, getattr(self._stats, field_name) + 1)
+
+
+class CachingBackend(ModelBackend):
+    """Serves repeated requests from a content-addressed response cache.
+
+    Keys come from request_fingerprint, which covers the model, prompt text,
+    image bytes, response schema and generation config. Concurrent async callers
+    with the same key share a single in-flight model call.
+    """
+
+    def __init__(self, inner: ModelBackend, cache: ResponseCache) -> None:
+        self.inner = inner
+        self.cache = cache
+        self._inflight: Dict[str, "asyncio.Future[ModelResponse]"] = {}
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        key = request_fingerprint(request)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.inner.generate(request)
+        self.cache.put(key, request, response)
+        return response
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        key = request_fingerprint(request)
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.cache.record_inflight_join()
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled() or _current_task_cancelling():
+                    raise
+                return await self.agenerate(request)
+
+        future: "asyncio.Future[ModelResponse]" = (
+            asyncio.get_running_loop().create_future()
+        )
+        self._inflight[key] = future
+        try:
+            response = await asyncio.to_thread(self.cache.get, key)
+            if response is None:
+                response = await self.inner.agenerate(request)
+                await asyncio.to_thread(self.cache.put, key, request, response)
+            future.set_result(response)
+            return response
+        except Exception as exc:
+            future.set_exception(exc)
+            future.exception()
+            raise
+        finally:
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(key, None)
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    max_entries = int(os.environ.get("REALITYGUIDE_CACHE_ENTRIES", "256"))
+    cache_dir = os.environ.get("REALITYGUIDE_CACHE_DIR")
+    if max_entries <= 0 and not cache_dir:
+        return None
+
+    ttl_s = _optional_float(os.environ.get("REALITYGUIDE_CACHE_TTL_S", "3600"))
+    memory = MemoryTier(max_entries=max(max_entries, 0), ttl_s=ttl_s)
+    disk = None
+    if cache_dir:
+        max_mb = float(os.environ.get("REALITYGUIDE_CACHE_DISK_MAX_MB", "512"))
+        disk_ttl_s = _optional_float(
+            os.environ.get("REALITYGUIDE_CACHE_DISK_TTL_S", str(ttl_s or ""))
+        )
+        disk = DiskTier(
+            Path(cache_dir), max_bytes=int(max_mb * 1024 * 1024), ttl_s=disk_ttl_s
+        )
+    return ResponseCache(memory, disk)
+
+
+def _optional_float(value: Optional[str]) -> Optional[float]:
+    if value is None or not value.strip():
+        return None
+    parsed = float(value)
+    return parsed if parsed > 0 else None
+
+
+def _current_task_cancelling() -> bool:
+    task = asyncio.current_task()
+    return task is not None and task.cancelling() > 0
+
+
+def _expired(stored_at: float, ttl_s: Optional[float]) -> bool:
+    return ttl_s is not None and time.time() - stored_at > ttl_s
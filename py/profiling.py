@@ -0,0 +1,297 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import re
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    ContextManager,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from uuid import uuid4
+
+PROFILE_DIR = Path(os.environ.get("REALITYGUIDE_PROFILE_DIR", "profiles"))
+PROFILE_ALWAYS = os.environ.get("REALITYGUIDE_PROFILE", "0") == "1"
+PROFILE_TOKEN = os.environ.get("REALITYGUIDE_PROFILE_TOKEN") or None
+MAX_PROFILES = int(os.environ.get("REALITYGUIDE_PROFILE_MAX", "20"))
+PROFILE_HEADER = "x-realityguide-profile"
+PROFILE_KINDS = {"prof": ".prof", "allocs": ".allocs", "txt": ".txt"}
+PROFILE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_.-]{1,128}$")
+TRACEMALLOC_FRAMES = 16
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+
+
+@dataclass
+class ProfileInfo:
+    name: str
+    kinds: List[str]
+    bytes: int
+    created_at: float
+
+
+@dataclass
+class ProfileRequest:
+    """Marks a request as profiled; collects the names of the profiles it wrote."""
+
+    names: List[str] = field(default_factory=list)
+
+
+class RequestGate:
+    """Lets requests run side by side, except for exclusive ones, which run alone.
+
+    cProfile sees every thread of the process, so a profiled request only gets a
+    clean profile when no other request runs meanwhile. An exclusive request
+    waits for the running requests to finish, and requests arriving after it
+    wait until it is done.
+    """
+
+    def __init__(self) -> None:
+        self._shared = 0
+        self._exclusive = False
+        self._waiting: Deque[Tuple[bool, "asyncio.Future[None]"]] = deque()
+
+    @asynccontextmanager
+    async def hold(self, exclusive: bool) -> AsyncIterator[None]:
+        await self._acquire(exclusive)
+        try:
+            yield
+        finally:
+            self._release(exclusive)
+
+    async def _acquire(self, exclusive: bool) -> None:
+        if not self._waiting and self._free(exclusive):
+            self._take(exclusive)
+            return
+        waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+        self._waiting.append((exclusive, waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The gate was handed over just as the caller went away.
+                self._release(exclusive)
+            else:
+                self._waiting.remove((exclusive, waiter))
+                self._wake()
+            raise
+
+    def _free(self, exclusive: bool) -> bool:
+        return not self._exclusive and (not exclusive or self._shared == 0)
+
+    def _take(self, exclusive: bool) -> None:
+        if exclusive:
+            self._exclusive = True
+        else:
+            self._shared += 1
+
+    def _release(self, exclusive: bool) -> None:
+        if exclusive:
+            self._exclusive = False
+        else:
+            self._shared -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiting:
+            exclusive, waiter = self._waiting[0]
+            if not waiter.done() and not self._free(exclusive):
+                return
+            self._waiting.popleft()
+            if not waiter.done():
+                self._take(exclusive)
+                waiter.set_result(None)
+
+
+_session_lock = threading.Lock()
+_request_gate = RequestGate()
+_requested: ContextVar[Optional[ProfileRequest]] = ContextVar(
+    "realityguide_profile_request", default=None
+)
+
+
+def profiling_enabled() -> bool:
+    return PROFILE_ALWAYS or PROFILE_TOKEN is not None
+
+
+def token_allowed(token: Optional[str]) -> bool:
+    if PROFILE_TOKEN is None:
+        return False
+    return token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def access_allowed(token: Optional[str]) -> bool:
+    """Whether a caller may list and download profiles, which needs the token
+    even when REALITYGUIDE_PROFILE=1 profiles every request."""
+    return profiling_enabled() and token_allowed(token)
+
+
+@contextmanager
+def profile_session(
+    label: str, directory: Path = PROFILE_DIR, max_profiles: int = MAX_PROFILES
+) -> Iterator[Optional[str]]:
+    """Profiles the block's CPU time and allocations into directory/<name>.*.
+
+    Yields the profile name, or None when another session is already running;
+    only one profiler can be active per process.
+    """
+    if not _session_lock.acquire(blocking=False):
+        yield None
+        return
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid4().hex[:8]}"
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield name
+    finally:
+        profiler.disable()
+        try:
+            snapshot = tracemalloc.take_snapshot()
+            if started_tracing:
+                tracemalloc.stop()
+            _write_profile(Path(directory), name, profiler, snapshot)
+            prune_profiles(Path(directory), max_profiles)
+        finally:
+            _session_lock.release()
+
+
+def maybe_profile(label: str) -> ContextManager[Optional[str]]:
+    """Profiles the block when the current request asked for it."""
+    request = _requested.get()
+    if request is None:
+        return nullcontext()
+    return _recording_session(label, request)
+
+
+@contextmanager
+def _recording_session(label: str, request: ProfileRequest) -> Iterator[Optional[str]]:
+    with profile_session(label) as name:
+        if name is not None:
+            request.names.append(name)
+        yield name
+
+
+def list_profiles(directory: Path = PROFILE_DIR) -> List[ProfileInfo]:
+    profiles: Dict[str, ProfileInfo] = {}
+    for kind, suffix in PROFILE_KINDS.items():
+        for path in Path(directory).glob(f"*{suffix}"):
+            stat = path.stat()
+            info = profiles.setdefault(
+                path.stem, ProfileInfo(path.stem, [], 0, stat.st_mtime)
+            )
+            info.kinds.append(kind)
+            info.bytes += stat.st_size
+            info.created_at = min(info.created_at, stat.st_mtime)
+    return sorted(profiles.values(), key=lambda info: info.created_at, reverse=True)
+
+
+def profile_path(name: str, kind: str, directory: Path = PROFILE_DIR) -> Optional[Path]:
+    if kind not in PROFILE_KINDS or not PROFILE_NAME_PATTERN.fullmatch(name):
+        return None
+    path = Path(directory) / f"{name}{PROFILE_KINDS[kind]}"
+    return path if path.is_file() else None
+
+
+def prune_profiles(directory: Path, max_profiles: int) -> None:
+    for info in list_profiles(directory)[max(max_profiles, 0) :]:
+        for kind in info.kinds:
+            (Path(directory) / f"{info.name}{PROFILE_KINDS[kind]}").unlink(
+                missing_ok=True
+            )
+
+
+def _write_profile(
+    directory: Path,
+    name: str,
+    profiler: cProfile.Profile,
+    snapshot: tracemalloc.Snapshot,
+) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    profiler.dump_stats(directory / f"{name}.prof")
+    snapshot = snapshot.filter_traces(
+        (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        )
+    )
+    snapshot.dump(str(directory / f"{name}.allocs"))
+
+    summary = io.StringIO()
+    summary.write(f"CPU profile for {name}, by cumulative time\n\n")
+    stats = pstats.Stats(profiler, stream=summary)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(TOP_FUNCTIONS)
+    summary.write(f"\nLive allocations at the end of {name}, by line\n\n")
+    for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+        summary.write(f"{statistic}\n")
+    (directory / f"{name}.txt").write_text(summary.getvalue())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that marks allowed requests for profiling.
+
+    With REALITYGUIDE_PROFILE=1 every request is marked; otherwise a request
+    must send the X-RealityGuide-Profile header with REALITYGUIDE_PROFILE_TOKEN.
+    A marked request runs alone, see RequestGate. The response names the
+    profiles written in the same header.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not profiling_enabled():
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        header = headers.get(PROFILE_HEADER.encode("latin-1"))
+        profiled = PROFILE_ALWAYS or token_allowed(
+            header.decode("latin-1") if header is not None else None
+        )
+        async with _request_gate.hold(exclusive=profiled):
+            if profiled:
+                await self._profiled(scope, receive, send)
+            else:
+                await self.app(scope, receive, send)
+
+    async def _profiled(self, scope: Any, receive: Any, send: Any) -> None:
+        request = ProfileRequest()
+        token = _requested.set(request)
+
+        async def send_with_profile(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start" and request.names:
+                message = {
+                    **message,
+                    "headers": [
+                        *message.get("headers", []),
+                        (
+                            PROFILE_HEADER.encode("latin-1"),
+                            ",".join(request.names).encode("latin-1"),
+                        ),
+                    ],
+                }
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            _requested.reset(token)
@@ -0,0 +1,307 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, Optional, Set
+
+from backends import (
+    ANALYSIS_STAGE,
+    BANANA_STAGE,
+    COMPACT_COMPLETION_STAGE,
+    COMPLETION_STAGE,
+    PLAN_STAGE,
+    STEPS_STAGE,
+    ModelBackend,
+    ModelRequest,
+    ModelResponse,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DEADLINE_S = float(os.environ.get("REALITYGUIDE_REQUEST_DEADLINE_S", "90"))
+DEFAULT_MAX_ATTEMPTS = int(os.environ.get("REALITYGUIDE_MODEL_ATTEMPTS", "3"))
+BACKOFF_BASE_S = 0.5
+BACKOFF_CAP_S = 8.0
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# Share of the request deadline one attempt of each stage may use.
+STAGE_BUDGETS = {
+    ANALYSIS_STAGE: 0.35,
+    STEPS_STAGE: 0.35,
+    PLAN_STAGE: 0.6,
+    COMPLETION_STAGE: 0.5,
+    COMPACT_COMPLETION_STAGE: 0.5,
+    BANANA_STAGE: 0.4,
+}
+HEDGE_MIN_SAMPLES = 20
+LATENCY_SAMPLES = 200
+
+
+@dataclass(frozen=True)
+class Deadline:
+    expires_at: float
+    budget_s: float
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+class DeadlineExceededError(TimeoutError):
+    pass
+
+
+_deadline: ContextVar[Optional[Deadline]] = ContextVar(
+    "realityguide_deadline", default=None
+)
+
+
+@contextmanager
+def deadline_scope(budget_s: float = DEFAULT_DEADLINE_S) -> Iterator[Deadline]:
+    """Sets the deadline for the model calls made inside the block.
+
+    A nested scope replaces the outer deadline, so background work started by a
+    request can run on its own budget.
+    """
+    deadline = Deadline(time.monotonic() + budget_s, budget_s)
+    token = _deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _deadline.reset(token)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _deadline.get()
+
+
+class DeadlineMiddleware:
+    """ASGI middleware that gives every HTTP request a deadline scope."""
+
+    def __init__(self, app: Any, budget_s: float = DEFAULT_DEADLINE_S) -> None:
+        self.app = app
+        self.budget_s = budget_s
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        with deadline_scope(self.budget_s):
+            await self.app(scope, receive, send)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    # Only an SDK that has been imported can have raised, so look the error
+    # types up instead of importing the SDK and httpx with this module.
+    errors = sys.modules.get("google.genai.errors")
+    if errors is not None and isinstance(exc, errors.APIError):
+        return getattr(exc, "code", None) in RETRYABLE_STATUS_CODES
+    httpx = sys.modules.get("httpx")
+    if httpx is not None and isinstance(exc, httpx.TransportError):
+        return True
+    return isinstance(exc, ConnectionError)
+
+
+class ResilientBackend(ModelBackend):
+    """Bounds each model call by a stage budget and retries transient failures.
+
+    Every attempt may use its stage's share of the request deadline, but never
+    more than what is left of it. Retryable errors, timed-out attempts and empty
+    responses are retried with full-jitter exponential backoff while the deadline
+    allows. With hedging enabled, a stage whose call is slower than the given
+    percentile of its recent latencies gets a duplicate call, and whichever
+    answers first wins.
+    """
+
+    def __init__(
+        self,
+        inner: ModelBackend,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        stage_budgets: Optional[Dict[str, float]] = None,
+        hedge_percentile: float = 0.0,
+        hedge_stages: Optional[Set[str]] = None,
+    ) -> None:
+        self.inner = inner
+        self.max_attempts = max(max_attempts, 1)
+        self.stage_budgets = {**STAGE_BUDGETS, **(stage_budgets or {})}
+        self.hedge_percentile = hedge_percentile
+        self.hedge_stages = hedge_stages or set()
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._counters: Dict[str, int] = {
+            "attempts": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "deadline_exceeded": 0,
+        }
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        for attempt in range(self.max_attempts):
+            self._counters["attempts"] += 1
+            try:
+                response = self.inner.generate(request)
+            except Exception as exc:
+                if not is_retryable(exc) or attempt + 1 == self.max_attempts:
+                    raise
+                self._log_retry(request, attempt, exc)
+            else:
+                if not _is_empty(response) or attempt + 1 == self.max_attempts:
+                    return response
+                self._log_retry(request, attempt, None)
+            time.sleep(_backoff_s(attempt))
+        raise AssertionError("unreachable")
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        last_error: Optional[BaseException] = None
+        empty: Optional[ModelResponse] = None
+        for attempt in range(self.max_attempts):
+            timeout_s = self._attempt_timeout(request.stage)
+            self._counters["attempts"] += 1
+            try:
+                response = await asyncio.wait_for(self._hedged(request), timeout_s)
+            except asyncio.TimeoutError:
+                self._counters["timeouts"] += 1
+                last_error = DeadlineExceededError(
+                    f"Stage '{request.stage}' did not answer within {timeout_s:.1f}s."
+                )
+            except Exception as exc:
+                if not is_retryable(exc):
+                    raise
+                last_error = exc
+            else:
+                if not _is_empty(response) or attempt + 1 == self.max_attempts:
+                    return response
+                last_error = None
+                empty = response
+            if attempt + 1 == self.max_attempts:
+                break
+            delay_s = _backoff_s(attempt)
+            deadline = current_deadline()
+            if deadline is not None and deadline.remaining() <= delay_s:
+                break
+            self._log_retry(request, attempt, last_error)
+            await asyncio.sleep(delay_s)
+        if last_error is None and empty is not None:
+            return empty
+        if isinstance(last_error, DeadlineExceededError):
+            self._counters["deadline_exceeded"] += 1
+        assert last_error is not None
+        raise last_error
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            **self._counters,
+            "hedge_percentile": self.hedge_percentile,
+            "hedge_delays_s": {
+                stage: self._hedge_delay(stage) for stage in sorted(self.hedge_stages)
+            },
+        }
+
+    def _attempt_timeout(self, stage: str) -> float:
+        deadline = current_deadline()
+        budget_s = deadline.budget_s if deadline is not None else DEFAULT_DEADLINE_S
+        timeout_s = budget_s * self.stage_budgets.get(stage, 1.0)
+        if deadline is not None:
+            remaining_s = deadline.remaining()
+            if remaining_s <= 0:
+                self._counters["deadline_exceeded"] += 1
+                raise DeadlineExceededError(
+                    f"Request deadline passed before stage '{stage}'."
+                )
+            timeout_s = min(timeout_s, remaining_s)
+        return timeout_s
+
+    async def _hedged(self, request: ModelRequest) -> ModelResponse:
+        delay_s = self._hedge_delay(request.stage)
+        if delay_s is None:
+            return await self._timed(request)
+
+        primary = asyncio.ensure_future(self._timed(request))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay_s)
+            if done:
+                return primary.result()
+            self._counters["hedges"] += 1
+            pending.add(asyncio.ensure_future(self._timed(request)))
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._counters["hedge_wins"] += 1
+                        return task.result()
+                if not pending:
+                    return done.pop().result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _timed(self, request: ModelRequest) -> ModelResponse:
+        started = time.monotonic()
+        response = await self.inner.agenerate(request)
+        samples = self._latencies.setdefault(
+            request.stage, deque(maxlen=LATENCY_SAMPLES)
+        )
+        samples.append(time.monotonic() - started)
+        return response
+
+    def _hedge_delay(self, stage: str) -> Optional[float]:
+        if self.hedge_percentile <= 0 or stage not in self.hedge_stages:
+            return None
+        samples = self._latencies.get(stage)
+        if samples is None or len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100.0))
+        return ordered[index]
+
+    def _log_retry(
+        self, request: ModelRequest, attempt: int, error: Optional[BaseException]
+    ) -> None:
+        self._counters["retries"] += 1
+        logger.warning(
+            "Retrying %s call (attempt %d of %d) after %s",
+            request.stage,
+            attempt + 2,
+            self.max_attempts,
+            error if error is not None else "an empty response",
+        )
+
+
+def _is_empty(response: ModelResponse) -> bool:
+    return response.text is None and not response.images
+
+
+def _backoff_s(attempt: int) -> float:
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * 2**attempt))
+
+
+def resilient_backend_from_env(inner: ModelBackend) -> ModelBackend:
+    stage_budgets = json.loads(os.environ.get("REALITYGUIDE_STAGE_BUDGETS", "{}"))
+    hedge_stages = os.environ.get(
+        "REALITYGUIDE_HEDGE_STAGES",
+        ",".join(
+            (
+                ANALYSIS_STAGE,
+                STEPS_STAGE,
+                PLAN_STAGE,
+                COMPLETION_STAGE,
+                COMPACT_COMPLETION_STAGE,
+            )
+        ),
+    )
+    return ResilientBackend(
+        inner,
+        stage_budgets=stage_budgets,
+        hedge_percentile=float(os.environ.get("REALITYGUIDE_HEDGE_PERCENTILE", "0")),
+        hedge_stages={stage.strip() for stage in hedge_stages.split(",") if stage},
+    )
@@ -0,0 +1,298 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from backends import (
+    ANALYSIS_STAGE,
+    BANANA_STAGE,
+    COMPACT_COMPLETION_STAGE,
+    COMPLETION_STAGE,
+    PLAN_STAGE,
+    STEPS_STAGE,
+    ModelBackend,
+    ModelRequest,
+    ModelResponse,
+)
+
+INTERACTIVE_PRIORITY = 0
+PLANNING_PRIORITY = 1
+BACKGROUND_PRIORITY = 2
+PRIORITY_NAMES = {
+    INTERACTIVE_PRIORITY: "interactive",
+    PLANNING_PRIORITY: "planning",
+    BACKGROUND_PRIORITY: "background",
+}
+STAGE_PRIORITIES = {
+    COMPLETION_STAGE: INTERACTIVE_PRIORITY,
+    COMPACT_COMPLETION_STAGE: INTERACTIVE_PRIORITY,
+    ANALYSIS_STAGE: PLANNING_PRIORITY,
+    STEPS_STAGE: PLANNING_PRIORITY,
+    PLAN_STAGE: PLANNING_PRIORITY,
+    BANANA_STAGE: BACKGROUND_PRIORITY,
+}
+
+DEFAULT_CONCURRENCY = int(os.environ.get("REALITYGUIDE_MODEL_CONCURRENCY", "8"))
+DEFAULT_RATE_PER_S = float(os.environ.get("REALITYGUIDE_MODEL_RPS", "0"))
+DEFAULT_MAX_QUEUED = int(os.environ.get("REALITYGUIDE_MODEL_QUEUE", "64"))
+# Assumed call duration for Retry-After until a lane has timed a real call.
+INITIAL_SERVICE_TIME_S = 5.0
+
+
+@dataclass(frozen=True)
+class LaneLimits:
+    concurrency: int = DEFAULT_CONCURRENCY
+    rate_per_s: float = DEFAULT_RATE_PER_S
+    burst: int = 0
+    max_queued: int = DEFAULT_MAX_QUEUED
+
+
+@dataclass
+class WaitStats:
+    calls: int = 0
+    total_wait_s: float = 0.0
+    max_wait_s: float = 0.0
+
+    def record(self, wait_s: float) -> None:
+        self.calls += 1
+        self.total_wait_s += wait_s
+        self.max_wait_s = max(self.max_wait_s, wait_s)
+
+
+@dataclass
+class LaneStats:
+    model: str
+    concurrency: int
+    rate_per_s: float
+    max_queued: int
+    active: int = 0
+    queued: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    mean_service_s: float = 0.0
+    waits: Dict[str, WaitStats] = field(default_factory=dict)
+
+
+class SchedulerOverloadedError(Exception):
+    def __init__(self, model: str, retry_after_s: float) -> None:
+        super().__init__(f"Too many queued calls for model {model}.")
+        self.model = model
+        self.retry_after_s = retry_after_s
+
+
+class TokenBucket:
+    """Requests per second with bursts; a non-positive rate means unlimited."""
+
+    def __init__(self, rate_per_s: float, burst: int) -> None:
+        self.rate_per_s = rate_per_s
+        self.capacity = float(max(burst, 1))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Takes one token and returns how long to wait before using it."""
+        if self.rate_per_s <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate_per_s
+            )
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_s
+
+
+class ModelLane:
+    """Admission control for the calls to one model.
+
+    Calls run under a concurrency limit and a token-bucket rate limit. Calls
+    over the limit wait in a priority queue, which is bounded so bursts are
+    shed early instead of timing out later.
+    """
+
+    def __init__(self, model: str, limits: LaneLimits) -> None:
+        self.model = model
+        self.limits = limits
+        self.bucket = TokenBucket(
+            limits.rate_per_s, limits.burst or max(limits.concurrency, 1)
+        )
+        self._active = 0
+        self._waiting: List[Tuple[int, int, "asyncio.Future[None]"]] = []
+        self._sequence = itertools.count()
+        self._sync_slots = threading.BoundedSemaphore(max(limits.concurrency, 1))
+        self._stats = LaneStats(
+            model=model,
+            concurrency=limits.concurrency,
+            rate_per_s=limits.rate_per_s,
+            max_queued=limits.max_queued,
+        )
+
+    async def acquire(self, priority: int) -> None:
+        started = time.monotonic()
+        if self._active < self.limits.concurrency and not self._queued():
+            self._active += 1
+        else:
+            if self._queued() >= self.limits.max_queued:
+                self._stats.rejected += 1
+                raise SchedulerOverloadedError(self.model, self.retry_after_s())
+            waiter: "asyncio.Future[None]" = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiting, (priority, next(self._sequence), waiter))
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as the caller went away.
+                    self.release()
+                raise
+        try:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        except BaseException:
+            self.release()
+            raise
+        self._record_wait(priority, time.monotonic() - started)
+
+    def release(self) -> None:
+        while self._waiting:
+            _, _, waiter = heapq.heappop(self._waiting)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+    def acquire_sync(self, priority: int) -> None:
+        started = time.monotonic()
+        self._sync_slots.acquire()
+        delay = self.bucket.reserve()
+        if delay > 0:
+            time.sleep(delay)
+        self._record_wait(priority, time.monotonic() - started)
+
+    def release_sync(self) -> None:
+        self._sync_slots.release()
+
+    def finished(self, duration_s: float, failed: bool) -> None:
+        if failed:
+            self._stats.failed += 1
+        else:
+            self._stats.completed += 1
+        calls = self._stats.completed + self._stats.failed
+        self._stats.mean_service_s += (duration_s - self._stats.mean_service_s) / min(
+            calls, 100
+        )
+
+    def retry_after_s(self) -> float:
+        service_s = self._stats.mean_service_s or INITIAL_SERVICE_TIME_S
+        backlog = self._queued() + 1
+        estimate = service_s * backlog / max(self.limits.concurrency, 1)
+        if self.limits.rate_per_s > 0:
+            estimate = max(estimate, backlog / self.limits.rate_per_s)
+        return float(math.ceil(estimate))
+
+    def stats(self) -> LaneStats:
+        stats = LaneStats(**asdict(self._stats))
+        stats.waits = {
+            name: WaitStats(**asdict(waits))
+            for name, waits in self._stats.waits.items()
+        }
+        stats.active = self._active
+        stats.queued = self._queued()
+        return stats
+
+    def _queued(self) -> int:
+        return sum(1 for _, _, waiter in self._waiting if not waiter.done())
+
+    def _record_wait(self, priority: int, wait_s: float) -> None:
+        name = PRIORITY_NAMES.get(priority, str(priority))
+        self._stats.waits.setdefault(name, WaitStats()).record(wait_s)
+
+
+class ScheduledBackend(ModelBackend):
+    """Admits model calls through a per-model lane before they reach the model.
+
+    Continuation calls go ahead of new-goal planning, which goes ahead of
+    banana images. When a lane's queue is full, calls fail fast with
+    SchedulerOverloadedError instead of piling up on the provider's rate limits.
+    """
+
+    def __init__(
+        self,
+        inner: ModelBackend,
+        limits: Optional[Dict[str, LaneLimits]] = None,
+        default_limits: Optional[LaneLimits] = None,
+    ) -> None:
+        self.inner = inner
+        self.limits = limits or {}
+        self.default_limits = default_limits or LaneLimits()
+        self._lanes: Dict[str, ModelLane] = {}
+        self._lock = threading.Lock()
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        lane = self.lane(request.model)
+        lane.acquire_sync(_priority(request))
+        started = time.monotonic()
+        failed = True
+        try:
+            response = self.inner.generate(request)
+            failed = False
+            return response
+        finally:
+            lane.finished(time.monotonic() - started, failed)
+            lane.release_sync()
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        lane = self.lane(request.model)
+        await lane.acquire(_priority(request))
+        started = time.monotonic()
+        failed = True
+        try:
+            response = await self.inner.agenerate(request)
+            failed = False
+            return response
+        finally:
+            lane.finished(time.monotonic() - started, failed)
+            lane.release()
+
+    def lane(self, model: str) -> ModelLane:
+        lane = self._lanes.get(model)
+        if lane is None:
+            with self._lock:
+                lane = self._lanes.get(model)
+                if lane is None:
+                    limits = self.limits.get(model, self.default_limits)
+                    lane = self._lanes[model] = ModelLane(model, limits)
+        return lane
+
+    def stats(self) -> List[LaneStats]:
+        return [lane.stats() for lane in list(self._lanes.values())]
+
+
+def _priority(request: ModelRequest) -> int:
+    return STAGE_PRIORITIES.get(request.stage, PLANNING_PRIORITY)
+
+
+def scheduled_backend_from_env(inner: ModelBackend) -> ModelBackend:
+    if os.environ.get("REALITYGUIDE_SCHEDULER", "1") != "1":
+        return inner
+    default_limits = LaneLimits(
+        burst=int(os.environ.get("REALITYGUIDE_MODEL_BURST", "0"))
+    )
+    limits = {
+        model: LaneLimits(**{**asdict(default_limits), **overrides})
+        for model, overrides in json.loads(
+            os.environ.get("REALITYGUIDE_MODEL_LIMITS", "{}")
+        ).items()
+    }
+    return ScheduledBackend(inner, limits, default_limits)
@@ -0,0 +1,91 @@
+import json
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Optional, Set, Type
+
+from pydantic import BaseModel, TypeAdapter
+from starlette.background import BackgroundTask
+from starlette.responses import Response
+
+# Event payloads mix plain values with pydantic models; serializing them through
+# one adapter writes the models straight to JSON instead of via model_dump dicts.
+PAYLOAD_ADAPTER: TypeAdapter[Dict[str, Any]] = TypeAdapter(Dict[str, Any])
+
+
+@lru_cache(maxsize=None)
+def json_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """The model's JSON schema, built once per process.
+
+    Callers share the returned dict and must not modify it.
+    """
+    return model.model_json_schema()
+
+
+def dump_payload(payload: Dict[str, Any]) -> bytes:
+    return PAYLOAD_ADAPTER.dump_json(payload)
+
+
+class ModelJSONResponse(Response):
+    """A JSON response serialized directly from a pydantic model.
+
+    Returning a Response makes FastAPI skip its response_model round trip
+    (model_dump, validation, and a second dump through json.dumps), so the model
+    is serialized once. Fields named in raw_strings are left out of that pass and
+    written in their place as JSON strings from the given bytes. The bytes must need no JSON
+    escaping, like base64, so a multi-megabyte image is copied straight into the
+    body without becoming a str first.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: BaseModel,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        raw_strings: Optional[Mapping[str, Optional[bytes]]] = None,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        self.raw_strings = dict(raw_strings or {})
+        super().__init__(content, status_code, headers, background=background)
+
+    def render(self, content: Any) -> bytes:
+        if not self.raw_strings:
+            return content.__pydantic_serializer__.to_json(content)
+        # Serialize the fields between raw strings in runs, so the body keeps
+        # the model's field order like FastAPI's own encoding would.
+        fields = type(content).model_fields
+        names = [*fields, *(name for name in self.raw_strings if name not in fields)]
+        members: List[List[bytes]] = []
+        run: Set[str] = set()
+        for name in names:
+            if name not in self.raw_strings:
+                run.add(name)
+                continue
+            members.append(_field_members(content, run))
+            members.append(_raw_member(name, self.raw_strings[name]))
+            run = set()
+        members.append(_field_members(content, run))
+
+        parts: List[bytes] = [b"{"]
+        for member in members:
+            if not member:
+                continue
+            if len(parts) > 1:
+                parts.append(b",")
+            parts.extend(member)
+        parts.append(b"}")
+        return b"".join(parts)
+
+
+def _field_members(content: BaseModel, names: Set[str]) -> List[bytes]:
+    if not names:
+        return []
+    body = content.__pydantic_serializer__.to_json(content, include=names)
+    return [body[1:-1]] if body != b"{}" else []
+
+
+def _raw_member(name: str, value: Optional[bytes]) -> List[bytes]:
+    key = json.dumps(name).encode("utf-8")
+    if value is None:
+        return [key, b":null"]
+    return [key, b':"', value, b'"']
@@ -1,32 +1,133 @@
 import base64
 import binascii
+import asyncio
+import dataclasses
+import logging
+import os
 import re
-from io import BytesIO
+import time
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Optional
+from typing import Any, AsyncIterator, Callable, Dict, Optional, Tuple, Union
 from uuid import uuid4
 
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 from PIL import Image, UnidentifiedImageError
+from starlette.datastructures import UploadFile
 
-from shared import OutputSchema, output_with_pixel_boxes
+from artifact_store import artifact_store_from_env
+from backends import (
+    ANALYSIS_STAGE,
+    BANANA_STAGE,
+    COMPLETION_STAGE,
+    GeneratedImage,
+    find_backend,
+    warm_up_backend,
+)
+from coalesce import LatestFrameCoalescer
+from delta import PlanDelta, plan_delta
+from frame_dedupe import FrameDedupeCache, perceptual_hash
+from goal_store import (
+    GoalNotFoundError,
+    GoalRecord,
+    RevisionConflictError,
+    goal_store_from_env,
+)
+from input_prep import decode_image, source_size
+from jobs import ArtifactJob, ArtifactJobQueue, JobStatus, QueueFullError
+from model_cache import CachingBackend
+from profiling import (
+    PROFILE_HEADER,
+    ProfilingMiddleware,
+    access_allowed,
+    list_profiles,
+    maybe_profile,
+    profile_path,
+    profiling_enabled,
+)
+from resilience import (
+    DeadlineExceededError,
+    DeadlineMiddleware,
+    ResilientBackend,
+    deadline_scope,
+)
+from scheduler import ScheduledBackend, SchedulerOverloadedError
+from serialization import ModelJSONResponse, dump_payload
+from shared import (
+    AnalysisSchema,
+    ObjectSet,
+    OutputSchema,
+    banana_image_async,
+    encode_png_image,
+    objects_with_pixel_boxes,
+    output_with_pixel_boxes,
+    run_cpu_bound,
+)
+from tracing import (
+    METRICS_CONTENT_TYPE,
+    TracingMiddleware,
+    render_metrics,
+    stage_timer,
+    traced,
+)
 from workflow import (
+    DEFAULT_PLAN_MODE,
+    DONE_EVENT,
+    HIGHLIGHT_EVENT,
+    PLAN_MODES,
     WorkflowArtifacts,
+    WorkflowEvent,
+    WorkflowOptions,
     actionable_steps,
-    generate_plan_from_image,
-    refresh_plan_from_image,
+    first_actionable_step,
+    generate_plan_from_image_async,
+    refresh_plan_from_image_async,
+    stream_plan_from_image,
+    stream_refresh_from_image,
+    warm_up_configs,
 )
 
 
-app = FastAPI(title="RealityGuide API")
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    warm_up_task = asyncio.create_task(_warm_up())
+    yield
+    warm_up_task.cancel()
+    await update_coalescer.shutdown()
+    await artifact_jobs.shutdown()
+
+
+app = FastAPI(title="RealityGuide API", lifespan=lifespan)
+app.add_middleware(DeadlineMiddleware)
+app.add_middleware(TracingMiddleware)
+app.add_middleware(ProfilingMiddleware)
+logger = logging.getLogger(__name__)
 
 GOALS_DIR = Path("goals")
-DATA_DIR = Path("data")
-LATEST_TMP_IMAGE_PATH = DATA_DIR / "latest_root_request.png"
-LATEST_GOALS_IMAGE_PATH = DATA_DIR / "latest_goals_request.png"
-LATEST_GOALS_UPDATE_IMAGE_PATH = DATA_DIR / "latest_goals_update_request.png"
 GOAL_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+SSE_MEDIA_TYPE = "text/event-stream"
+HIGHLIGHT_ARTIFACT = "highlight"
+BANANA_ARTIFACT = "banana"
+FRAME_ARTIFACT = "frame"
+ARTIFACT_NAMES = (HIGHLIGHT_ARTIFACT, BANANA_ARTIFACT, FRAME_ARTIFACT)
+DEFER_BANANA_DEFAULT = os.environ.get("REALITYGUIDE_DEFER_BANANA", "0") == "1"
+MAX_ARTIFACT_WAIT_S = 30.0
+MAX_GOAL_LIST_LIMIT = 500
+STORE_FRAMES = os.environ.get("REALITYGUIDE_STORE_FRAMES", "0") == "1"
+WARM_UP = os.environ.get("REALITYGUIDE_WARM_UP", "1") == "1"
+WARM_UP_ATTEMPTS = 3
+WARM_UP_RETRY_MAX_S = 60.0
+UPLOAD_FIELD = "image"
+HIGHLIGHT_SIZE_NOTE = (
+    "The highlight is drawn on the decoded frame. JPEG uploads larger than "
+    "REALITYGUIDE_DECODE_MAX_SIDE are decoded at 1/2, 1/4 or 1/8 scale, so the "
+    "image can be smaller than the upload; scale plan boxes, which are in upload "
+    "pixels, by the image width over the upload width to overlay them."
+)
 
 
 class GoalImageRequest(BaseModel):
@@ -35,9 +136,81 @@ class GoalImageRequest(BaseModel):
 
 class GoalResponse(BaseModel):
     id: str
+    revision: int
     plan: OutputSchema
-    highlight_image_base64: Optional[str]
+    highlight_image_base64: Optional[str] = Field(description=HIGHLIGHT_SIZE_NOTE)
     banana_image_base64: Optional[str]
+    reused: bool = False
+    banana_status: Optional[str] = None
+
+
+class GoalArtifactResponse(BaseModel):
+    id: str
+    revision: int
+    plan: OutputSchema
+    highlight_image_url: Optional[str] = Field(description=HIGHLIGHT_SIZE_NOTE)
+    banana_image_url: Optional[str]
+    reused: bool = False
+    banana_status: Optional[str] = None
+
+
+class GoalDeltaResponse(BaseModel):
+    id: str
+    revision: int
+    base_revision: int
+    delta: PlanDelta
+    images: Dict[str, Optional[str]]
+    reused: bool = False
+    banana_status: Optional[str] = None
+
+
+@dataclass
+class GoalResult:
+    """A finished goal request, rendered as base64 JSON or as artifact URLs."""
+
+    goal_id: str
+    plan: OutputSchema
+    highlight: Optional[GeneratedImage]
+    banana: Optional[GeneratedImage]
+    revision: int = 0
+    image_size: Tuple[int, int] = (0, 0)
+    reused: bool = False
+    banana_status: Optional[str] = None
+
+
+@dataclass
+class WarmUpState:
+    ready: bool = not WARM_UP
+    duration_s: Optional[float] = None
+    error: Optional[str] = None
+    degraded: bool = False
+    attempts: int = 0
+
+
+frame_dedupe: FrameDedupeCache[GoalResult] = FrameDedupeCache()
+artifact_jobs = ArtifactJobQueue()
+artifact_store = artifact_store_from_env()
+goal_store = goal_store_from_env(legacy_dir=GOALS_DIR)
+update_coalescer: LatestFrameCoalescer[GoalResult] = LatestFrameCoalescer()
+warm_up_state = WarmUpState()
+
+
+@app.exception_handler(SchedulerOverloadedError)
+async def scheduler_overloaded(
+    request: Request, exc: SchedulerOverloadedError
+) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(int(exc.retry_after_s))},
+    )
+
+
+@app.exception_handler(DeadlineExceededError)
+async def deadline_exceeded(
+    request: Request, exc: DeadlineExceededError
+) -> JSONResponse:
+    return JSONResponse(status_code=504, content={"detail": str(exc)})
 
 
 @app.get("/")
@@ -45,55 +218,656 @@ def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def readiness() -> JSONResponse:
+    """Ready once start-up warm-up has built the model client and connected, or
+    has failed often enough to serve requests degraded while it keeps trying."""
+    return JSONResponse(
+        asdict(warm_up_state), status_code=200 if warm_up_state.ready else 503
+    )
+
+
+@app.get("/metrics")
+def metrics() -> Response:
+    return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/profiles")
+def get_profiles(request: Request) -> dict[str, object]:
+    _check_profile_access(request)
+    return {"profiles": [asdict(info) for info in list_profiles()]}
+
+
+@app.get("/profiles/{name}/{kind}")
+def get_profile(name: str, kind: str, request: Request) -> FileResponse:
+    _check_profile_access(request)
+    path = profile_path(name, kind)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(path, filename=path.name)
+
+
+@app.get("/stats/jobs")
+def job_stats() -> dict[str, int]:
+    return artifact_jobs.stats()
+
+
+@app.get("/stats/coalescing")
+def coalescing_stats() -> dict[str, int]:
+    return update_coalescer.stats()
+
+
+@app.get("/stats/cache")
+def cache_stats() -> dict[str, object]:
+    backend = find_backend(CachingBackend)
+    if backend is None:
+        return {"enabled": False}
+    return {"enabled": True, **asdict(backend.cache.stats())}
+
+
+@app.get("/stats/scheduler")
+def scheduler_stats() -> dict[str, object]:
+    backend = find_backend(ScheduledBackend)
+    if backend is None:
+        return {"enabled": False}
+    return {"enabled": True, "lanes": [asdict(lane) for lane in backend.stats()]}
+
+
+@app.get("/stats/resilience")
+def resilience_stats() -> dict[str, object]:
+    backend = find_backend(ResilientBackend)
+    if backend is None:
+        return {"enabled": False}
+    return {"enabled": True, **backend.stats()}
+
+
+@app.get("/stats/artifacts")
+async def artifact_stats() -> dict[str, object]:
+    return asdict(await run_cpu_bound(artifact_store.stats))
+
+
+@app.get("/goals")
+async def list_goals(
+    limit: int = 50, order: str = "updated", before: Optional[float] = None
+) -> dict[str, object]:
+    if order not in ("created", "updated"):
+        raise HTTPException(
+            status_code=400, detail="order must be 'created' or 'updated'."
+        )
+    limit = min(max(limit, 1), MAX_GOAL_LIST_LIMIT)
+    summaries = await run_cpu_bound(goal_store.list_goals, limit, order, before)
+    next_before = None
+    if len(summaries) == limit:
+        last = summaries[-1]
+        next_before = last.created_at if order == "created" else last.updated_at
+    return {
+        "goals": [asdict(summary) for summary in summaries],
+        "next_before": next_before,
+    }
+
+
+@app.get("/goals/{goal_id}/revisions")
+async def list_goal_revisions(goal_id: str) -> dict[str, object]:
+    goal_id = _validate_goal_id(goal_id)
+    history = await run_cpu_bound(goal_store.history, goal_id)
+    if not history:
+        raise HTTPException(status_code=404, detail="Goal not found.")
+    return {
+        "id": goal_id,
+        "revisions": [
+            {
+                "revision": record.revision,
+                "updated_at": record.updated_at,
+                "plan": record.plan.model_dump(mode="json"),
+            }
+            for record in history
+        ],
+    }
+
+
 # FIXME: copied from create_goal()
 @app.post("/", response_model=GoalResponse)
-def tmp(payload: GoalImageRequest) -> GoalResponse:
-    image = _decode_base64_image(payload.image_base64)
-    _save_latest_image(image, LATEST_TMP_IMAGE_PATH)
-    artifacts = generate_plan_from_image(image)
-    goal_id = uuid4().hex
-    print(goal_id)
-    _persist_goal(goal_id, artifacts.output)
-    return _build_response(goal_id, artifacts, image.size)
+async def tmp(payload: GoalImageRequest) -> Response:
+    image = await run_cpu_bound(_decode_base64_image, payload.image_base64)
+    result = await _create_goal(image, WorkflowOptions())
+    return await run_cpu_bound(_json_response, result)
 
 
 @app.post("/goals", response_model=GoalResponse)
-def create_goal(payload: GoalImageRequest) -> GoalResponse:
-    image = _decode_base64_image(payload.image_base64)
-    _save_latest_image(image, LATEST_GOALS_IMAGE_PATH)
-    artifacts = generate_plan_from_image(image)
+async def create_goal(
+    payload: GoalImageRequest,
+    defer_banana: Optional[bool] = None,
+    plan_mode: Optional[str] = None,
+) -> Response:
+    options = _plan_options(defer_banana, plan_mode)
+    image = await run_cpu_bound(_decode_base64_image, payload.image_base64)
+    result = await _create_goal(image, options)
+    return await run_cpu_bound(_json_response, result)
+
+
+@app.put("/goals/{goal_id}", response_model=Union[GoalResponse, GoalDeltaResponse])
+async def update_goal(
+    goal_id: str,
+    payload: GoalImageRequest,
+    defer_banana: Optional[bool] = None,
+    base_revision: Optional[int] = None,
+) -> Response:
+    record = await _existing_goal(goal_id)
+    _check_base_revision(record, base_revision)
+    image = await run_cpu_bound(_decode_base64_image, payload.image_base64)
+    result = await _coalesced_update(record.goal_id, image, _defer(defer_banana))
+    if base_revision is not None:
+        return await run_cpu_bound(
+            _delta_response, result, base_revision, _base64_renderer
+        )
+    return await run_cpu_bound(_json_response, result)
+
+
+@app.post("/goals/upload", response_model=GoalArtifactResponse)
+async def create_goal_upload(
+    request: Request,
+    defer_banana: Optional[bool] = None,
+    plan_mode: Optional[str] = None,
+) -> Response:
+    options = _plan_options(defer_banana, plan_mode)
+    data = await _read_upload(request)
+    image = await run_cpu_bound(_decode_image_bytes, data)
+    result = await _create_goal(image, options)
+    return _artifact_response(result, request)
+
+
+@app.put(
+    "/goals/{goal_id}/upload",
+    response_model=Union[GoalArtifactResponse, GoalDeltaResponse],
+)
+async def update_goal_upload(
+    goal_id: str,
+    request: Request,
+    defer_banana: Optional[bool] = None,
+    base_revision: Optional[int] = None,
+) -> Response:
+    record = await _existing_goal(goal_id)
+    _check_base_revision(record, base_revision)
+    data = await _read_upload(request)
+    image = await run_cpu_bound(_decode_image_bytes, data)
+    result = await _coalesced_update(record.goal_id, image, _defer(defer_banana))
+    if base_revision is not None:
+        return await run_cpu_bound(
+            _delta_response, result, base_revision, _url_renderer(request)
+        )
+    return _artifact_response(result, request)
+
+
+@app.get("/goals/{goal_id}/artifacts/{name}/status")
+def get_goal_artifact_status(goal_id: str, name: str) -> dict[str, object]:
+    return _latest_artifact_job(goal_id, name).describe()
+
+
+@app.get("/goals/{goal_id}/artifacts/{name}")
+async def get_goal_artifact(
+    goal_id: str,
+    name: str,
+    request: Request,
+    wait: float = 0.0,
+    revision: Optional[int] = None,
+) -> Response:
+    goal_id = _validate_goal_id(goal_id)
+    if name not in ARTIFACT_NAMES:
+        raise HTTPException(status_code=404, detail="Artifact not found.")
+    client_etag = request.headers.get("if-none-match")
+    record: Optional[GoalRecord] = None
+    if revision is None:
+        # Without a revision the client wants the goal's current artifact, which
+        # may still be generating; an older revision's image must not stand in.
+        record = await _existing_goal(goal_id)
+        revision = record.revision
+    stored = await run_cpu_bound(artifact_store.get, goal_id, name, revision)
+    if stored is not None:
+        headers = {"ETag": stored.etag}
+        if client_etag == stored.etag:
+            return Response(status_code=304, headers=headers)
+        return Response(
+            content=stored.image.data,
+            media_type=stored.image.mime_type,
+            headers=headers,
+        )
+    if record is None:
+        record = await _existing_goal(goal_id)
+    if record.revision != revision:
+        raise HTTPException(status_code=404, detail="Artifact not found.")
+
+    job = _latest_artifact_job(goal_id, name, revision)
+    job = await _wait_for_artifact_change(
+        job, client_etag, min(max(wait, 0.0), MAX_ARTIFACT_WAIT_S)
+    )
+
+    headers = {"ETag": job.etag}
+    if client_etag == job.etag:
+        return Response(status_code=304, headers=headers)
+    if job.status is JobStatus.DONE and job.result is not None:
+        return Response(
+            content=job.result.data, media_type=job.result.mime_type, headers=headers
+        )
+    if job.status is JobStatus.DONE:
+        return JSONResponse(job.describe(), status_code=404, headers=headers)
+    if job.status in (JobStatus.PENDING, JobStatus.RUNNING):
+        headers["Retry-After"] = "1"
+        return JSONResponse(job.describe(), status_code=202, headers=headers)
+    if job.status is JobStatus.CANCELLED:
+        return JSONResponse(job.describe(), status_code=410, headers=headers)
+    if job.status is JobStatus.FAILED:
+        return JSONResponse(job.describe(), status_code=502, headers=headers)
+    return JSONResponse(job.describe(), status_code=404, headers=headers)
+
+
+@app.post("/goals/stream")
+async def create_goal_stream(
+    payload: GoalImageRequest, request: Request, plan_mode: Optional[str] = None
+) -> StreamingResponse:
+    options = _plan_options(False, plan_mode)
+    image = await run_cpu_bound(_decode_base64_image, payload.image_base64)
     goal_id = uuid4().hex
-    print(goal_id)
-    _persist_goal(goal_id, artifacts.output)
-    return _build_response(goal_id, artifacts, image.size)
+    logger.info("Streaming new goal %s", goal_id)
+    events = _stream_workflow_events(
+        goal_id, image, stream_plan_from_image(image, options)
+    )
+    return _streaming_response(events, request)
+
+
+@app.put("/goals/{goal_id}/stream")
+async def update_goal_stream(
+    goal_id: str, payload: GoalImageRequest, request: Request
+) -> StreamingResponse:
+    record = await _existing_goal(goal_id)
+    image = await run_cpu_bound(_decode_base64_image, payload.image_base64)
+    frame_hash = await run_cpu_bound(perceptual_hash, image)
+    events = _stream_refresh_events(record.goal_id, image, frame_hash)
+    return _streaming_response(events, request)
+
+
+async def _create_goal(image: Image.Image, options: WorkflowOptions) -> GoalResult:
+    with maybe_profile("generate_plan"):
+        artifacts = await generate_plan_from_image_async(image, options)
+    goal_id = uuid4().hex
+    logger.info("Created goal %s", goal_id)
+    with stage_timer("store_goal"):
+        record = await run_cpu_bound(goal_store.create, goal_id, artifacts.output)
+    result = await _store_result(record, artifacts, image)
+    if not options.generate_banana:
+        result.banana_status = await _schedule_banana(result, artifacts)
+    return result
+
+
+async def _update_goal(
+    record: GoalRecord, image: Image.Image, defer: bool
+) -> GoalResult:
+    goal_id = record.goal_id
+    frame_hash = await run_cpu_bound(perceptual_hash, image)
+    reusable = _reusable_result(record, frame_hash, image.size)
+    if reusable is not None:
+        return dataclasses.replace(reusable, reused=True)
+
+    artifact_jobs.cancel(goal_id, BANANA_ARTIFACT)
+    with maybe_profile("refresh_plan"):
+        artifacts = await refresh_plan_from_image_async(
+            image, record.plan, WorkflowOptions(generate_banana=not defer)
+        )
+    updated = await _commit_update(record, artifacts.output)
+    result = await _store_result(updated, artifacts, image)
+    if defer:
+        result.banana_status = await _schedule_banana(result, artifacts)
+    frame_dedupe.store(goal_id, frame_hash, image.size, result)
+    return result
+
+
+async def _stream_refresh_events(
+    goal_id: str, image: Image.Image, frame_hash: int
+) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+    """Streams a refresh in the goal's coalescing turn.
+
+    Each caller needs its own stage events, so a stream is not merged with other
+    frames, but it waits for a running refresh and later ones wait for it. It
+    then builds on whatever revision the previous refresh committed.
+    """
+    async with update_coalescer.exclusive(goal_id):
+        record = await _existing_goal(goal_id)
+        reusable = _reusable_result(record, frame_hash, image.size)
+        if reusable is not None:
+            events = _replay_result_events(reusable)
+        else:
+            artifact_jobs.cancel(goal_id, BANANA_ARTIFACT)
+            events = _stream_workflow_events(
+                goal_id,
+                image,
+                stream_refresh_from_image(image, record.plan),
+                frame_hash,
+                expected_revision=record.revision,
+            )
+        async for event in events:
+            yield event
+
 
+def _reusable_result(
+    record: GoalRecord, frame_hash: int, image_size: Tuple[int, int]
+) -> Optional[GoalResult]:
+    """The result of a near-identical earlier frame, if the goal has not moved on.
 
-@app.put("/goals/{goal_id}", response_model=GoalResponse)
-def update_goal(goal_id: str, payload: GoalImageRequest) -> GoalResponse:
-    goal_path = _goal_path(goal_id)
-    if not goal_path.exists():
+    A result is only reused while it is still the goal's current revision; once
+    another request or worker has committed a newer plan, it is stale.
+    """
+    reusable = frame_dedupe.lookup(record.goal_id, frame_hash, image_size)
+    if reusable is None:
+        return None
+    if reusable.revision != record.revision:
+        frame_dedupe.forget(record.goal_id)
+        return None
+    return reusable
+
+
+async def _coalesced_update(
+    goal_id: str, image: Image.Image, defer: bool
+) -> GoalResult:
+    """Refreshes a goal, coalescing frames that arrive while a refresh is running.
+
+    Only one refresh per goal runs at a time. Frames that arrive meanwhile replace
+    each other, and their callers all receive the result of the newest one.
+    """
+
+    async def run() -> GoalResult:
+        # Re-read the goal so the run builds on whatever the previous one committed.
+        record = await _existing_goal(goal_id)
+        return await _update_goal(record, image, defer)
+
+    return await update_coalescer.submit(goal_id, run)
+
+
+def _check_profile_access(request: Request) -> None:
+    if not profiling_enabled():
+        raise HTTPException(status_code=404, detail="Profiling is disabled.")
+    if not access_allowed(request.headers.get(PROFILE_HEADER)):
+        raise HTTPException(status_code=403, detail="A profile token is required.")
+
+
+def _defer(defer_banana: Optional[bool]) -> bool:
+    return DEFER_BANANA_DEFAULT if defer_banana is None else defer_banana
+
+
+def _plan_options(
+    defer_banana: Optional[bool], plan_mode: Optional[str]
+) -> WorkflowOptions:
+    if plan_mode is None:
+        plan_mode = DEFAULT_PLAN_MODE
+    elif plan_mode not in PLAN_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"plan_mode must be one of {', '.join(PLAN_MODES)}.",
+        )
+    return WorkflowOptions(
+        generate_banana=not _defer(defer_banana), plan_mode=plan_mode
+    )
+
+
+async def _existing_goal(goal_id: str) -> GoalRecord:
+    goal_id = _validate_goal_id(goal_id)
+    record = await run_cpu_bound(goal_store.get, goal_id)
+    if record is None:
         raise HTTPException(status_code=404, detail="Goal not found.")
+    return record
+
+
+@traced("store_goal")
+async def _commit_update(record: GoalRecord, plan: OutputSchema) -> GoalRecord:
+    try:
+        return await run_cpu_bound(
+            goal_store.update, record.goal_id, plan, record.revision
+        )
+    except RevisionConflictError as exc:
+        raise HTTPException(status_code=409, detail=str(exc)) from exc
+    except GoalNotFoundError as exc:
+        raise HTTPException(status_code=404, detail="Goal not found.") from exc
+
+
+async def _read_upload(request: Request) -> bytes:
+    content_type = request.headers.get("content-type", "").lower()
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        try:
+            upload = form.get(UPLOAD_FIELD)
+            if not isinstance(upload, UploadFile):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Multipart body must include an '{UPLOAD_FIELD}' file.",
+                )
+            return await upload.read()
+        finally:
+            await form.close()
+    if content_type.startswith(("image/", "application/octet-stream")):
+        return await request.body()
+    raise HTTPException(
+        status_code=415,
+        detail="Upload an image as multipart/form-data or a raw image/* body.",
+    )
+
+
+async def _stream_workflow_events(
+    goal_id: str,
+    image: Image.Image,
+    workflow_events: AsyncIterator[WorkflowEvent],
+    frame_hash: Optional[int] = None,
+    expected_revision: Optional[int] = None,
+) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+    width, height = source_size(image)
+    try:
+        async for event in workflow_events:
+            if event.stage == ANALYSIS_STAGE:
+                analysis = AnalysisSchema(
+                    goal=event.payload.goal,
+                    objects=objects_with_pixel_boxes(
+                        event.payload.objects, width, height
+                    ),
+                )
+                yield event.stage, _stream_payload(goal_id, analysis)
+            elif event.stage == COMPLETION_STAGE:
+                plan = _actionable_pixel_plan(event.payload, (width, height))
+                yield event.stage, _stream_payload(goal_id, plan)
+            elif event.stage in (HIGHLIGHT_EVENT, BANANA_STAGE):
+                yield (
+                    event.stage,
+                    _stream_payload(goal_id, _image_payload(event.payload)),
+                )
+            elif event.stage == DONE_EVENT:
+                artifacts: WorkflowArtifacts = event.payload
+                if expected_revision is None:
+                    record = await run_cpu_bound(
+                        goal_store.create, goal_id, artifacts.output
+                    )
+                else:
+                    record = await run_cpu_bound(
+                        goal_store.update, goal_id, artifacts.output, expected_revision
+                    )
+                result = await _store_result(record, artifacts, image)
+                if frame_hash is not None:
+                    frame_dedupe.store(goal_id, frame_hash, image.size, result)
+                yield event.stage, _done_payload(result)
+            else:
+                yield event.stage, _stream_payload(goal_id, event.payload)
+    except RevisionConflictError as exc:
+        yield "error", {"id": goal_id, "data": {"detail": str(exc), "status": 409}}
+    except SchedulerOverloadedError as exc:
+        yield (
+            "error",
+            {
+                "id": goal_id,
+                "data": {
+                    "detail": str(exc),
+                    "status": 429,
+                    "retry_after": int(exc.retry_after_s),
+                },
+            },
+        )
+    except DeadlineExceededError as exc:
+        yield "error", {"id": goal_id, "data": {"detail": str(exc), "status": 504}}
+    except Exception:
+        logger.exception("Streaming workflow failed for goal %s", goal_id)
+        yield "error", {"id": goal_id, "data": {"detail": "Plan generation failed."}}
+
+
+async def _replay_result_events(
+    result: GoalResult,
+) -> AsyncIterator[tuple[str, Dict[str, Any]]]:
+    yield COMPLETION_STAGE, _stream_payload(result.goal_id, result.plan)
+    for stage, artifact in (
+        (HIGHLIGHT_EVENT, result.highlight),
+        (BANANA_STAGE, result.banana),
+    ):
+        yield stage, _stream_payload(result.goal_id, _image_payload(artifact))
+    yield DONE_EVENT, _done_payload(dataclasses.replace(result, reused=True))
+
+
+def _stream_payload(goal_id: str, data: Any) -> Dict[str, Any]:
+    return {"id": goal_id, "data": data}
+
+
+def _image_payload(artifact: Optional[GeneratedImage]) -> Dict[str, Any]:
+    return {"image_base64": _encode_base64(artifact)}
+
+
+def _done_payload(result: GoalResult) -> Dict[str, Any]:
+    return _stream_payload(
+        result.goal_id,
+        {
+            "revision": result.revision,
+            "plan": result.plan,
+            "reused": result.reused,
+        },
+    )
+
+
+def _streaming_response(
+    events: AsyncIterator[tuple[str, Dict[str, Any]]], request: Request
+) -> StreamingResponse:
+    sse = SSE_MEDIA_TYPE in request.headers.get("accept", "")
+
+    async def encode() -> AsyncIterator[bytes]:
+        async for event, payload in events:
+            body = dump_payload({"event": event, **payload})
+            if sse:
+                yield b"event: " + event.encode("utf-8") + b"\ndata: " + body + b"\n\n"
+            else:
+                yield body + b"\n"
+
+    return StreamingResponse(
+        encode(), media_type=SSE_MEDIA_TYPE if sse else NDJSON_MEDIA_TYPE
+    )
+
+
+async def _warm_up() -> None:
+    """Moves first-request costs to start-up: SDK import, generation configs,
+    the model client and its connection pool.
+
+    Failed attempts are retried with growing pauses until one succeeds. After
+    WARM_UP_ATTEMPTS failures the server reports ready but degraded, since
+    requests can still build the client on first use.
+    """
+    if not WARM_UP:
+        return
+    started = time.perf_counter()
+    while True:
+        warm_up_state.attempts += 1
+        attempt = warm_up_state.attempts
+        try:
+            await run_cpu_bound(warm_up_configs)
+            await warm_up_backend()
+            break
+        except Exception as exc:
+            logger.warning("Warm-up attempt %d failed: %s", attempt, exc)
+            warm_up_state.error = f"{type(exc).__name__}: {exc}"
+        if attempt == WARM_UP_ATTEMPTS:
+            warm_up_state.ready = True
+            warm_up_state.degraded = True
+            warm_up_state.duration_s = round(time.perf_counter() - started, 3)
+            logger.error(
+                "Warm-up failed %d times; serving degraded and retrying in the "
+                "background",
+                attempt,
+            )
+        await asyncio.sleep(min(2 ** (attempt - 1), WARM_UP_RETRY_MAX_S))
+    warm_up_state.ready = True
+    warm_up_state.degraded = False
+    warm_up_state.error = None
+    warm_up_state.duration_s = round(time.perf_counter() - started, 3)
+    logger.info("Warm-up finished in %.3fs", warm_up_state.duration_s)
 
-    existing = OutputSchema.model_validate_json(goal_path.read_text())
-    image = _decode_base64_image(payload.image_base64)
-    _save_latest_image(image, LATEST_GOALS_UPDATE_IMAGE_PATH)
-    artifacts = refresh_plan_from_image(image, existing)
-    _persist_goal(goal_id, artifacts.output)
-    return _build_response(goal_id, artifacts, image.size)
+
+async def _schedule_banana(result: GoalResult, artifacts: WorkflowArtifacts) -> str:
+    step = first_actionable_step(artifacts.output)
+    highlight = artifacts.highlight_image
+    if step is None or highlight is None:
+        return "skipped"
+
+    async def generate() -> Optional[GeneratedImage]:
+        # Deferred work gets its own deadline rather than the request's.
+        with deadline_scope():
+            banana = await banana_image_async(step.text, highlight)
+        if banana is not None:
+            await run_cpu_bound(
+                artifact_store.put,
+                result.goal_id,
+                result.revision,
+                BANANA_ARTIFACT,
+                banana,
+            )
+        return banana
+
+    try:
+        job = artifact_jobs.submit(
+            result.goal_id, BANANA_ARTIFACT, generate, revision=result.revision
+        )
+    except QueueFullError:
+        return "rejected"
+    return job.status.value
+
+
+def _latest_artifact_job(
+    goal_id: str, name: str, revision: Optional[int] = None
+) -> ArtifactJob:
+    job = artifact_jobs.latest(_validate_goal_id(goal_id), name)
+    if job is None or (revision is not None and job.revision != revision):
+        raise HTTPException(status_code=404, detail="Artifact not found.")
+    return job
+
+
+async def _wait_for_artifact_change(
+    job: ArtifactJob, client_etag: Optional[str], wait_s: float
+) -> ArtifactJob:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait_s
+    while not job.finished and client_etag in (None, job.etag):
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        await artifact_jobs.wait(job, remaining)
+    latest = artifact_jobs.latest(job.goal_id, job.name)
+    # A job for a newer revision does not answer a request for this one.
+    return latest if latest is not None and latest.revision == job.revision else job
 
 
 def _decode_base64_image(data: str) -> Image.Image:
     raw = _strip_data_url_prefix(data.strip())
     try:
-        binary = base64.b64decode(raw, validate=True)
+        with stage_timer("base64_decode"):
+            binary = base64.b64decode(raw, validate=True)
     except (binascii.Error, ValueError) as exc:
         raise HTTPException(
             status_code=400, detail="Invalid base64 image data."
         ) from exc
+    return _decode_image_bytes(binary)
+
 
+@traced("decode")
+def _decode_image_bytes(binary: bytes) -> Image.Image:
     try:
-        with Image.open(BytesIO(binary)) as image:
-            return image.convert("RGB").copy()
+        return decode_image(binary)
     except (UnidentifiedImageError, OSError) as exc:
         raise HTTPException(status_code=400, detail="Invalid image payload.") from exc
 
@@ -104,46 +878,178 @@ def _strip_data_url_prefix(data: str) -> str:
     return data
 
 
-def _persist_goal(goal_id: str, plan: OutputSchema) -> Path:
-    path = _goal_path(goal_id)
-    path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(plan.model_dump_json(indent=2))
-    return path
-
-
-def _goal_path(goal_id: str) -> Path:
+def _validate_goal_id(goal_id: str) -> str:
     sanitized = goal_id.strip()
     if not GOAL_ID_PATTERN.fullmatch(sanitized):
         raise HTTPException(status_code=400, detail="Invalid goal id format.")
-    return GOALS_DIR / f"{sanitized}.json"
+    return sanitized
 
 
-def _build_response(
-    goal_id: str, artifacts: WorkflowArtifacts, image_size: tuple[int, int]
-) -> GoalResponse:
-    width, height = image_size
-    pixel_aligned_output = output_with_pixel_boxes(
-        artifacts.output, width=width, height=height
+async def _store_result(
+    record: GoalRecord, artifacts: WorkflowArtifacts, image: Image.Image
+) -> GoalResult:
+    result = GoalResult(
+        goal_id=record.goal_id,
+        plan=_actionable_pixel_plan(artifacts.output, source_size(image)),
+        highlight=artifacts.highlight,
+        banana=artifacts.banana,
+        revision=record.revision,
+        image_size=source_size(image),
+    )
+    await run_cpu_bound(_store_artifacts, result, image)
+    return result
+
+
+@traced("store_artifacts")
+def _store_artifacts(result: GoalResult, image: Image.Image) -> None:
+    for name, artifact in (
+        (HIGHLIGHT_ARTIFACT, result.highlight),
+        (BANANA_ARTIFACT, result.banana),
+        (FRAME_ARTIFACT, encode_png_image(image) if STORE_FRAMES else None),
+    ):
+        if artifact is not None:
+            artifact_store.put(result.goal_id, result.revision, name, artifact)
+
+
+@traced("encode_response")
+def _json_response(result: GoalResult) -> ModelJSONResponse:
+    response = GoalResponse(
+        id=result.goal_id,
+        revision=result.revision,
+        plan=result.plan,
+        highlight_image_base64=None,
+        banana_image_base64=None,
+        reused=result.reused,
+        banana_status=result.banana_status,
+    )
+    return ModelJSONResponse(
+        response,
+        raw_strings={
+            "highlight_image_base64": _base64_bytes(result.highlight),
+            "banana_image_base64": _base64_bytes(result.banana),
+        },
+    )
+
+
+@traced("encode_response")
+def _artifact_response(result: GoalResult, request: Request) -> ModelJSONResponse:
+    response = GoalArtifactResponse(
+        id=result.goal_id,
+        revision=result.revision,
+        plan=result.plan,
+        highlight_image_url=(
+            _artifact_url(request, result, HIGHLIGHT_ARTIFACT)
+            if result.highlight is not None
+            else None
+        ),
+        banana_image_url=(
+            _artifact_url(request, result, BANANA_ARTIFACT)
+            if result.banana is not None or _banana_pending(result)
+            else None
+        ),
+        reused=result.reused,
+        banana_status=result.banana_status,
     )
-    actionable_plan = OutputSchema(
-        goal=pixel_aligned_output.goal,
-        objects=pixel_aligned_output.objects,
-        steps=actionable_steps(pixel_aligned_output.steps),
+    return ModelJSONResponse(response)
+
+
+def _artifact_url(request: Request, result: GoalResult, name: str) -> str:
+    url = request.url_for("get_goal_artifact", goal_id=result.goal_id, name=name)
+    return str(url.include_query_params(revision=result.revision))
+
+
+def _banana_pending(result: GoalResult) -> bool:
+    return result.banana_status in (JobStatus.PENDING.value, JobStatus.RUNNING.value)
+
+
+ArtifactRenderer = Callable[[GoalResult, str, Optional[GeneratedImage]], Optional[str]]
+
+
+def _base64_renderer(
+    result: GoalResult, name: str, artifact: Optional[GeneratedImage]
+) -> Optional[str]:
+    return _encode_base64(artifact)
+
+
+def _url_renderer(request: Request) -> ArtifactRenderer:
+    def render(
+        result: GoalResult, name: str, artifact: Optional[GeneratedImage]
+    ) -> Optional[str]:
+        if artifact is None and not (
+            name == BANANA_ARTIFACT and _banana_pending(result)
+        ):
+            return None
+        return _artifact_url(request, result, name)
+
+    return render
+
+
+def _check_base_revision(record: GoalRecord, base_revision: Optional[int]) -> None:
+    if base_revision is not None and not 1 <= base_revision <= record.revision:
+        raise HTTPException(status_code=400, detail="Unknown base revision.")
+
+
+@traced("encode_response")
+def _delta_response(
+    result: GoalResult, base_revision: int, render: ArtifactRenderer
+) -> ModelJSONResponse:
+    """Renders only what changed since the client's base_revision.
+
+    Both plans are compared in pixel coordinates of this request's image, and an
+    image is included only when its bytes differ from the base revision's. An
+    image the base revision had but this one does not is included as None.
+    """
+    width, height = result.image_size
+    base = goal_store.revision(result.goal_id, base_revision)
+    current = goal_store.revision(result.goal_id, result.revision)
+    if base is None or current is None:
+        raise HTTPException(status_code=400, detail="Unknown base revision.")
+    delta = plan_delta(
+        output_with_pixel_boxes(base, width=width, height=height),
+        output_with_pixel_boxes(current, width=width, height=height),
     )
-    return GoalResponse(
-        id=goal_id,
-        plan=actionable_plan,
-        highlight_image_base64=_encode_file_as_base64(artifacts.highlight_path),
-        banana_image_base64=_encode_file_as_base64(artifacts.banana_path),
+
+    images: Dict[str, Optional[str]] = {}
+    for name, artifact in (
+        (HIGHLIGHT_ARTIFACT, result.highlight),
+        (BANANA_ARTIFACT, result.banana),
+    ):
+        previous = artifact_store.get(result.goal_id, name, base_revision)
+        if artifact is not None and previous is not None:
+            if previous.image.data == artifact.data:
+                continue
+        rendered = render(result, name, artifact)
+        if rendered is not None or previous is not None:
+            images[name] = rendered
+    response = GoalDeltaResponse(
+        id=result.goal_id,
+        revision=result.revision,
+        base_revision=base_revision,
+        delta=delta,
+        images=images,
+        reused=result.reused,
+        banana_status=result.banana_status,
+    )
+    return ModelJSONResponse(response)
+
+
+def _actionable_pixel_plan(
+    output: OutputSchema, image_size: tuple[int, int]
+) -> OutputSchema:
+    width, height = image_size
+    objects = ObjectSet.from_items(output.objects).to_pixels(width, height)
+    return OutputSchema(
+        goal=output.goal,
+        objects=objects.to_items(),
+        steps=actionable_steps(output.steps),
     )
 
 
-def _encode_file_as_base64(path: Optional[Path]) -> Optional[str]:
-    if not path or not path.is_file():
+def _encode_base64(artifact: Optional[GeneratedImage]) -> Optional[str]:
+    if artifact is None:
         return None
-    return base64.b64encode(path.read_bytes()).decode("ascii")
+    return base64.b64encode(artifact.data).decode("ascii")
 
 
-def _save_latest_image(image: Image.Image, destination: Path) -> None:
-    destination.parent.mkdir(parents=True, exist_ok=True)
-    image.save(destination, format="PNG")
+def _base64_bytes(artifact: Optional[GeneratedImage]) -> Optional[bytes]:
+    return base64.b64encode(artifact.data) if artifact is not None else None
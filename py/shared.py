@@ -1,20 +1,71 @@
+import asyncio
+import contextvars
+import logging
+import math
+import os
 import re
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import cache, partial
+from io import BytesIO
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
-from google import genai
-from google.genai import types
 from pydantic import BaseModel, Field
-from PIL import Image, ImageDraw
-
-
-client = genai.Client()
+from PIL import Image, ImageDraw, ImageFont
+
+from backends import (
+    BANANA_STAGE,
+    GeneratedImage,
+    ModelRequest,
+    ModelResponse,
+    get_backend,
+)
+from input_prep import (
+    LOSSLESS_INPUT_PROFILE,
+    REDUCING_GAP,
+    prepare_image,
+    resize_to_width,
+)
+from resilience import DeadlineExceededError
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
 
 OBJECT_CROP_DIR = Path("data/object_crops")
 FIRST_STEP_HIGHLIGHT_PATH = Path("data/first_step_highlight.png")
 BANANA_OUTPUT_PATH = Path("data/first_step_banana.png")
 CONTINUATION_HIGHLIGHT_PATH = Path("data/continuation_first_step_highlight.png")
 CONTINUATION_BANANA_PATH = Path("data/continuation_first_step_banana.png")
+BANANA_MODEL = "gemini-2.5-flash-image"
+# The banana input is the annotated highlight; keep its box outlines lossless.
+BANANA_INPUT_PROFILE = LOSSLESS_INPUT_PROFILE
+ATLAS_MAX_SIDE = 1000
+ATLAS_MAX_CELL = 500
+ATLAS_CAPTION_HEIGHT = 24
+HIDDEN_BOX = (0, 0, 0, 0)
+
+CPU_WORKERS = int(
+    os.environ.get("REALITYGUIDE_CPU_WORKERS", str(min(32, (os.cpu_count() or 1) + 4)))
+)
+_cpu_executor = ThreadPoolExecutor(
+    max_workers=CPU_WORKERS, thread_name_prefix="realityguide-cpu"
+)
+
+T = TypeVar("T")
 
 
 class ObjectItem(BaseModel):
@@ -59,9 +110,30 @@ class OutputSchema(BaseModel):
     )
 
 
+class StepStatusItem(BaseModel):
+    id: int = Field(description="Number of the step in the remaining steps list.")
+    done: bool = Field(description="True when the step is fully satisfied.")
+    text: Optional[str] = Field(
+        default=None,
+        description="Rewritten instruction when the remaining work changed, otherwise null.",
+    )
+
+
+class CompactCompletionSchema(BaseModel):
+    objects: List[ObjectItem] = Field(
+        description="Bounding boxes of the listed objects in the latest image."
+    )
+    steps: List[StepStatusItem] = Field(
+        description="Only the remaining steps that were completed or reworded."
+    )
+    new_steps: List[StepItem] = Field(
+        default_factory=list,
+        description="Steps to append when more actions are needed to finish the goal.",
+    )
+
+
 def resize_image(image: Image.Image, target_width: int = 1000) -> Image.Image:
-    target_height = int(target_width * image.size[1] / image.size[0])
-    return image.resize((target_width, target_height), Image.Resampling.LANCZOS)
+    return resize_to_width(image, target_width)
 
 
 def resize_images(
@@ -70,6 +142,31 @@ def resize_images(
     return [resize_image(image, target_width) for image in images]
 
 
+async def run_cpu_bound(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context so stage timers reach the request's trace.
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        _cpu_executor, partial(context.run, func, *args, **kwargs)
+    )
+
+
+def encode_png(image: Image.Image) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def encode_png_image(image: Image.Image) -> GeneratedImage:
+    return GeneratedImage(data=encode_png(image), mime_type="image/png")
+
+
+def save_image_bytes(image: GeneratedImage, output_path: Path) -> Path:
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_bytes(image.data)
+    return output_path
+
+
 def normalized_to_pixels(value: float, size: int) -> int:
     normalized = max(0.0, min(1000.0, float(value)))
     return int(round((normalized / 1000.0) * size))
@@ -114,72 +211,292 @@ def normalized_box_to_pixel_box(
     return y_min_px, x_min_px, y_max_px, x_max_px
 
 
+class ObjectSet:
+    """The objects of a plan stored by column, for box math and label lookups.
+
+    boxes holds four ints per object ([ymin, xmin, ymax, xmax], normalized or
+    pixel) and visible marks the objects that have a box; the box of a hidden
+    object is zeros. Labels are indexed by their normalized form, and the first
+    object with a label wins. Convert with from_items/to_items at the edges.
+    """
+
+    __slots__ = ("labels", "boxes", "visible", "_index")
+
+    def __init__(
+        self,
+        labels: List[str],
+        boxes: array,
+        visible: bytearray,
+        index: Optional[Dict[str, int]] = None,
+    ) -> None:
+        self.labels = labels
+        self.boxes = boxes
+        self.visible = visible
+        if index is None:
+            index = {}
+            for position, label in enumerate(labels):
+                key = normalize_label(label)
+                if key:
+                    index.setdefault(key, position)
+        self._index = index
+
+    @classmethod
+    def from_items(cls, objects: Iterable[ObjectItem]) -> "ObjectSet":
+        labels: List[str] = []
+        boxes = array("i")
+        visible = bytearray()
+        for obj in objects:
+            labels.append(obj.label)
+            if obj.box_2d is None:
+                boxes.extend(HIDDEN_BOX)
+                visible.append(0)
+            else:
+                boxes.extend(obj.box_2d)
+                visible.append(1)
+        return cls(labels, boxes, visible)
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def to_items(self) -> List[ObjectItem]:
+        boxes = self.boxes
+        return [
+            ObjectItem(
+                label=label,
+                box_2d=(
+                    (
+                        boxes[4 * position],
+                        boxes[4 * position + 1],
+                        boxes[4 * position + 2],
+                        boxes[4 * position + 3],
+                    )
+                    if self.visible[position]
+                    else None
+                ),
+            )
+            for position, label in enumerate(self.labels)
+        ]
+
+    def index_of(self, label: str) -> Optional[int]:
+        return self._index.get(normalize_label(label))
+
+    def box(self, position: int) -> Optional[Tuple[int, int, int, int]]:
+        if not self.visible[position]:
+            return None
+        start = 4 * position
+        ymin, xmin, ymax, xmax = self.boxes[start : start + 4]
+        return ymin, xmin, ymax, xmax
+
+    def find(self, label: str) -> Optional[ObjectItem]:
+        position = self.index_of(label)
+        if position is None:
+            return None
+        return ObjectItem(label=self.labels[position], box_2d=self.box(position))
+
+    def subset(self, labels: Set[str]) -> "ObjectSet":
+        """The objects whose normalized label is in labels, in order."""
+        positions = [
+            position
+            for position, label in enumerate(self.labels)
+            if normalize_label(label) in labels
+        ]
+        boxes = array("i")
+        for position in positions:
+            boxes.extend(self.boxes[4 * position : 4 * position + 4])
+        return ObjectSet(
+            [self.labels[position] for position in positions],
+            boxes,
+            bytearray(self.visible[position] for position in positions),
+        )
+
+    def merge(
+        self,
+        updated: "ObjectSet",
+        labels: Optional[Set[str]] = None,
+        keep_missing: bool = False,
+    ) -> "ObjectSet":
+        """Keeps these labels and takes each box from updated by label.
+
+        Objects missing from updated, or whose normalized label is not in labels
+        when it is given, have no box, or keep their own box with keep_missing.
+        """
+        if keep_missing:
+            boxes = array("i", self.boxes)
+            visible = bytearray(self.visible)
+        else:
+            boxes = array("i", HIDDEN_BOX * len(self.labels))
+            visible = bytearray(len(self.labels))
+        for position, label in enumerate(self.labels):
+            key = normalize_label(label)
+            if labels is not None and key not in labels:
+                continue
+            match = updated._index.get(key)
+            if match is None:
+                continue
+            if not updated.visible[match]:
+                boxes[4 * position : 4 * position + 4] = array("i", HIDDEN_BOX)
+                visible[position] = 0
+                continue
+            boxes[4 * position : 4 * position + 4] = updated.boxes[
+                4 * match : 4 * match + 4
+            ]
+            visible[position] = 1
+        return ObjectSet(self.labels, boxes, visible, self._index)
+
+    def to_pixels(self, width: int, height: int) -> "ObjectSet":
+        """Converts normalized boxes to pixel [ymin, xmin, ymax, xmax] boxes.
+
+        Works a column at a time and clamps exactly as normalized_box_to_pixels.
+        """
+        boxes = self.boxes
+        y_min = _column_to_pixels(boxes[0::4], height, height - 1)
+        x_min = _column_to_pixels(boxes[1::4], width, width - 1)
+        y_max = _ensure_extent(
+            y_min, _column_to_pixels(boxes[2::4], height, height), height
+        )
+        x_max = _ensure_extent(
+            x_min, _column_to_pixels(boxes[3::4], width, width), width
+        )
+        pixels = array(
+            "i",
+            [
+                value
+                for row, shown in zip(zip(y_min, x_min, y_max, x_max), self.visible)
+                for value in (row if shown else HIDDEN_BOX)
+            ],
+        )
+        return ObjectSet(self.labels, pixels, self.visible, self._index)
+
+
+def normalize_label(label: str) -> str:
+    return label.strip().lower()
+
+
+def _column_to_pixels(column: array, size: int, upper: int) -> List[int]:
+    """normalized_to_pixels and clamp(value, 0, upper) over a column of boxes."""
+    upper = max(upper, 0)
+    pixels = [
+        round(((0 if value < 0 else 1000 if value > 1000 else value) / 1000.0) * size)
+        for value in column
+    ]
+    return [upper if value > upper else value for value in pixels]
+
+
+def _ensure_extent(lower: List[int], upper: List[int], size: int) -> List[int]:
+    """Gives every box at least one pixel, as normalized_box_to_pixels does."""
+    return [
+        high if high > low else clamp(low + 1, 0, size)
+        for low, high in zip(lower, upper)
+    ]
+
+
 def objects_with_pixel_boxes(
     objects: List[ObjectItem], width: int, height: int
 ) -> List[ObjectItem]:
-    return [
-        ObjectItem(
-            label=obj.label,
-            box_2d=(
-                normalized_box_to_pixel_box(obj.box_2d, width, height)
-                if obj.box_2d is not None
-                else None
-            ),
-        )
-        for obj in objects
-    ]
+    return ObjectSet.from_items(objects).to_pixels(width, height).to_items()
 
 
 def output_with_pixel_boxes(
     output: OutputSchema, width: int, height: int
 ) -> OutputSchema:
-    pixel_objects = objects_with_pixel_boxes(output.objects, width, height)
-    pixel_steps = [step.model_copy(deep=True) for step in output.steps]
-    return OutputSchema(goal=output.goal, objects=pixel_objects, steps=pixel_steps)
+    # Steps are never mutated, so the new plan can share them.
+    return OutputSchema(
+        goal=output.goal,
+        objects=objects_with_pixel_boxes(output.objects, width, height),
+        steps=list(output.steps),
+    )
 
 
-def crop_and_save_objects(
-    image: Image.Image, objects: List[ObjectItem], dest_dir: Path
-) -> List[Tuple[ObjectItem, Image.Image, Path]]:
-    dest_dir.mkdir(parents=True, exist_ok=True)
+def crop_objects(
+    image: Image.Image, objects: List[ObjectItem]
+) -> List[Tuple[ObjectItem, Image.Image]]:
     width, height = image.size
-    assets: List[Tuple[ObjectItem, Image.Image, Path]] = []
-
-    crop_index = 0
-    for obj in objects:
-        if obj.box_2d is None:
+    pixels = ObjectSet.from_items(objects).to_pixels(width, height)
+    crops: List[Tuple[ObjectItem, Image.Image]] = []
+    for position, obj in enumerate(objects):
+        box = pixels.box(position)
+        if box is None:
             continue
-        crop_index += 1
-        x_min_px, y_min_px, x_max_px, y_max_px = normalized_box_to_pixels(
-            obj.box_2d, width, height
-        )
+        y_min_px, x_min_px, y_max_px, x_max_px = box
+        crops.append((obj, image.crop((x_min_px, y_min_px, x_max_px, y_max_px))))
+    return crops
+
 
-        crop = image.crop((x_min_px, y_min_px, x_max_px, y_max_px))
+def save_object_crops(
+    crops: List[Tuple[ObjectItem, Image.Image]], dest_dir: Path
+) -> List[Path]:
+    dest_dir.mkdir(parents=True, exist_ok=True)
+    paths: List[Path] = []
+    for crop_index, (obj, crop) in enumerate(crops, start=1):
         crop_path = dest_dir / f"object_{crop_index}_{slugify_label(obj.label)}.png"
         crop.save(crop_path)
-        assets.append((obj, crop, crop_path))
+        paths.append(crop_path)
+    return paths
+
 
-    return assets
+def build_crop_atlas(
+    crops: List[Tuple[ObjectItem, Image.Image]],
+    max_side: int = ATLAS_MAX_SIDE,
+    max_cell: int = ATLAS_MAX_CELL,
+) -> Optional[Image.Image]:
+    """Packs object crops into one contact sheet with each crop captioned by its label.
+
+    Crops are only ever scaled down, to fit a square cell of at most max_cell
+    pixels, and the grid is sized so the sheet stays within max_side.
+    """
+    if not crops:
+        return None
+    columns = math.ceil(math.sqrt(len(crops)))
+    rows = math.ceil(len(crops) / columns)
+    cell = max(
+        16,
+        min(max_cell, max_side // columns, max_side // rows - ATLAS_CAPTION_HEIGHT),
+    )
+    row_height = cell + ATLAS_CAPTION_HEIGHT
+    atlas = Image.new("RGB", (columns * cell, rows * row_height), "#202020")
+    draw = ImageDraw.Draw(atlas)
+    font = ImageFont.load_default(size=ATLAS_CAPTION_HEIGHT - 8)
+
+    for index, (obj, crop) in enumerate(crops):
+        left = (index % columns) * cell
+        top = (index // columns) * row_height
+        tile = crop.convert("RGB")
+        tile.thumbnail((cell - 4, cell - 4), Image.Resampling.LANCZOS, REDUCING_GAP)
+        atlas.paste(
+            tile, (left + (cell - tile.width) // 2, top + (cell - tile.height) // 2)
+        )
+        caption = obj.label
+        while caption and draw.textlength(caption, font=font) > cell - 4:
+            caption = caption[:-1]
+        draw.rectangle(
+            (left, top + cell, left + cell - 1, top + row_height - 1), fill="black"
+        )
+        draw.text((left + 2, top + cell + 4), caption, fill="white", font=font)
+    return atlas
+
+
+def crop_and_save_objects(
+    image: Image.Image, objects: List[ObjectItem], dest_dir: Path
+) -> List[Tuple[ObjectItem, Image.Image, Path]]:
+    crops = crop_objects(image, objects)
+    paths = save_object_crops(crops, dest_dir)
+    return [(obj, crop, path) for (obj, crop), path in zip(crops, paths)]
 
 
 def find_object_by_label(label: str, objects: List[ObjectItem]) -> Optional[ObjectItem]:
-    normalized_target = label.strip().lower()
+    # One lookup does not pay for building an ObjectSet; scan and stop early.
+    normalized_target = normalize_label(label)
     if not normalized_target:
         return None
-
     for obj in objects:
-        if obj.label.strip().lower() == normalized_target:
+        if normalize_label(obj.label) == normalized_target:
             return obj
-
     return None
 
 
-def highlight_first_step(
-    image: Image.Image,
-    objects: List[ObjectItem],
-    steps: List[StepItem],
-    output_path: Path,
-) -> Optional[Path]:
+def annotate_first_step(
+    image: Image.Image, objects: List[ObjectItem], steps: List[StepItem]
+) -> Optional[Image.Image]:
     if not steps:
         return None
 
@@ -199,7 +516,18 @@ def highlight_first_step(
     draw.rectangle(
         (x_min_px, y_min_px, x_max_px, y_max_px), outline="red", width=stroke_width
     )
+    return annotated
 
+
+def highlight_first_step(
+    image: Image.Image,
+    objects: List[ObjectItem],
+    steps: List[StepItem],
+    output_path: Path,
+) -> Optional[Path]:
+    annotated = annotate_first_step(image, objects, steps)
+    if annotated is None:
+        return None
     output_path.parent.mkdir(parents=True, exist_ok=True)
     annotated.save(output_path)
     return output_path
@@ -208,29 +536,59 @@ def highlight_first_step(
 def banana(
     step_text: str, annotated_image_path: Path, output_path: Path
 ) -> Optional[Path]:
-    prompt = f"""\
-Using the provided image, apply the following: {step_text}."""
-
     with Image.open(annotated_image_path) as annotated_image:
-        image = resize_image(annotated_image)
+        generated = banana_image(step_text, annotated_image)
+    if generated is None:
+        return None
+    return save_image_bytes(generated, output_path)
+
+
+def banana_image(
+    step_text: str, annotated_image: Image.Image
+) -> Optional[GeneratedImage]:
+    image = prepare_image(annotated_image, BANANA_INPUT_PROFILE)
+
+    response = get_backend().generate(_banana_request(step_text, image.part))
+    return _first_generated_image(response)
 
-    response = client.models.generate_content(
-        model="gemini-2.5-flash-image",
-        contents=[prompt, image],
-        config=types.GenerateContentConfig(response_modalities=["Image"]),
-    )
 
-    if response.parts is None:
+async def banana_image_async(
+    step_text: str, annotated_image: Image.Image
+) -> Optional[GeneratedImage]:
+    image = await run_cpu_bound(prepare_image, annotated_image, BANANA_INPUT_PROFILE)
+
+    try:
+        response = await get_backend().agenerate(_banana_request(step_text, image.part))
+    except DeadlineExceededError:
+        # The plan is still useful without the illustration.
+        logger.warning("Banana image skipped: the request deadline was reached.")
         return None
+    return _first_generated_image(response)
+
+
+def _banana_request(step_text: str, image: Any) -> ModelRequest:
+    return ModelRequest(
+        stage=BANANA_STAGE,
+        model=BANANA_MODEL,
+        contents=[_banana_prompt(step_text), image],
+        config=_banana_config(),
+    )
+
+
+def _banana_prompt(step_text: str) -> str:
+    return f"""\
+Using the provided image, apply the following: {step_text}."""
+
+
+@cache
+def _banana_config() -> "types.GenerateContentConfig":
+    from google.genai import types
+
+    return types.GenerateContentConfig(response_modalities=["Image"])
 
-    for part in response.parts:
-        if part.inline_data is None:
-            continue
-        generated = part.as_image()
-        if generated is None:
-            continue
-        output_path.parent.mkdir(parents=True, exist_ok=True)
-        generated.save(str(output_path))
-        return output_path
 
+def _first_generated_image(response: ModelResponse) -> Optional[GeneratedImage]:
+    for generated in response.images:
+        if generated.mime_type.startswith("image/"):
+            return generated
     return None
@@ -0,0 +1,31 @@
+import os
+import tempfile
+from pathlib import Path
+
+# Modules read their REALITYGUIDE_* settings at import, so the test environment
+# has to be in place before any of them is imported.
+_workdir = Path(tempfile.mkdtemp(prefix="realityguide-tests-"))
+os.environ.update(
+    REALITYGUIDE_BACKEND="replay",
+    REALITYGUIDE_CASSETTE_DIR=str(_workdir / "cassettes"),
+    REALITYGUIDE_GOAL_DB=str(_workdir / "goals.sqlite3"),
+    REALITYGUIDE_CACHE_ENTRIES="0",
+    REALITYGUIDE_WARM_UP="0",
+)
+
+from typing import Iterator
+
+import pytest
+from fastapi.testclient import TestClient
+
+from benchmark import write_synthetic_cassettes
+
+write_synthetic_cassettes(_workdir / "cassettes", object_count=3)
+
+
+@pytest.fixture
+def client() -> Iterator[TestClient]:
+    import server
+
+    with TestClient(server.app) as http:
+        yield http
@@ -0,0 +1,23 @@
+import base64
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+
+def jpeg_base64(image: Image.Image) -> str:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def tabletop(width: int = 320, height: int = 240, turned: bool = False) -> Image.Image:
+    """A smooth scene, so a JPEG round trip barely changes its thumbnail.
+
+    The turned scene is mirrored, which no frame dedupe mistakes for the original.
+    """
+    light = Image.linear_gradient("L").rotate(90).resize((width, height))
+    frame = Image.merge("RGB", (light, light, light))
+    draw = ImageDraw.Draw(frame)
+    draw.rectangle((40, 60, 120, 140), fill="red")
+    draw.ellipse((200, 100, 280, 200), fill="blue")
+    return frame.transpose(Image.Transpose.FLIP_LEFT_RIGHT) if turned else frame
@@ -0,0 +1,108 @@
+import asyncio
+import random
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+
+import api_client
+from api_client import LoadConfig, load_frames
+from helpers import tabletop
+
+
+@pytest.mark.parametrize(
+    "argv, expected",
+    [
+        (["sample/1.jpg"], ["send", "sample/1.jpg"]),
+        (["sample/1.jpg", "--binary"], ["send", "sample/1.jpg", "--binary"]),
+        (
+            ["--base-url", "http://h", "a.jpg"],
+            ["send", "--base-url", "http://h", "a.jpg"],
+        ),
+        (["send", "sample/1.jpg"], ["send", "sample/1.jpg"]),
+        (["load", "frames/"], ["load", "frames/"]),
+        (["--help"], ["--help"]),
+        ([], []),
+    ],
+)
+def test_send_is_the_default_command(argv: List[str], expected: List[str]) -> None:
+    assert api_client._with_default_command(argv) == expected
+
+
+@pytest.fixture
+def frames_dir(tmp_path: Path) -> Path:
+    tabletop().save(tmp_path / "1.jpg", quality=90)
+    tabletop(turned=True).save(tmp_path / "2.jpg", quality=90)
+    (tmp_path / "notes.txt").write_text("not a frame")
+    return tmp_path
+
+
+def run_in_process(config: LoadConfig) -> Dict[str, Any]:
+    return asyncio.run(api_client._run_load(config, in_process=True))
+
+
+def test_closed_loop_runs_sessions_back_to_back(frames_dir: Path) -> None:
+    config = LoadConfig(
+        base_url="http://in-process",
+        frames=load_frames(frames_dir),
+        concurrency=2,
+        duration_s=0.3,
+        updates_per_session=1,
+    )
+
+    report = run_in_process(config)
+
+    assert len(config.frames) == 2
+    assert report["mode"] == "closed"
+    assert report["concurrency"] == 2
+    assert report["target_rps"] is None
+    assert report["dropped_arrivals"] == 0
+    operations = report["operations"]
+    # Every worker starts with a POST and follows it with its one PUT.
+    assert operations["post"]["requests"] >= 2
+    assert operations["put"]["requests"] >= operations["post"]["requests"] - 2
+    assert report["total"]["requests"] == (
+        operations["post"]["requests"] + operations["put"]["requests"]
+    )
+    assert report["total"]["statuses"] == {"200": report["total"]["requests"]}
+    assert report["total"]["error_rate"] == 0.0
+    assert set(report["total"]["latency_ms"]) == {"mean", "p50", "p95", "p99", "max"}
+
+
+def test_open_loop_sends_arrivals_at_the_target_rate(frames_dir: Path) -> None:
+    random.seed(3)
+    config = LoadConfig(
+        base_url="http://in-process",
+        frames=load_frames(frames_dir),
+        binary=True,
+        rps=40.0,
+        duration_s=0.3,
+        updates_per_session=2,
+    )
+
+    report = run_in_process(config)
+
+    assert report["mode"] == "open"
+    assert report["concurrency"] is None
+    assert report["target_rps"] == 40.0
+    assert report["binary"] is True
+    assert report["dropped_arrivals"] == 0
+    assert report["operations"]["post"]["requests"] >= 1
+    assert report["total"]["requests"] >= 4
+    assert report["total"]["statuses"] == {"200": report["total"]["requests"]}
+
+
+def test_open_loop_drops_arrivals_over_max_in_flight(frames_dir: Path) -> None:
+    config = LoadConfig(
+        base_url="http://in-process",
+        frames=load_frames(frames_dir),
+        rps=50.0,
+        duration_s=0.1,
+        max_in_flight=0,
+    )
+
+    report = run_in_process(config)
+
+    assert report["dropped_arrivals"] >= 1
+    assert report["total"]["requests"] == 0
+    assert "latency_ms" not in report["total"]
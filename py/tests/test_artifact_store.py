@@ -0,0 +1,72 @@
+from pathlib import Path
+from typing import Callable
+
+import pytest
+
+from artifact_store import (
+    ArtifactStore,
+    LocalArtifactStore,
+    MemoryArtifactStore,
+    artifact_store_from_env,
+)
+from backends import GeneratedImage
+
+StoreFactory = Callable[[int], ArtifactStore]
+
+
+@pytest.fixture(params=["memory", "local"])
+def make_store(request: pytest.FixtureRequest, tmp_path: Path) -> StoreFactory:
+    def make(max_bytes: int) -> ArtifactStore:
+        if request.param == "memory":
+            return MemoryArtifactStore(max_bytes, None, gc_interval_s=0)
+        return LocalArtifactStore(tmp_path, max_bytes, None, gc_interval_s=0)
+
+    return make
+
+
+def test_revisions_are_kept_apart(make_store: StoreFactory) -> None:
+    store = make_store(1 << 20)
+    store.put("goal", 1, "banana", GeneratedImage(b"first"))
+    store.put("goal", 2, "banana", GeneratedImage(b"second"))
+
+    first = store.get("goal", "banana", 1)
+    latest = store.get("goal", "banana")
+
+    assert first is not None and first.image.data == b"first"
+    assert latest is not None and latest.image.data == b"second"
+    assert latest.etag != first.etag
+    assert store.get("goal", "highlight", 2) is None
+    assert store.get("other", "banana") is None
+
+
+def test_oldest_revisions_are_collected_past_the_size_limit(
+    make_store: StoreFactory,
+) -> None:
+    store = make_store(10)
+    store.put("goal", 1, "banana", GeneratedImage(b"x" * 8))
+    store.put("goal", 2, "banana", GeneratedImage(b"y" * 8))
+    store.collect_garbage()
+
+    assert store.get("goal", "banana", 1) is None
+    assert store.get("goal", "banana", 2) is not None
+    assert store.stats().evicted_revisions >= 1
+
+
+def test_artifact_dir_selects_the_local_store(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.delenv("REALITYGUIDE_ARTIFACT_STORE", raising=False)
+    monkeypatch.setenv("REALITYGUIDE_ARTIFACT_DIR", str(tmp_path))
+    store = artifact_store_from_env()
+    assert isinstance(store, LocalArtifactStore)
+    assert store.root == tmp_path
+
+
+def test_memory_store_refuses_several_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("REALITYGUIDE_ARTIFACT_DIR", raising=False)
+    monkeypatch.setenv("REALITYGUIDE_ARTIFACT_STORE", "memory")
+    monkeypatch.setenv("WEB_CONCURRENCY", "1")
+    assert isinstance(artifact_store_from_env(), MemoryArtifactStore)
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    with pytest.raises(RuntimeError, match="WEB_CONCURRENCY=4"):
+        artifact_store_from_env()
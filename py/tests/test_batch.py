@@ -0,0 +1,81 @@
+import asyncio
+import json
+from pathlib import Path
+from typing import Any, Dict, List
+
+from batch import BatchEntry, completed_ids, read_entries, run_batch
+from helpers import tabletop
+from workflow import WorkflowOptions
+
+OPTIONS = WorkflowOptions(generate_banana=False)
+
+
+def write_images(directory: Path, names: List[str]) -> None:
+    directory.mkdir(parents=True, exist_ok=True)
+    for name in names:
+        tabletop(160, 120).save(directory / name)
+
+
+def records(output: Path) -> List[Dict[str, Any]]:
+    return [json.loads(line) for line in output.read_text().splitlines()]
+
+
+def test_interrupted_run_resumes_where_it_stopped(tmp_path: Path) -> None:
+    images = tmp_path / "images"
+    write_images(images, ["a.jpg", "b.jpg", "c.jpg"])
+    output = tmp_path / "results.jsonl"
+    earlier_run = [
+        json.dumps({"id": "a.jpg", "ok": True}),
+        json.dumps({"id": "b.jpg", "ok": False, "error": "timeout"}),
+        '{"id": "c.jpg", "o',
+    ]
+    # The earlier run was interrupted halfway through writing its last record.
+    output.write_text("\n".join(earlier_run))
+    entries = list(read_entries(images))
+
+    summary, latencies_s = asyncio.run(
+        run_batch(entries, output, concurrency=2, options=OPTIONS)
+    )
+
+    assert (summary.total, summary.skipped, summary.succeeded) == (3, 1, 2)
+    assert len(latencies_s) == 2
+    assert completed_ids(output) == {"a.jpg", "b.jpg", "c.jpg"}
+    new_lines = output.read_text().splitlines()[len(earlier_run) :]
+    assert sorted(json.loads(line)["id"] for line in new_lines) == ["b.jpg", "c.jpg"]
+
+
+def test_failed_entry_is_recorded_without_stopping_the_batch(tmp_path: Path) -> None:
+    images = tmp_path / "images"
+    write_images(images, ["good.jpg"])
+    (images / "broken.jpg").write_bytes(b"not an image")
+    output = tmp_path / "results.jsonl"
+
+    summary, _ = asyncio.run(
+        run_batch(list(read_entries(images)), output, options=OPTIONS)
+    )
+
+    assert (summary.succeeded, summary.failed) == (1, 1)
+    by_id = {record["id"]: record for record in records(output)}
+    assert by_id["good.jpg"]["plan"]["steps"]
+    assert not by_id["broken.jpg"]["ok"] and by_id["broken.jpg"]["error"]
+    assert completed_ids(output) == {"good.jpg"}
+
+
+def test_manifest_paths_are_relative_to_the_manifest(tmp_path: Path) -> None:
+    manifest = tmp_path / "batch" / "manifest.jsonl"
+    manifest.parent.mkdir()
+    manifest.write_text(
+        json.dumps({"image": "frames/1.jpg", "plan": "plans/1.json", "id": "one"})
+        + "\n\n"
+        + json.dumps({"image": "frames/2.jpg"})
+        + "\n"
+    )
+
+    assert list(read_entries(manifest)) == [
+        BatchEntry(
+            id="one",
+            image=manifest.parent / "frames/1.jpg",
+            prior_plan=manifest.parent / "plans/1.json",
+        ),
+        BatchEntry(id="frames/2.jpg", image=manifest.parent / "frames/2.jpg"),
+    ]
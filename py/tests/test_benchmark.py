@@ -0,0 +1,10 @@
+from pathlib import Path
+
+from benchmark import write_synthetic_cassettes
+
+
+def test_cassette_dir_can_be_a_string(tmp_path: Path) -> None:
+    path = write_synthetic_cassettes(str(tmp_path / "cassettes"), object_count=2)
+
+    assert path == tmp_path / "cassettes" / "synthetic.json"
+    assert path.is_file()
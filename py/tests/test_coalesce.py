@@ -0,0 +1,138 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from coalesce import LatestFrameCoalescer
+from helpers import jpeg_base64, tabletop
+
+
+def test_frames_submitted_during_a_run_collapse_to_the_latest() -> None:
+    async def run() -> None:
+        coalescer: LatestFrameCoalescer[str] = LatestFrameCoalescer(enabled=True)
+        gate = asyncio.Event()
+        ran: List[str] = []
+
+        def frame(name: str):
+            async def process() -> str:
+                ran.append(name)
+                if name == "first":
+                    await gate.wait()
+                return name
+
+            return process
+
+        first = asyncio.create_task(coalescer.submit("goal", frame("first")))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(coalescer.submit("goal", frame("second")))
+        third = asyncio.create_task(coalescer.submit("goal", frame("third")))
+        await asyncio.sleep(0)
+        gate.set()
+
+        assert await asyncio.gather(first, second, third) == [
+            "first",
+            "third",
+            "third",
+        ]
+        assert ran == ["first", "third"]
+        stats = coalescer.stats()
+        assert (stats["submitted"], stats["runs"], stats["superseded"]) == (3, 2, 1)
+
+    asyncio.run(run())
+
+
+def test_exclusive_blocks_wait_for_runs_on_the_same_key() -> None:
+    async def run() -> None:
+        coalescer: LatestFrameCoalescer[str] = LatestFrameCoalescer(enabled=True)
+        order: List[str] = []
+
+        async def refresh() -> str:
+            order.append("run started")
+            await asyncio.sleep(0.05)
+            order.append("run finished")
+            return "done"
+
+        async def stream() -> None:
+            async with coalescer.exclusive("goal"):
+                order.append("stream")
+
+        async def other_goal() -> None:
+            async with coalescer.exclusive("other"):
+                order.append("other goal")
+
+        submitted = asyncio.create_task(coalescer.submit("goal", refresh))
+        await asyncio.sleep(0)
+        await asyncio.gather(stream(), other_goal())
+        await submitted
+
+        assert order == ["run started", "other goal", "run finished", "stream"]
+
+    asyncio.run(run())
+
+
+def test_failed_run_reaches_every_waiter() -> None:
+    async def run() -> None:
+        coalescer: LatestFrameCoalescer[str] = LatestFrameCoalescer(enabled=True)
+
+        async def broken() -> str:
+            await asyncio.sleep(0)
+            raise RuntimeError("model unavailable")
+
+        results = await asyncio.gather(
+            coalescer.submit("goal", broken),
+            coalescer.submit("goal", broken),
+            return_exceptions=True,
+        )
+
+        assert [str(result) for result in results] == ["model unavailable"] * 2
+
+    asyncio.run(run())
+
+
+def test_streamed_refresh_takes_its_turn_with_a_plain_put(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    goal_id = client.post(
+        "/goals", json={"image_base64": jpeg_base64(tabletop())}
+    ).json()["id"]
+    refresh = server.refresh_plan_from_image_async
+    stream_refresh = server.stream_refresh_from_image
+
+    async def slow_refresh(*args: Any, **kwargs: Any) -> Any:
+        await asyncio.sleep(0.3)
+        return await refresh(*args, **kwargs)
+
+    async def slow_stream_refresh(*args: Any, **kwargs: Any) -> AsyncIterator[Any]:
+        await asyncio.sleep(0.3)
+        async for event in stream_refresh(*args, **kwargs):
+            yield event
+
+    monkeypatch.setattr(server, "refresh_plan_from_image_async", slow_refresh)
+    monkeypatch.setattr(server, "stream_refresh_from_image", slow_stream_refresh)
+
+    def streamed() -> List[Any]:
+        response = client.put(
+            f"/goals/{goal_id}/stream",
+            json={"image_base64": jpeg_base64(tabletop(turned=True))},
+        )
+        return [json.loads(line) for line in response.text.splitlines()]
+
+    def plain() -> Any:
+        time.sleep(0.1)
+        return client.put(
+            f"/goals/{goal_id}", json={"image_base64": jpeg_base64(tabletop())}
+        )
+
+    with ThreadPoolExecutor(2) as pool:
+        events = pool.submit(streamed)
+        response = pool.submit(plain).result()
+    done = events.result()[-1]
+
+    assert done["event"] == "done"
+    assert response.status_code == 200
+    assert {done["data"]["revision"], response.json()["revision"]} == {2, 3}
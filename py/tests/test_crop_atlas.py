@@ -0,0 +1,107 @@
+from typing import List, Tuple
+
+from PIL import Image
+
+import workflow
+from helpers import tabletop
+from shared import ATLAS_CAPTION_HEIGHT, ObjectItem, build_crop_atlas
+
+COLORS = ["red", "green", "blue", "yellow", "magenta"]
+
+
+def solid_crops(
+    sizes: List[Tuple[int, int]],
+) -> List[Tuple[ObjectItem, Image.Image]]:
+    return [
+        (
+            ObjectItem(label=f"object {index}", box_2d=None),
+            Image.new("RGB", size, COLORS[index]),
+        )
+        for index, size in enumerate(sizes)
+    ]
+
+
+def object_at(x: int, y: int, cell: int, columns: int) -> int:
+    """Maps an atlas pixel back to the index of the crop whose cell holds it."""
+    return (y // (cell + ATLAS_CAPTION_HEIGHT)) * columns + x // cell
+
+
+def test_no_crops_make_no_atlas() -> None:
+    assert build_crop_atlas([]) is None
+
+
+def test_crops_are_packed_row_by_row_in_a_near_square_grid() -> None:
+    crops = solid_crops([(40, 30)] * 5)
+
+    atlas = build_crop_atlas(crops)
+
+    assert atlas is not None
+    # Five crops fit a 3 x 2 grid; the cell is capped by max_side // columns.
+    cell = 1000 // 3
+    assert atlas.size == (3 * cell, 2 * (cell + ATLAS_CAPTION_HEIGHT))
+    for index, (_, crop) in enumerate(crops):
+        left = (index % 3) * cell
+        top = (index // 3) * (cell + ATLAS_CAPTION_HEIGHT)
+        center = (left + cell // 2, top + cell // 2)
+        assert object_at(*center, cell=cell, columns=3) == index
+        assert atlas.getpixel(center) == crop.getpixel((0, 0))
+        # Small crops are centered at their own size, never scaled up.
+        assert atlas.getpixel((center[0] + 25, center[1])) == (32, 32, 32)
+        assert atlas.getpixel((left + 1, top + cell + 1)) == (0, 0, 0)
+
+
+def test_large_crops_are_scaled_down_to_their_cell() -> None:
+    crops = solid_crops([(2000, 1000), (10, 10)])
+
+    atlas = build_crop_atlas(crops, max_side=400, max_cell=300)
+
+    assert atlas is not None
+    cell = 200
+    assert atlas.size == (2 * cell, cell + ATLAS_CAPTION_HEIGHT)
+    # The 2:1 crop fills the cell width less the margin, at its own aspect ratio.
+    assert atlas.getpixel((3, cell // 2)) == (255, 0, 0)
+    assert atlas.getpixel((cell // 2, cell // 2 - 60)) == (32, 32, 32)
+    assert object_at(cell + 5, cell // 2, cell=cell, columns=2) == 1
+
+
+def test_many_crops_stay_within_max_side() -> None:
+    atlas = build_crop_atlas(solid_crops([(50, 50)] * 5) * 4, max_side=1000)
+
+    assert atlas is not None
+    assert max(atlas.size) <= 1000
+
+
+def test_atlas_mode_sends_one_attachment_and_says_so_in_the_prompt() -> None:
+    objects = [
+        ObjectItem(label="red block", box_2d=(250, 125, 583, 375)),
+        ObjectItem(label="blue disc", box_2d=(417, 625, 833, 875)),
+        ObjectItem(label="lost fork", box_2d=None),
+    ]
+
+    crop_images, parts = workflow._crop_object_parts(
+        tabletop(), objects, None, workflow.CROP_ATLAS
+    )
+    prompt = workflow._build_steps_prompt(
+        "Tidy the table.", objects, crop_images, workflow.CROP_ATLAS
+    )
+
+    assert len(crop_images) == 2
+    assert len(parts) == 1
+    assert "a contact sheet (second attachment)" in prompt
+    assert "captioned with its label" in prompt
+    assert "cropped close-up images for each listed object" not in prompt
+    assert "3. lost fork — box_2d null" in prompt
+
+
+def test_atlas_mode_without_boxes_sends_no_attachment() -> None:
+    objects = [ObjectItem(label="lost fork", box_2d=None)]
+
+    crop_images, parts = workflow._crop_object_parts(
+        tabletop(), objects, None, workflow.CROP_ATLAS
+    )
+    prompt = workflow._build_steps_prompt(
+        "Tidy the table.", objects, crop_images, workflow.CROP_ATLAS
+    )
+
+    assert parts == []
+    assert "No cropped close-up images are available" in prompt
@@ -0,0 +1,161 @@
+import base64
+import dataclasses
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from backends import GeneratedImage
+from delta import PlanDelta, plan_delta
+from helpers import jpeg_base64, tabletop
+from shared import ObjectItem, OutputSchema, StepItem
+from workflow import WorkflowArtifacts, actionable_steps
+
+
+def step(text: str, label: str = "cup", done: bool = False) -> StepItem:
+    return StepItem(text=f"[DONE] {text}" if done else text, object_label=label)
+
+
+def plan(
+    steps: List[StepItem],
+    boxes: Optional[Dict[str, Tuple[int, int, int, int]]] = None,
+    goal: str = "Tidy the table.",
+) -> OutputSchema:
+    objects = [
+        ObjectItem(label=label, box_2d=box) for label, box in (boxes or {}).items()
+    ]
+    return OutputSchema(goal=goal, objects=objects, steps=steps)
+
+
+def apply(remaining: List[StepItem], delta: PlanDelta) -> List[StepItem]:
+    """What a client does with a delta, following the PlanDelta docstring."""
+    if delta.steps is not None:
+        return list(delta.steps)
+    dropped = set(delta.completed_steps) | set(delta.removed_steps)
+    updated = {update.index: update for update in delta.updated_steps}
+    result: List[StepItem] = []
+    for index, item in enumerate(remaining):
+        if index in dropped:
+            continue
+        update = updated.get(index)
+        if update is not None:
+            item = StepItem(
+                text=update.text if update.text is not None else item.text,
+                object_label=update.object_label
+                if update.object_label is not None
+                else item.object_label,
+            )
+        result.append(item)
+    return result + list(delta.added_steps)
+
+
+BOX: Tuple[int, int, int, int] = (10, 20, 30, 40)
+MOVED: Tuple[int, int, int, int] = (50, 60, 70, 80)
+
+
+def test_identical_plans_have_an_empty_delta() -> None:
+    base = plan([step("a"), step("b")], {"cup": BOX})
+
+    assert plan_delta(base, base) == PlanDelta()
+
+
+def test_completed_step_is_reported_by_remaining_index() -> None:
+    base = plan([step("a", done=True), step("b"), step("c")])
+    current = plan([step("a", done=True), step("b", done=True), step("c")])
+
+    delta = plan_delta(base, current)
+
+    assert delta.completed_steps == [0]
+    assert delta.steps is None
+
+
+def test_objects_are_diffed_by_label() -> None:
+    base = plan([], {"cup": BOX, "plate": BOX, "fork": BOX})
+    current = plan([], {"cup": BOX, "plate": MOVED, "spoon": BOX})
+
+    delta = plan_delta(base, current)
+
+    assert [obj.label for obj in delta.objects] == ["plate", "spoon"]
+    assert delta.removed_objects == ["fork"]
+
+
+def test_goal_is_only_sent_when_it_changed() -> None:
+    base = plan([step("a")])
+
+    assert plan_delta(base, base).goal is None
+    assert plan_delta(base, plan([step("a")], goal="Set the table.")).goal == (
+        "Set the table."
+    )
+
+
+def test_reopened_step_falls_back_to_the_full_list() -> None:
+    base = plan([step("a", done=True), step("b")])
+    current = plan([step("a"), step("b")])
+
+    delta = plan_delta(base, current)
+
+    assert delta.steps == actionable_steps(current.steps)
+    assert delta.completed_steps == []
+
+
+@pytest.mark.parametrize(
+    "base_steps, current_steps",
+    [
+        ([step("a"), step("b")], [step("a", done=True), step("b")]),
+        ([step("a"), step("b")], [step("a"), step("b, carefully")]),
+        ([step("a"), step("b")], [step("a"), step("b", label="plate")]),
+        ([step("a"), step("b")], [step("a")]),
+        ([step("a")], [step("a", done=True), step("new"), step("newer")]),
+        (
+            [step("a", done=True), step("b"), step("c"), step("d")],
+            [step("a", done=True), step("b", done=True), step("c2"), step("d")],
+        ),
+        ([step("a", done=True), step("b")], [step("a"), step("b")]),
+    ],
+)
+def test_applying_the_delta_yields_the_current_remaining_steps(
+    base_steps: List[StepItem], current_steps: List[StepItem]
+) -> None:
+    delta = plan_delta(plan(base_steps), plan(current_steps))
+
+    remaining = apply(actionable_steps(base_steps), delta)
+
+    assert remaining == actionable_steps(current_steps)
+
+
+def test_delta_images_report_added_unchanged_and_removed_artifacts(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    created = client.post("/goals", json={"image_base64": jpeg_base64(tabletop())})
+    goal_id = created.json()["id"]
+    first = server.artifact_store.get(goal_id, server.HIGHLIGHT_ARTIFACT, 1)
+    assert first is not None
+    assert server.artifact_store.get(goal_id, server.BANANA_ARTIFACT, 1) is not None
+
+    refresh_plan = server.refresh_plan_from_image_async
+    bananas: List[Optional[GeneratedImage]] = [None, GeneratedImage(b"new banana")]
+
+    async def refresh_with_artifacts(*args: Any) -> WorkflowArtifacts:
+        artifacts = await refresh_plan(*args)
+        return dataclasses.replace(
+            artifacts, highlight=first.image, banana=bananas.pop(0)
+        )
+
+    monkeypatch.setattr(server, "refresh_plan_from_image_async", refresh_with_artifacts)
+    removed = client.put(
+        f"/goals/{goal_id}?base_revision=1",
+        json={"image_base64": jpeg_base64(tabletop(turned=True))},
+    )
+    added = client.put(
+        f"/goals/{goal_id}?base_revision=2",
+        json={"image_base64": jpeg_base64(tabletop())},
+    )
+
+    assert removed.status_code == 200
+    assert removed.json()["revision"] == 2
+    assert removed.json()["images"] == {"banana": None}
+    assert added.status_code == 200
+    assert added.json()["images"] == {
+        "banana": base64.b64encode(b"new banana").decode("ascii")
+    }
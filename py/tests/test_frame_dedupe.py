@@ -0,0 +1,73 @@
+import base64
+from io import BytesIO
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+import server
+from frame_dedupe import FrameDedupeCache, hamming_distance, perceptual_hash
+from helpers import jpeg_base64, tabletop
+
+
+def test_near_identical_frames_hash_close_together() -> None:
+    frame = tabletop()
+    recompressed = Image.open(BytesIO(base64.b64decode(jpeg_base64(frame))))
+    turned = tabletop(turned=True)
+
+    assert hamming_distance(perceptual_hash(frame), perceptual_hash(recompressed)) <= 4
+    assert hamming_distance(perceptual_hash(frame), perceptual_hash(turned)) > 4
+
+
+def test_lookup_matches_within_distance_and_size() -> None:
+    cache: FrameDedupeCache[str] = FrameDedupeCache(max_distance=2)
+    cache.store("goal", 0b1111, (640, 480), "result")
+
+    assert cache.lookup("goal", 0b1100, (640, 480)) == "result"
+    assert cache.lookup("goal", 0b0000, (640, 480)) is None
+    assert cache.lookup("goal", 0b1111, (320, 240)) is None
+    assert cache.lookup("other", 0b1111, (640, 480)) is None
+
+
+def test_negative_distance_disables_reuse() -> None:
+    cache: FrameDedupeCache[str] = FrameDedupeCache(max_distance=-1)
+    cache.store("goal", 1, (640, 480), "result")
+
+    assert cache.lookup("goal", 1, (640, 480)) is None
+
+
+def test_least_recent_goal_is_evicted() -> None:
+    cache: FrameDedupeCache[str] = FrameDedupeCache(max_distance=0, max_goals=1)
+    cache.store("first", 1, (1, 1), "a")
+    cache.store("second", 1, (1, 1), "b")
+
+    assert cache.lookup("first", 1, (1, 1)) is None
+    assert cache.lookup("second", 1, (1, 1)) == "b"
+
+
+def test_repeated_frame_reuses_the_previous_update(client: TestClient) -> None:
+    payload = {"image_base64": jpeg_base64(tabletop())}
+    goal_id = client.post("/goals", json=payload).json()["id"]
+
+    first = client.put(f"/goals/{goal_id}", json=payload).json()
+    second = client.put(f"/goals/{goal_id}", json=payload).json()
+
+    assert first["reused"] is False
+    assert second["reused"] is True
+    assert second["revision"] == first["revision"]
+    assert second["plan"] == first["plan"]
+
+
+def test_newer_revision_invalidates_the_reused_result(client: TestClient) -> None:
+    payload = {"image_base64": jpeg_base64(tabletop())}
+    goal_id = client.post("/goals", json=payload).json()["id"]
+    first = client.put(f"/goals/{goal_id}", json=payload).json()
+
+    # Another request, or another worker, commits a newer plan for the goal.
+    record = server.goal_store.get(goal_id)
+    assert record is not None
+    server.goal_store.update(goal_id, record.plan, record.revision)
+
+    again = client.put(f"/goals/{goal_id}", json=payload).json()
+
+    assert again["reused"] is False
+    assert again["revision"] == first["revision"] + 2
@@ -0,0 +1,98 @@
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from goal_store import GoalNotFoundError, GoalStore, RevisionConflictError
+from helpers import jpeg_base64, tabletop
+from shared import OutputSchema, StepItem
+
+
+def plan(goal: str = "Tidy the table.", step: str = "Move the cup.") -> OutputSchema:
+    return OutputSchema(
+        goal=goal, objects=[], steps=[StepItem(text=step, object_label="cup")]
+    )
+
+
+def test_updates_advance_the_revision_and_keep_history(tmp_path: Path) -> None:
+    store = GoalStore(tmp_path / "goals.sqlite3")
+    store.create("goal", plan(step="first"))
+
+    updated = store.update("goal", plan(step="second"), expected_revision=1)
+
+    assert updated.revision == 2
+    assert [record.revision for record in store.history("goal")] == [1, 2]
+    first = store.revision("goal", 1)
+    assert first is not None and first.steps[0].text == "first"
+
+
+def test_stale_update_is_rejected(tmp_path: Path) -> None:
+    store = GoalStore(tmp_path / "goals.sqlite3")
+    store.create("goal", plan())
+    store.update("goal", plan(step="winner"), expected_revision=1)
+
+    with pytest.raises(RevisionConflictError) as conflict:
+        store.update("goal", plan(step="loser"), expected_revision=1)
+
+    assert (conflict.value.expected, conflict.value.actual) == (1, 2)
+    record = store.get("goal")
+    assert record is not None and record.plan.steps[0].text == "winner"
+    with pytest.raises(GoalNotFoundError):
+        store.update("missing", plan(), expected_revision=1)
+
+
+def test_cached_goal_sees_another_workers_commit(tmp_path: Path) -> None:
+    path = tmp_path / "goals.sqlite3"
+    worker_a = GoalStore(path)
+    worker_b = GoalStore(path)
+    worker_a.create("goal", plan(step="first"))
+    assert worker_b.get("goal") is not None
+
+    worker_a.update("goal", plan(step="second"), expected_revision=1)
+    record = worker_b.get("goal")
+
+    assert record is not None
+    assert record.revision == 2
+    assert record.plan.steps[0].text == "second"
+    worker_b.update("goal", plan(step="third"), expected_revision=record.revision)
+
+
+def test_list_goals_pages_newest_first(tmp_path: Path) -> None:
+    store = GoalStore(tmp_path / "goals.sqlite3")
+    for name in ("a", "b", "c"):
+        store.create(name, plan(goal=name))
+
+    first_page = store.list_goals(limit=2, order="created")
+    rest = store.list_goals(limit=2, order="created", before=first_page[-1].created_at)
+
+    assert [summary.id for summary in first_page] == ["c", "b"]
+    assert [summary.id for summary in rest] == ["a"]
+
+
+def test_concurrent_commit_answers_409(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    payload = {"image_base64": jpeg_base64(tabletop())}
+    goal_id = client.post("/goals", json=payload).json()["id"]
+    refresh = server.refresh_plan_from_image_async
+
+    async def refresh_while_another_worker_commits(*args: Any, **kwargs: Any) -> Any:
+        record = server.goal_store.get(goal_id)
+        assert record is not None
+        server.goal_store.update(goal_id, record.plan, record.revision)
+        return await refresh(*args, **kwargs)
+
+    monkeypatch.setattr(
+        server, "refresh_plan_from_image_async", refresh_while_another_worker_commits
+    )
+    response = client.put(
+        f"/goals/{goal_id}", json={"image_base64": jpeg_base64(tabletop(turned=True))}
+    )
+
+    assert response.status_code == 409
+    assert (
+        client.get(f"/goals/{goal_id}/revisions").json()["revisions"][-1]["revision"]
+        == 2
+    )
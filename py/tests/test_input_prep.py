@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+from io import BytesIO
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from helpers import tabletop
+from input_prep import (
+    LOSSLESS_INPUT_PROFILE,
+    decode_image,
+    encode_image,
+    resize_to_width,
+    source_size,
+)
+
+PY_DIR = Path(__file__).resolve().parent.parent
+
+
+def jpeg_bytes(width: int, height: int) -> bytes:
+    buffer = BytesIO()
+    tabletop(width, height).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def test_large_jpeg_is_draft_decoded_but_keeps_its_source_size() -> None:
+    image = decode_image(jpeg_bytes(4000, 3000), max_side=1600)
+
+    assert image.size == (2000, 1500)
+    assert source_size(image) == (4000, 3000)
+
+
+def test_draft_scale_never_goes_below_the_limit() -> None:
+    image = decode_image(jpeg_bytes(3000, 2000), max_side=1600)
+
+    assert max(image.size) >= 1600
+
+
+def test_small_or_lossless_frames_decode_at_full_size() -> None:
+    assert decode_image(jpeg_bytes(800, 600)).size == (800, 600)
+    assert decode_image(jpeg_bytes(4000, 3000), max_side=0).size == (4000, 3000)
+    png = encode_image(tabletop(2400, 1800), LOSSLESS_INPUT_PROFILE).data
+    assert decode_image(png, max_side=1600).size == (2400, 1800)
+
+
+def test_resize_keeps_the_aspect_ratio() -> None:
+    assert resize_to_width(Image.new("RGB", (4000, 3000)), 1000).size == (1000, 750)
+
+
+def test_boxes_are_in_upload_pixels_and_highlight_in_decoded_pixels(
+    client: TestClient,
+) -> None:
+    response = client.post(
+        "/goals/upload",
+        content=jpeg_bytes(3400, 2000),
+        headers={"Content-Type": "image/jpeg"},
+    ).json()
+    highlight = client.get(response["highlight_image_url"])
+
+    # Object 1 of the synthetic plan spans x 20..180 of 1000.
+    assert response["plan"]["objects"][0]["box_2d"][1] == 68
+    with Image.open(BytesIO(highlight.content)) as image:
+        assert image.width < 3400
+
+
+def test_unknown_input_format_fails_at_import() -> None:
+    result = subprocess.run(
+        [sys.executable, "-c", "import input_prep"],
+        cwd=PY_DIR,
+        env={**os.environ, "REALITYGUIDE_INPUT_FORMAT": "jpg"},
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode != 0
+    assert "ValueError: Unknown REALITYGUIDE_INPUT_FORMAT 'JPG'" in result.stderr
@@ -0,0 +1,216 @@
+import asyncio
+from typing import Any, List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from backends import GeneratedImage
+from helpers import jpeg_base64, tabletop
+from jobs import (
+    NO_RESULT_ERROR,
+    ArtifactJob,
+    ArtifactJobQueue,
+    JobStatus,
+    QueueFullError,
+)
+
+IMAGE = GeneratedImage(b"png bytes")
+
+
+async def finish(queue: ArtifactJobQueue, job: ArtifactJob) -> None:
+    # wait() returns on each status change; a job moves pending, running, done.
+    for _ in range(3):
+        await queue.wait(job, 1.0)
+
+
+def test_newer_job_supersedes_a_running_one() -> None:
+    async def run() -> None:
+        queue = ArtifactJobQueue(workers=1)
+        started = asyncio.Event()
+
+        async def slow() -> Optional[GeneratedImage]:
+            started.set()
+            await asyncio.sleep(10)
+            return IMAGE
+
+        async def fast() -> Optional[GeneratedImage]:
+            return IMAGE
+
+        first = queue.submit("goal", "banana", slow, revision=1)
+        await started.wait()
+        second = queue.submit("goal", "banana", fast, revision=2)
+        await finish(queue, second)
+
+        assert first.status is JobStatus.CANCELLED
+        assert second.status is JobStatus.DONE
+        assert second.result is IMAGE
+        assert queue.latest("goal", "banana") is second
+        await queue.shutdown()
+
+    asyncio.run(run())
+
+
+def test_superseded_pending_job_never_runs() -> None:
+    async def run() -> None:
+        queue = ArtifactJobQueue(workers=1)
+        calls: List[int] = []
+
+        async def work() -> Optional[GeneratedImage]:
+            calls.append(1)
+            return IMAGE
+
+        first = queue.submit("goal", "banana", work)
+        second = queue.submit("goal", "banana", work)
+        await finish(queue, second)
+
+        assert first.status is JobStatus.CANCELLED
+        assert second.status is JobStatus.DONE
+        assert len(calls) == 1
+        await queue.shutdown()
+
+    asyncio.run(run())
+
+
+def test_failed_and_empty_jobs_say_why() -> None:
+    async def run() -> None:
+        queue = ArtifactJobQueue(workers=2)
+
+        async def broken() -> Optional[GeneratedImage]:
+            raise RuntimeError("model unavailable")
+
+        async def empty() -> Optional[GeneratedImage]:
+            return None
+
+        failed = queue.submit("a", "banana", broken)
+        done = queue.submit("b", "banana", empty)
+        await finish(queue, failed)
+        await finish(queue, done)
+
+        assert failed.status is JobStatus.FAILED
+        assert failed.error == "model unavailable"
+        assert done.status is JobStatus.DONE
+        assert done.describe()["error"] == NO_RESULT_ERROR
+        await queue.shutdown()
+
+    asyncio.run(run())
+
+
+def test_full_queue_rejects_new_jobs() -> None:
+    async def run() -> None:
+        queue = ArtifactJobQueue(max_pending=1, workers=1)
+        gate = asyncio.Event()
+
+        async def blocked() -> Optional[GeneratedImage]:
+            await gate.wait()
+            return IMAGE
+
+        queue.submit("a", "banana", blocked)
+        await asyncio.sleep(0)
+        queue.submit("b", "banana", blocked)
+        with pytest.raises(QueueFullError):
+            queue.submit("c", "banana", blocked)
+        gate.set()
+        await queue.shutdown()
+
+    asyncio.run(run())
+
+
+def test_shutdown_stops_running_and_pending_jobs() -> None:
+    async def run() -> None:
+        queue = ArtifactJobQueue(workers=1)
+        started = asyncio.Event()
+        stopped: List[str] = []
+
+        async def slow() -> Optional[GeneratedImage]:
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            finally:
+                # Cleanup that still awaits must finish before shutdown returns.
+                await asyncio.sleep(0.01)
+                stopped.append("slow")
+            return IMAGE
+
+        running = queue.submit("a", "banana", slow)
+        await started.wait()
+        pending = queue.submit("b", "banana", slow)
+        await queue.shutdown()
+
+        assert stopped == ["slow"]
+        assert running.status is JobStatus.CANCELLED
+        assert pending.status is JobStatus.CANCELLED
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def slow_banana(monkeypatch: pytest.MonkeyPatch) -> GeneratedImage:
+    banana = GeneratedImage(b"deferred banana")
+
+    async def generate(*args: Any) -> Optional[GeneratedImage]:
+        await asyncio.sleep(0.3)
+        return banana
+
+    monkeypatch.setattr(server, "banana_image_async", generate)
+    return banana
+
+
+def test_latest_banana_waits_for_the_current_revision(
+    client: TestClient, slow_banana: GeneratedImage
+) -> None:
+    created = client.post(
+        "/goals?defer_banana=true", json={"image_base64": jpeg_base64(tabletop())}
+    ).json()
+    goal_id = created["id"]
+    assert created["banana_status"] == "pending"
+    first = client.get(f"/goals/{goal_id}/artifacts/banana?wait=5")
+    assert first.status_code == 200
+
+    updated = client.put(
+        f"/goals/{goal_id}?defer_banana=true",
+        json={"image_base64": jpeg_base64(tabletop(turned=True))},
+    ).json()
+    latest = client.get(f"/goals/{goal_id}/artifacts/banana")
+
+    assert latest.status_code == 202
+    assert latest.json()["revision"] == updated["revision"]
+    finished = client.get(f"/goals/{goal_id}/artifacts/banana?wait=5")
+    assert finished.status_code == 200
+    assert finished.content == slow_banana.data
+
+
+def test_banana_job_without_an_image_explains_the_404(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    async def no_image(*args: Any) -> Optional[GeneratedImage]:
+        return None
+
+    monkeypatch.setattr(server, "banana_image_async", no_image)
+    goal_id = client.post(
+        "/goals?defer_banana=true", json={"image_base64": jpeg_base64(tabletop())}
+    ).json()["id"]
+
+    response = client.get(f"/goals/{goal_id}/artifacts/banana?wait=5")
+
+    assert response.status_code == 404
+    assert response.json()["status"] == "done"
+    assert response.json()["error"] == NO_RESULT_ERROR
+
+
+def test_latest_banana_is_never_an_older_revision(
+    client: TestClient, slow_banana: GeneratedImage
+) -> None:
+    goal_id = client.post(
+        "/goals?defer_banana=true", json={"image_base64": jpeg_base64(tabletop())}
+    ).json()["id"]
+    assert client.get(f"/goals/{goal_id}/artifacts/banana?wait=5").status_code == 200
+
+    # A newer revision whose banana this worker has neither stored nor scheduled.
+    record = server.goal_store.get(goal_id)
+    assert record is not None
+    server.goal_store.update(goal_id, record.plan, record.revision)
+
+    assert client.get(f"/goals/{goal_id}/artifacts/banana").status_code == 404
+    pinned = client.get(f"/goals/{goal_id}/artifacts/banana?revision=1")
+    assert pinned.content == slow_banana.data
@@ -0,0 +1,156 @@
+import asyncio
+from pathlib import Path
+from typing import Any, List, Optional
+
+import pytest
+from google.genai import types
+from PIL import Image
+
+from backends import (
+    ModelBackend,
+    ModelRequest,
+    ModelResponse,
+    request_fingerprint,
+)
+from model_cache import CachingBackend, DiskTier, MemoryTier, ResponseCache
+
+
+class CountingBackend(ModelBackend):
+    def __init__(self, delay_s: float = 0.0, fail: bool = False) -> None:
+        self.delay_s = delay_s
+        self.fail = fail
+        self.calls: List[ModelRequest] = []
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        self.calls.append(request)
+        if self.fail:
+            raise RuntimeError("model failed")
+        return ModelResponse(text=f"answer {len(self.calls)}")
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        self.calls.append(request)
+        await asyncio.sleep(self.delay_s)
+        if self.fail:
+            raise RuntimeError("model failed")
+        return ModelResponse(text=f"answer {len(self.calls)}")
+
+
+def make_request(
+    prompt: str = "Plan the task.",
+    stage: str = "analysis",
+    model: str = "model-a",
+    temperature: float = 0.5,
+    image: Optional[Image.Image] = None,
+) -> ModelRequest:
+    contents: List[Any] = [image or Image.new("RGB", (4, 4), "white"), prompt]
+    return ModelRequest(
+        stage=stage,
+        model=model,
+        contents=contents,
+        config=types.GenerateContentConfig(temperature=temperature),
+    )
+
+
+def caching_backend(
+    inner: ModelBackend, disk: Optional[DiskTier] = None
+) -> CachingBackend:
+    return CachingBackend(inner, ResponseCache(MemoryTier(16, ttl_s=None), disk))
+
+
+def test_fingerprint_is_stable_for_equal_requests() -> None:
+    assert request_fingerprint(make_request()) == request_fingerprint(make_request())
+
+
+@pytest.mark.parametrize(
+    "changed",
+    [
+        make_request(prompt="Another prompt."),
+        make_request(stage="steps"),
+        make_request(model="model-b"),
+        make_request(temperature=0.9),
+        make_request(image=Image.new("RGB", (4, 4), "black")),
+    ],
+)
+def test_fingerprint_covers_every_request_field(changed: ModelRequest) -> None:
+    assert request_fingerprint(changed) != request_fingerprint(make_request())
+
+
+def test_repeated_request_is_served_from_memory() -> None:
+    inner = CountingBackend()
+    backend = caching_backend(inner)
+
+    first = backend.generate(make_request())
+    second = backend.generate(make_request())
+
+    assert second is first
+    assert len(inner.calls) == 1
+    stats = backend.cache.stats()
+    assert (stats.misses, stats.memory_hits, stats.stores) == (1, 1, 1)
+
+
+def test_different_requests_are_not_shared() -> None:
+    inner = CountingBackend()
+    backend = caching_backend(inner)
+
+    backend.generate(make_request())
+    backend.generate(make_request(prompt="Another prompt."))
+
+    assert len(inner.calls) == 2
+
+
+def test_memory_tier_evicts_least_recently_used() -> None:
+    tier = MemoryTier(max_entries=2, ttl_s=None)
+    tier.put("a", ModelResponse(text="a"))
+    tier.put("b", ModelResponse(text="b"))
+    tier.get("a")
+    tier.put("c", ModelResponse(text="c"))
+
+    assert tier.get("b") is None
+    assert tier.get("a") is not None
+    assert tier.evictions == 1
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path: Path) -> None:
+    inner = CountingBackend()
+    caching_backend(inner, DiskTier(tmp_path, 1 << 20, None)).generate(make_request())
+
+    reopened = caching_backend(inner, DiskTier(tmp_path, 1 << 20, None))
+    response = reopened.generate(make_request())
+
+    assert response.text == "answer 1"
+    assert len(inner.calls) == 1
+    assert reopened.cache.stats().disk_hits == 1
+
+
+def test_concurrent_identical_requests_share_one_call() -> None:
+    inner = CountingBackend(delay_s=0.05)
+    backend = caching_backend(inner)
+
+    async def run() -> List[ModelResponse]:
+        return await asyncio.gather(
+            *(backend.agenerate(make_request()) for _ in range(5))
+        )
+
+    responses = asyncio.run(run())
+
+    assert len(inner.calls) == 1
+    assert {response.text for response in responses} == {"answer 1"}
+    assert backend.cache.stats().inflight_joins == 4
+
+
+def test_failed_call_reaches_every_joiner_and_is_not_cached() -> None:
+    inner = CountingBackend(delay_s=0.05, fail=True)
+    backend = caching_backend(inner)
+
+    async def run() -> List[object]:
+        return await asyncio.gather(
+            *(backend.agenerate(make_request()) for _ in range(3)),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(run())
+
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert len(inner.calls) == 1
+    inner.fail = False
+    assert backend.generate(make_request()).text == "answer 2"
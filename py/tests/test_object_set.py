@@ -0,0 +1,166 @@
+import random
+from typing import Dict, List, Optional, Tuple
+
+import pytest
+from PIL import Image
+
+import workflow
+from shared import (
+    CompactCompletionSchema,
+    ObjectItem,
+    ObjectSet,
+    OutputSchema,
+    StepItem,
+    crop_objects,
+    find_object_by_label,
+    normalized_box_to_pixel_box,
+    normalized_box_to_pixels,
+    objects_with_pixel_boxes,
+)
+from workflow import actionable_steps, merge_objects_by_label
+
+LABELS = ["cup", " Cup", "plate", "PLATE ", "fork", "", "  "]
+SIZES = [(1, 1), (3, 7), (640, 480), (1001, 999)]
+
+
+def random_objects(rng: random.Random) -> List[ObjectItem]:
+    objects: List[ObjectItem] = []
+    for _ in range(rng.randint(0, 8)):
+        box: Optional[Tuple[int, int, int, int]] = None
+        if rng.random() < 0.8:
+            # Model boxes can be inverted, degenerate or outside 0..1000.
+            ymin, xmin, ymax, xmax = (rng.randint(-50, 1050) for _ in range(4))
+            box = (ymin, xmin, ymax, xmax)
+        objects.append(ObjectItem(label=rng.choice(LABELS), box_2d=box))
+    return objects
+
+
+def cases(count: int = 200) -> List[List[ObjectItem]]:
+    rng = random.Random(23)
+    return [random_objects(rng) for _ in range(count)]
+
+
+# The per-object code that ObjectSet replaced, kept here as the reference.
+
+
+def reference_pixel_objects(
+    objects: List[ObjectItem], width: int, height: int
+) -> List[ObjectItem]:
+    return [
+        ObjectItem(
+            label=obj.label,
+            box_2d=(
+                normalized_box_to_pixel_box(obj.box_2d, width, height)
+                if obj.box_2d is not None
+                else None
+            ),
+        )
+        for obj in objects
+    ]
+
+
+def reference_crop_boxes(
+    objects: List[ObjectItem], width: int, height: int
+) -> List[Tuple[str, Tuple[int, int, int, int]]]:
+    return [
+        (obj.label, normalized_box_to_pixels(obj.box_2d, width, height))
+        for obj in objects
+        if obj.box_2d is not None
+    ]
+
+
+def reference_merge(
+    reference_objects: List[ObjectItem], updated_objects: List[ObjectItem]
+) -> List[ObjectItem]:
+    lookup: Dict[str, ObjectItem] = {}
+    for obj in updated_objects:
+        key = obj.label.strip().lower()
+        if not key:
+            continue
+        lookup.setdefault(key, obj)
+    merged: List[ObjectItem] = []
+    for obj in reference_objects:
+        match = lookup.get(obj.label.strip().lower())
+        merged.append(
+            ObjectItem(label=obj.label, box_2d=match.box_2d if match else None)
+        )
+    return merged
+
+
+def reference_compact_objects(
+    existing: OutputSchema, updated_objects: List[ObjectItem]
+) -> List[ObjectItem]:
+    labels = {
+        step.object_label.strip().lower() for step in actionable_steps(existing.steps)
+    }
+    mentioned = {obj.label.strip().lower() for obj in updated_objects} - {""}
+    referenced = [
+        obj
+        for obj in existing.objects
+        if obj.label.strip().lower() in labels & mentioned
+    ]
+    boxes = {
+        obj.label: obj.box_2d for obj in reference_merge(referenced, updated_objects)
+    }
+    return [
+        ObjectItem(label=obj.label, box_2d=boxes.get(obj.label, obj.box_2d))
+        for obj in existing.objects
+    ]
+
+
+@pytest.mark.parametrize("width, height", SIZES)
+def test_pixel_boxes_match_per_object_conversion(width: int, height: int) -> None:
+    for objects in cases():
+        assert objects_with_pixel_boxes(objects, width, height) == (
+            reference_pixel_objects(objects, width, height)
+        )
+
+
+def test_crops_match_per_object_conversion() -> None:
+    image = Image.new("RGB", (37, 23))
+    for objects in cases(50):
+        crops = crop_objects(image, objects)
+        expected = reference_crop_boxes(objects, *image.size)
+
+        assert [obj.label for obj, _ in crops] == [label for label, _ in expected]
+        assert [crop.size for _, crop in crops] == [
+            (x_max - x_min, y_max - y_min)
+            for _, (x_min, y_min, x_max, y_max) in expected
+        ]
+
+
+def test_label_lookups_match_a_linear_scan() -> None:
+    for objects in cases():
+        object_set = ObjectSet.from_items(objects)
+        for label in LABELS + ["spoon"]:
+            expected = find_object_by_label(label, objects)
+            assert object_set.find(label) == expected
+
+
+def test_merge_matches_per_object_merge() -> None:
+    all_cases = cases()
+    for reference, updated in zip(all_cases, reversed(all_cases)):
+        assert merge_objects_by_label(reference, updated) == reference_merge(
+            reference, updated
+        )
+
+
+def test_compact_merge_boxes_match_per_object_merge() -> None:
+    rng = random.Random(12)
+    all_cases = cases()
+    for existing_objects, updated in zip(all_cases, reversed(all_cases)):
+        steps = [
+            StepItem(
+                text=f"[DONE] step {index}" if rng.random() < 0.3 else f"step {index}",
+                object_label=rng.choice(LABELS),
+            )
+            for index in range(rng.randint(0, 4))
+        ]
+        existing = OutputSchema(goal="Tidy.", objects=existing_objects, steps=steps)
+        completion = CompactCompletionSchema(objects=updated, steps=[])
+
+        merged = workflow._merge_completion(
+            existing, completion.model_dump_json(), workflow.COMPACT_COMPLETION
+        )
+
+        assert merged.objects == reference_compact_objects(existing, updated)
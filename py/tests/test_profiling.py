@@ -0,0 +1,76 @@
+import asyncio
+from typing import List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+
+import profiling
+from profiling import PROFILE_HEADER, RequestGate
+
+
+def test_exclusive_request_runs_alone() -> None:
+    async def run() -> None:
+        gate = RequestGate()
+        events: List[str] = []
+
+        async def request(name: str, exclusive: bool, delay_s: float) -> None:
+            async with gate.hold(exclusive):
+                events.append(f"{name} started")
+                await asyncio.sleep(delay_s)
+                events.append(f"{name} finished")
+
+        running = asyncio.create_task(request("running", False, 0.05))
+        await asyncio.sleep(0)
+        profiled = asyncio.create_task(request("profiled", True, 0.05))
+        await asyncio.sleep(0)
+        later = asyncio.create_task(request("later", False, 0.0))
+        await asyncio.gather(running, profiled, later)
+
+        assert events == [
+            "running started",
+            "running finished",
+            "profiled started",
+            "profiled finished",
+            "later started",
+            "later finished",
+        ]
+
+    asyncio.run(run())
+
+
+def test_cancelled_exclusive_waiter_lets_others_through() -> None:
+    async def run() -> None:
+        gate = RequestGate()
+
+        async def profiled_request() -> None:
+            async with gate.hold(exclusive=True):
+                pass
+
+        async with gate.hold(exclusive=False):
+            profiled = asyncio.create_task(profiled_request())
+            await asyncio.sleep(0)
+            profiled.cancel()
+            await asyncio.sleep(0)
+            async with asyncio.timeout(1.0):
+                async with gate.hold(exclusive=False):
+                    pass
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize(
+    "token, header, status",
+    [(None, None, 403), ("secret", None, 403), ("secret", "secret", 200)],
+)
+def test_profile_listing_always_needs_the_token(
+    client: TestClient,
+    monkeypatch: pytest.MonkeyPatch,
+    token: Optional[str],
+    header: Optional[str],
+    status: int,
+) -> None:
+    monkeypatch.setattr(profiling, "PROFILE_ALWAYS", True)
+    monkeypatch.setattr(profiling, "PROFILE_TOKEN", token)
+    headers = {PROFILE_HEADER: header} if header is not None else {}
+
+    assert client.get("/profiles", headers=headers).status_code == status
@@ -0,0 +1,49 @@
+import asyncio
+import json
+from typing import List, Tuple
+
+import pytest
+
+import server
+from server import WARM_UP_ATTEMPTS, WarmUpState
+
+
+@pytest.fixture
+def warm_up_state(monkeypatch: pytest.MonkeyPatch) -> WarmUpState:
+    state = WarmUpState(ready=False)
+    monkeypatch.setattr(server, "warm_up_state", state)
+    monkeypatch.setattr(server, "WARM_UP", True)
+    monkeypatch.setattr(server, "WARM_UP_RETRY_MAX_S", 0.0)
+    monkeypatch.setattr(server, "warm_up_configs", lambda: None)
+    return state
+
+
+def test_warm_up_serves_degraded_then_keeps_retrying(
+    warm_up_state: WarmUpState, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    seen: List[Tuple[bool, bool]] = []
+
+    async def flaky_backend() -> None:
+        seen.append((warm_up_state.ready, warm_up_state.degraded))
+        if len(seen) <= WARM_UP_ATTEMPTS:
+            raise ConnectionError("model service unreachable")
+
+    monkeypatch.setattr(server, "warm_up_backend", flaky_backend)
+    asyncio.run(server._warm_up())
+
+    assert seen == [(False, False)] * WARM_UP_ATTEMPTS + [(True, True)]
+    assert warm_up_state.ready and not warm_up_state.degraded
+    assert warm_up_state.error is None
+    assert warm_up_state.attempts == WARM_UP_ATTEMPTS + 1
+
+
+def test_ready_reports_a_degraded_warm_up(warm_up_state: WarmUpState) -> None:
+    assert server.readiness().status_code == 503
+
+    warm_up_state.ready = True
+    warm_up_state.degraded = True
+    warm_up_state.error = "ConnectionError: model service unreachable"
+    response = server.readiness()
+
+    assert response.status_code == 200
+    assert json.loads(bytes(response.body))["degraded"] is True
@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import deque
+from typing import List, Optional
+
+import pytest
+from google.genai import types
+
+import resilience
+from backends import ModelBackend, ModelRequest, ModelResponse
+from resilience import (
+    HEDGE_MIN_SAMPLES,
+    DeadlineExceededError,
+    ResilientBackend,
+    deadline_scope,
+)
+
+STAGE = "analysis"
+
+
+class ScriptedBackend(ModelBackend):
+    """Plays one outcome per call: an exception, a delay in seconds, or text."""
+
+    def __init__(self, *outcomes: object) -> None:
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        return self._answer(self._next())
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        outcome = self._next()
+        if isinstance(outcome, float):
+            await asyncio.sleep(outcome)
+            return ModelResponse(text=f"after {outcome}s")
+        return self._answer(outcome)
+
+    def _next(self) -> object:
+        self.calls += 1
+        return self.outcomes[min(self.calls, len(self.outcomes)) - 1]
+
+    def _answer(self, outcome: object) -> ModelResponse:
+        if isinstance(outcome, Exception):
+            raise outcome
+        return ModelResponse(text=outcome if isinstance(outcome, str) else None)
+
+
+def make_request() -> ModelRequest:
+    return ModelRequest(
+        stage=STAGE, model="model", contents=[], config=types.GenerateContentConfig()
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(resilience, "_backoff_s", lambda attempt: 0.0)
+
+
+def call(backend: ResilientBackend, budget_s: float = 5.0) -> ModelResponse:
+    async def run() -> ModelResponse:
+        with deadline_scope(budget_s):
+            return await backend.agenerate(make_request())
+
+    return asyncio.run(run())
+
+
+def test_transient_failures_are_retried() -> None:
+    inner = ScriptedBackend(ConnectionError("reset"), ConnectionError("reset"), "ok")
+    backend = ResilientBackend(inner, max_attempts=3)
+
+    assert call(backend).text == "ok"
+    assert backend.stats()["retries"] == 2
+    sync_backend = ResilientBackend(ScriptedBackend(ConnectionError("reset"), "ok"))
+    assert sync_backend.generate(make_request()).text == "ok"
+
+
+def test_other_errors_are_not_retried() -> None:
+    inner = ScriptedBackend(ValueError("bad schema"), "ok")
+
+    with pytest.raises(ValueError):
+        call(ResilientBackend(inner, max_attempts=3))
+    assert inner.calls == 1
+
+
+def test_empty_responses_are_retried_then_returned() -> None:
+    inner = ScriptedBackend(None)
+    backend = ResilientBackend(inner, max_attempts=2)
+
+    assert call(backend).text is None
+    assert inner.calls == 2
+
+
+def test_slow_attempts_are_cut_at_the_stage_budget() -> None:
+    inner = ScriptedBackend(1.0, 1.0, 0.0)
+    backend = ResilientBackend(inner, max_attempts=3, stage_budgets={STAGE: 0.05})
+
+    started = time.monotonic()
+    response = call(backend, budget_s=2.0)
+
+    assert response.text == "after 0.0s"
+    assert time.monotonic() - started < 0.5
+    assert backend.stats()["timeouts"] == 2
+
+
+def test_timeouts_past_the_last_attempt_raise_deadline_exceeded() -> None:
+    backend = ResilientBackend(
+        ScriptedBackend(1.0), max_attempts=2, stage_budgets={STAGE: 0.05}
+    )
+
+    with pytest.raises(DeadlineExceededError):
+        call(backend, budget_s=2.0)
+    assert backend.stats()["deadline_exceeded"] == 1
+
+
+def test_no_attempt_starts_after_the_deadline() -> None:
+    inner = ScriptedBackend("ok")
+
+    with pytest.raises(DeadlineExceededError):
+        call(ResilientBackend(inner), budget_s=0.0)
+    assert inner.calls == 0
+
+
+def hedging_backend(inner: ModelBackend, sample_s: float) -> ResilientBackend:
+    backend = ResilientBackend(inner, hedge_percentile=50, hedge_stages={STAGE})
+    # Seed the latency history that hedging needs before it starts.
+    backend._latencies[STAGE] = deque(
+        [sample_s] * HEDGE_MIN_SAMPLES, maxlen=resilience.LATENCY_SAMPLES
+    )
+    return backend
+
+
+def test_slow_call_is_hedged_and_the_first_answer_wins() -> None:
+    inner = ScriptedBackend(1.0, 0.0)
+    backend = hedging_backend(inner, sample_s=0.02)
+
+    response = call(backend)
+
+    assert response.text == "after 0.0s"
+    stats = backend.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+
+
+def test_fast_call_is_not_hedged() -> None:
+    inner = ScriptedBackend(0.0)
+    backend = hedging_backend(inner, sample_s=0.5)
+
+    call(backend)
+
+    assert inner.calls == 1
+    assert backend.stats()["hedges"] == 0
+
+
+def test_hedging_waits_for_enough_samples() -> None:
+    backend = ResilientBackend(
+        ScriptedBackend("ok"), hedge_percentile=50, hedge_stages={STAGE}
+    )
+    delays: List[Optional[float]] = []
+    for _ in range(HEDGE_MIN_SAMPLES + 1):
+        delays.append(backend._hedge_delay(STAGE))
+        call(backend)
+
+    assert delays[:-1] == [None] * HEDGE_MIN_SAMPLES
+    assert delays[-1] is not None
@@ -0,0 +1,201 @@
+import asyncio
+from typing import Iterator, List, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from google.genai import types
+
+import backends
+from backends import (
+    ModelBackend,
+    ModelRequest,
+    ModelResponse,
+    get_backend,
+    set_backend,
+)
+from helpers import jpeg_base64, tabletop
+from resilience import ResilientBackend, deadline_scope
+from scheduler import (
+    BACKGROUND_PRIORITY,
+    INTERACTIVE_PRIORITY,
+    PLANNING_PRIORITY,
+    LaneLimits,
+    ModelLane,
+    ScheduledBackend,
+    SchedulerOverloadedError,
+)
+
+
+class GatedBackend(ModelBackend):
+    def __init__(self) -> None:
+        self.gate = asyncio.Event()
+        self.started: List[str] = []
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        return ModelResponse(text=request.model)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        self.started.append(request.model)
+        if request.model == "slow":
+            await self.gate.wait()
+        return ModelResponse(text=request.model)
+
+
+class SleepyBackend(ModelBackend):
+    def __init__(self, delay_s: float) -> None:
+        self.delay_s = delay_s
+        self.calls = 0
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        return ModelResponse(text=request.model)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        self.calls += 1
+        await asyncio.sleep(self.delay_s)
+        return ModelResponse(text=request.model)
+
+
+def make_request(model: str, stage: str = "analysis") -> ModelRequest:
+    return ModelRequest(
+        stage=stage, model=model, contents=[], config=types.GenerateContentConfig()
+    )
+
+
+def test_waiting_calls_run_by_priority_then_arrival() -> None:
+    async def run() -> None:
+        lane = ModelLane("model", LaneLimits(concurrency=1, max_queued=8))
+        order: List[str] = []
+        await lane.acquire(PLANNING_PRIORITY)
+
+        async def call(name: str, priority: int) -> None:
+            await lane.acquire(priority)
+            order.append(name)
+            lane.release()
+
+        waiting = [
+            asyncio.create_task(call("banana", BACKGROUND_PRIORITY)),
+            asyncio.create_task(call("plan", PLANNING_PRIORITY)),
+            asyncio.create_task(call("refresh 1", INTERACTIVE_PRIORITY)),
+            asyncio.create_task(call("refresh 2", INTERACTIVE_PRIORITY)),
+        ]
+        await asyncio.sleep(0)
+        lane.release()
+        await asyncio.gather(*waiting)
+
+        assert order == ["refresh 1", "refresh 2", "plan", "banana"]
+        assert lane.stats().active == 0
+
+    asyncio.run(run())
+
+
+def test_full_queue_sheds_with_a_retry_estimate() -> None:
+    async def run() -> None:
+        lane = ModelLane("model", LaneLimits(concurrency=1, max_queued=1))
+        lane.finished(2.5, failed=False)
+        await lane.acquire(PLANNING_PRIORITY)
+        queued = asyncio.create_task(lane.acquire(PLANNING_PRIORITY))
+        await asyncio.sleep(0)
+
+        with pytest.raises(SchedulerOverloadedError) as overloaded:
+            await lane.acquire(INTERACTIVE_PRIORITY)
+
+        # One call queued ahead plus this one, at 2.5 s each on one slot.
+        assert overloaded.value.retry_after_s == 5.0
+        assert lane.stats().rejected == 1
+        lane.release()
+        await queued
+        lane.release()
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_gives_its_slot_back() -> None:
+    async def run() -> None:
+        lane = ModelLane("model", LaneLimits(concurrency=1, max_queued=8))
+        await lane.acquire(PLANNING_PRIORITY)
+        abandoned = asyncio.create_task(lane.acquire(PLANNING_PRIORITY))
+        await asyncio.sleep(0)
+        abandoned.cancel()
+        await asyncio.sleep(0)
+
+        lane.release()
+        await asyncio.wait_for(lane.acquire(PLANNING_PRIORITY), 1.0)
+
+        stats = lane.stats()
+        assert (stats.active, stats.queued) == (1, 0)
+
+    asyncio.run(run())
+
+
+def test_each_model_has_its_own_lane() -> None:
+    async def run() -> None:
+        inner = GatedBackend()
+        backend = ScheduledBackend(inner, default_limits=LaneLimits(concurrency=1))
+        slow = asyncio.create_task(backend.agenerate(make_request("slow")))
+        await asyncio.sleep(0)
+        queued = asyncio.create_task(backend.agenerate(make_request("slow")))
+
+        fast = await asyncio.wait_for(backend.agenerate(make_request("fast")), 1.0)
+
+        assert fast.text == "fast"
+        assert inner.started == ["slow", "fast"]
+        inner.gate.set()
+        await asyncio.gather(slow, queued)
+        assert {lane.model: lane.completed for lane in backend.stats()} == {
+            "slow": 2,
+            "fast": 1,
+        }
+
+    asyncio.run(run())
+
+
+@pytest.fixture
+def saturated_backend() -> Iterator[None]:
+    original = get_backend()
+    set_backend(
+        ScheduledBackend(
+            GatedBackend(), default_limits=LaneLimits(concurrency=0, max_queued=0)
+        )
+    )
+    yield
+    set_backend(original)
+
+
+def test_overloaded_model_answers_429(
+    client: TestClient, saturated_backend: None
+) -> None:
+    response = client.post("/goals", json={"image_base64": jpeg_base64(tabletop())})
+
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "5"
+
+
+def test_queue_wait_does_not_count_against_the_stage_timeout() -> None:
+    inner = SleepyBackend(0.1)
+    resilient = ResilientBackend(inner, stage_budgets={"analysis": 0.25})
+    backend = ScheduledBackend(resilient, default_limits=LaneLimits(concurrency=1))
+
+    async def run() -> List[ModelResponse]:
+        with deadline_scope(1.0):
+            # The last call queues for 0.2s, so queue plus call exceeds its
+            # 0.25s attempt timeout while the call itself does not.
+            return await asyncio.gather(
+                *(backend.agenerate(make_request("model")) for _ in range(3))
+            )
+
+    responses = asyncio.run(run())
+
+    assert [response.text for response in responses] == ["model"] * 3
+    assert inner.calls == 3
+    assert resilient.stats()["timeouts"] == 0
+
+
+def test_backend_chain_schedules_resilient_calls() -> None:
+    backend: Optional[ModelBackend] = backends._backend_from_env()
+    chain: List[type] = []
+    while backend is not None:
+        chain.append(type(backend))
+        inner = getattr(backend, "inner", None)
+        backend = inner if isinstance(inner, ModelBackend) else None
+
+    assert chain.index(ScheduledBackend) < chain.index(ResilientBackend)
@@ -0,0 +1,70 @@
+import base64
+from typing import Optional
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from serialization import ModelJSONResponse
+from server import GoalArtifactResponse, GoalResponse
+from shared import ObjectItem, OutputSchema, StepItem
+
+PLAN = OutputSchema(
+    goal='Tidy the "café" table.',
+    objects=[
+        ObjectItem(label="cup", box_2d=(10, 20, 30, 40)),
+        ObjectItem(label="plate", box_2d=None),
+    ],
+    steps=[StepItem(text="Move the cup\nto the sink ☕.", object_label="cup")],
+)
+
+
+def fastapi_body(model: BaseModel) -> bytes:
+    """The body FastAPI writes for a route with this response_model."""
+    return bytes(JSONResponse(jsonable_encoder(model)).body)
+
+
+@pytest.mark.parametrize(
+    "highlight, banana",
+    [(b"highlight png", b"banana png"), (b"highlight png", None), (None, None)],
+)
+def test_raw_strings_match_the_fastapi_encoding(
+    highlight: Optional[bytes], banana: Optional[bytes]
+) -> None:
+    highlight_b64 = base64.b64encode(highlight) if highlight is not None else None
+    banana_b64 = base64.b64encode(banana) if banana is not None else None
+    expected = GoalResponse(
+        id="goal",
+        revision=3,
+        plan=PLAN,
+        highlight_image_base64=highlight_b64.decode() if highlight_b64 else None,
+        banana_image_base64=banana_b64.decode() if banana_b64 else None,
+        reused=True,
+        banana_status="pending",
+    )
+    placeholder = expected.model_copy(
+        update={"highlight_image_base64": None, "banana_image_base64": None}
+    )
+
+    response = ModelJSONResponse(
+        placeholder,
+        raw_strings={
+            "highlight_image_base64": highlight_b64,
+            "banana_image_base64": banana_b64,
+        },
+    )
+
+    assert response.body == fastapi_body(expected)
+
+
+def test_model_without_raw_strings_matches_the_fastapi_encoding() -> None:
+    model = GoalArtifactResponse(
+        id="goal",
+        revision=1,
+        plan=PLAN,
+        highlight_image_url="/goals/goal/artifacts/highlight?revision=1",
+        banana_image_url=None,
+    )
+
+    assert ModelJSONResponse(model).body == fastapi_body(model)
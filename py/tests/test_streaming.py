@@ -0,0 +1,77 @@
+import json
+from typing import Any, AsyncIterator, Dict, List
+
+import pytest
+from fastapi.testclient import TestClient
+
+import server
+from helpers import jpeg_base64, tabletop
+from workflow import WorkflowEvent
+
+PAYLOAD = {"image_base64": jpeg_base64(tabletop())}
+
+
+def stream_events(
+    client: TestClient, url: str = "/goals/stream"
+) -> List[Dict[str, Any]]:
+    with client.stream("POST", url, json=PAYLOAD) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"] == server.NDJSON_MEDIA_TYPE
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+@pytest.mark.parametrize("plan_mode", ["two_pass", "fast"])
+def test_stream_sends_each_stage_then_done(client: TestClient, plan_mode: str) -> None:
+    events = stream_events(client, f"/goals/stream?plan_mode={plan_mode}")
+
+    assert [event["event"] for event in events] == [
+        "analysis",
+        "steps",
+        "highlight",
+        "banana",
+        "done",
+    ]
+    goal_id = events[0]["id"]
+    assert {event["id"] for event in events} == {goal_id}
+    assert events[0]["data"]["objects"]
+    assert events[1]["data"]["steps"]
+    assert events[2]["data"]["image_base64"]
+    assert events[3]["data"]["image_base64"]
+    done = events[-1]["data"]
+    assert done["revision"] == 1
+    stored = client.get(f"/goals/{goal_id}/revisions").json()["revisions"]
+    assert [revision["revision"] for revision in stored] == [1]
+
+
+def test_stream_as_server_sent_events(client: TestClient) -> None:
+    with client.stream(
+        "POST",
+        "/goals/stream",
+        json=PAYLOAD,
+        headers={"Accept": server.SSE_MEDIA_TYPE},
+    ) as response:
+        body = response.read().decode("utf-8")
+
+    assert response.headers["content-type"].startswith(server.SSE_MEDIA_TYPE)
+    blocks = [block for block in body.split("\n\n") if block]
+    assert [block.splitlines()[0] for block in blocks][-1] == "event: done"
+    assert all(block.splitlines()[1].startswith("data: {") for block in blocks)
+
+
+def test_failure_mid_stream_ends_with_an_error_event(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    stream_plan = server.stream_plan_from_image
+
+    async def failing_after_analysis(*args: Any) -> AsyncIterator[WorkflowEvent]:
+        async for event in stream_plan(*args):
+            yield event
+            raise RuntimeError("model went away")
+
+    monkeypatch.setattr(server, "stream_plan_from_image", failing_after_analysis)
+    events = stream_events(client)
+
+    assert [event["event"] for event in events] == ["analysis", "error"]
+    assert events[-1]["data"] == {"detail": "Plan generation failed."}
+    goal_id = events[-1]["id"]
+    assert client.get(f"/goals/{goal_id}/revisions").status_code == 404
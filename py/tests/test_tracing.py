@@ -0,0 +1,119 @@
+import re
+from typing import Dict, List
+
+from fastapi.testclient import TestClient
+
+from helpers import jpeg_base64, tabletop
+from tracing import METRICS_CONTENT_TYPE, Counter, Histogram
+
+SAMPLE = re.compile(r"^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{.*\})? (\S+)$")
+SERVER_TIMING_ENTRY = re.compile(r"^[a-z0-9_]+;dur=\d+\.\d$")
+
+
+def samples(text: str) -> Dict[str, float]:
+    """Parses Prometheus text exposition into {"name{labels}": value}."""
+    values: Dict[str, float] = {}
+    for line in text.splitlines():
+        if line.startswith("#"):
+            continue
+        match = SAMPLE.match(line)
+        assert match is not None, line
+        name, labels, value = match.groups()
+        values[name + (labels or "")] = float(value)
+    return values
+
+
+def scrape(client: TestClient) -> Dict[str, float]:
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    return samples(response.text)
+
+
+def timing_entries(header: str) -> List[str]:
+    return [entry.split(";")[0] for entry in header.split(", ")]
+
+
+def test_metrics_use_the_prometheus_text_format(client: TestClient) -> None:
+    client.get("/stats/cache")
+
+    response = client.get("/metrics")
+
+    assert response.headers["content-type"] == METRICS_CONTENT_TYPE
+    assert response.text.endswith("\n")
+    lines = response.text.splitlines()
+    for name, kind in (
+        ("realityguide_stage_seconds", "histogram"),
+        ("realityguide_request_seconds", "histogram"),
+        ("realityguide_model_tokens_total", "counter"),
+    ):
+        type_line = lines.index(f"# TYPE {name} {kind}")
+        assert lines[type_line - 1].startswith(f"# HELP {name} ")
+    assert samples(response.text)
+
+
+def test_request_and_stage_counters_go_up_after_a_request(client: TestClient) -> None:
+    request_count = (
+        'realityguide_request_seconds_count{method="POST",route="/goals",status="200"}'
+    )
+    stage_count = 'realityguide_stage_seconds_count{stage="analysis"}'
+    before = scrape(client)
+
+    response = client.post("/goals", json={"image_base64": jpeg_base64(tabletop())})
+    after = scrape(client)
+
+    assert response.status_code == 200
+    assert after[request_count] == before.get(request_count, 0.0) + 1
+    assert after[stage_count] == before.get(stage_count, 0.0) + 1
+    infinite = request_count.replace("_count{", "_bucket{").replace("}", ',le="+Inf"}')
+    assert after[infinite] == after[request_count]
+
+
+def test_responses_carry_a_server_timing_header(client: TestClient) -> None:
+    response = client.post("/goals", json={"image_base64": jpeg_base64(tabletop())})
+
+    entries = response.headers["server-timing"].split(", ")
+    assert all(SERVER_TIMING_ENTRY.match(entry) for entry in entries)
+    names = timing_entries(response.headers["server-timing"])
+    assert {"base64_decode", "analysis", "steps", "highlight"} <= set(names)
+    assert names[-1] == "total"
+    assert len(names) == len(set(names))
+
+
+def test_errors_and_unmatched_routes_are_timed(client: TestClient) -> None:
+    missing = client.get("/no-such-route")
+
+    assert missing.status_code == 404
+    assert timing_entries(missing.headers["server-timing"]) == ["total"]
+    unmatched = (
+        'realityguide_request_seconds_count{method="GET",route="unmatched",'
+        'status="404"}'
+    )
+    assert scrape(client)[unmatched] >= 1
+
+
+def test_histogram_buckets_are_cumulative() -> None:
+    histogram = Histogram("test_seconds", "Test.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="a")
+
+    values = samples("\n".join(histogram.render()))
+
+    assert values == {
+        'test_seconds_bucket{stage="a",le="0.1"}': 1,
+        'test_seconds_bucket{stage="a",le="1.0"}': 2,
+        'test_seconds_bucket{stage="a",le="+Inf"}': 3,
+        'test_seconds_sum{stage="a"}': 5.55,
+        'test_seconds_count{stage="a"}': 3,
+    }
+
+
+def test_counter_labels_are_sorted_and_escaped() -> None:
+    counter = Counter("test_total", "Test.")
+    counter.inc(2, stage="a", model='say "hi"\n')
+    counter.inc(3, model='say "hi"\n', stage="a")
+
+    assert counter.render() == [
+        "# HELP test_total Test.",
+        "# TYPE test_total counter",
+        'test_total{model="say \\"hi\\"\\n",stage="a"} 5.0',
+    ]
@@ -0,0 +1,61 @@
+import base64
+from io import BytesIO
+from typing import Any, Dict
+
+import pytest
+from fastapi.testclient import TestClient
+
+from helpers import jpeg_base64, tabletop
+
+
+def jpeg_bytes() -> bytes:
+    return base64.b64decode(jpeg_base64(tabletop()))
+
+
+def test_multipart_upload_creates_a_goal_with_artifact_urls(
+    client: TestClient,
+) -> None:
+    response = client.post(
+        "/goals/upload",
+        files={"image": ("frame.jpg", BytesIO(jpeg_bytes()), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["revision"] == 1
+    assert "highlight_image_base64" not in body
+    highlight = client.get(body["highlight_image_url"])
+    assert highlight.status_code == 200
+    assert highlight.headers["content-type"] == "image/png"
+
+
+def test_multipart_upload_updates_a_goal(client: TestClient) -> None:
+    goal_id = client.post(
+        "/goals/upload", content=jpeg_bytes(), headers={"Content-Type": "image/jpeg"}
+    ).json()["id"]
+
+    response = client.put(
+        f"/goals/{goal_id}/upload",
+        files={"image": ("frame.jpg", BytesIO(jpeg_bytes()), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    assert response.json()["id"] == goal_id
+
+
+@pytest.mark.parametrize(
+    "request_kwargs, status",
+    [
+        ({"content": b"{}", "headers": {"Content-Type": "application/json"}}, 415),
+        ({"content": b"", "headers": {"Content-Type": "image/jpeg"}}, 400),
+        ({"files": {"image": ("frame.jpg", BytesIO(b""), "image/jpeg")}}, 400),
+        ({"files": {"photo": ("frame.jpg", BytesIO(b"x"), "image/jpeg")}}, 400),
+        ({"content": b"not a jpeg", "headers": {"Content-Type": "image/jpeg"}}, 400),
+    ],
+)
+def test_bad_uploads_are_rejected(
+    client: TestClient, request_kwargs: Dict[str, Any], status: int
+) -> None:
+    response = client.post("/goals/upload", **request_kwargs)
+
+    assert response.status_code == status
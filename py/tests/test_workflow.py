@@ -0,0 +1,223 @@
+import asyncio
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from pydantic import ValidationError
+
+import workflow
+from backends import ModelBackend, ModelRequest, ModelResponse
+from delta import PlanDelta, plan_delta
+from helpers import tabletop
+from shared import (
+    AnalysisSchema,
+    CompactCompletionSchema,
+    ObjectItem,
+    OutputSchema,
+    StepItem,
+    StepStatusItem,
+    StepsSchema,
+)
+
+PY_DIR = Path(__file__).resolve().parent.parent
+
+
+def existing_plan() -> OutputSchema:
+    return OutputSchema(
+        goal="Tidy the table.",
+        objects=[
+            ObjectItem(label="cup", box_2d=(10, 10, 20, 20)),
+            ObjectItem(label="plate", box_2d=(30, 30, 40, 40)),
+            ObjectItem(label="fork", box_2d=(50, 50, 60, 60)),
+        ],
+        steps=[
+            StepItem(text="[DONE] Move the fork to the drawer.", object_label="fork"),
+            StepItem(text="Move the cup to the sink.", object_label="cup"),
+            StepItem(text="Stack the plate.", object_label="plate"),
+        ],
+    )
+
+
+class FixedBackend(ModelBackend):
+    """Answers every request with the same text."""
+
+    def __init__(self, text: Optional[str]) -> None:
+        self.text = text
+        self.stages: List[str] = []
+
+    def generate(self, request: ModelRequest) -> ModelResponse:
+        self.stages.append(request.stage)
+        return ModelResponse(text=self.text)
+
+    async def agenerate(self, request: ModelRequest) -> ModelResponse:
+        return self.generate(request)
+
+
+def merge(completion: CompactCompletionSchema) -> OutputSchema:
+    return workflow._merge_completion(
+        existing_plan(), completion.model_dump_json(), workflow.COMPACT_COMPLETION
+    )
+
+
+def test_compact_merge_applies_statuses_by_remaining_number() -> None:
+    merged = merge(
+        CompactCompletionSchema(
+            objects=[],
+            steps=[
+                StepStatusItem(id=1, done=True),
+                StepStatusItem(id=2, done=False, text="Stack the plate on the tray."),
+            ],
+            new_steps=[StepItem(text="Wipe the table.", object_label="table")],
+        )
+    )
+
+    assert [step.text for step in merged.steps] == [
+        "[DONE] Move the fork to the drawer.",
+        "[DONE] Move the cup to the sink.",
+        "Stack the plate on the tray.",
+        "Wipe the table.",
+    ]
+    assert merged.goal == "Tidy the table."
+
+
+def test_compact_merge_keeps_steps_it_was_not_told_about() -> None:
+    merged = merge(CompactCompletionSchema(objects=[], steps=[]))
+
+    assert merged.steps == existing_plan().steps
+
+
+def test_compact_merge_only_updates_boxes_of_referenced_objects() -> None:
+    merged = merge(
+        CompactCompletionSchema(
+            objects=[
+                ObjectItem(label="Cup", box_2d=(11, 11, 21, 21)),
+                ObjectItem(label="fork", box_2d=(70, 70, 80, 80)),
+            ],
+            steps=[],
+        )
+    )
+    boxes = {obj.label: obj.box_2d for obj in merged.objects}
+
+    assert boxes == {
+        "cup": (11, 11, 21, 21),
+        "plate": (30, 30, 40, 40),
+        "fork": (50, 50, 60, 60),
+    }
+
+
+def test_compact_merge_hides_objects_reported_as_not_visible() -> None:
+    merged = merge(
+        CompactCompletionSchema(
+            objects=[ObjectItem(label="plate", box_2d=None)], steps=[]
+        )
+    )
+    boxes = {obj.label: obj.box_2d for obj in merged.objects}
+
+    assert boxes["plate"] is None
+    assert boxes["cup"] == (10, 10, 20, 20)
+
+
+def test_compact_merge_leaves_an_unchanged_plan_identical() -> None:
+    merged = merge(CompactCompletionSchema(objects=[], steps=[]))
+
+    assert merged == existing_plan()
+    assert plan_delta(existing_plan(), merged) == PlanDelta()
+
+
+@pytest.mark.parametrize(
+    "name, value",
+    [
+        ("REALITYGUIDE_COMPLETION_MODE", "compcat"),
+        ("REALITYGUIDE_CROP_MODE", "atlass"),
+        ("REALITYGUIDE_PLAN_MODE", "quick"),
+    ],
+)
+def test_unknown_mode_setting_fails_at_import(name: str, value: str) -> None:
+    result = subprocess.run(
+        [sys.executable, "-c", "import workflow"],
+        cwd=PY_DIR,
+        env={**os.environ, name: value},
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.returncode != 0
+    assert f"Unknown {name} '{value}'" in result.stderr
+
+
+def test_mode_settings_ignore_case_and_spaces() -> None:
+    result = subprocess.run(
+        [sys.executable, "-c", "import workflow; print(workflow.DEFAULT_PLAN_MODE)"],
+        cwd=PY_DIR,
+        env={**os.environ, "REALITYGUIDE_PLAN_MODE": " FAST "},
+        capture_output=True,
+        text=True,
+    )
+
+    assert result.stdout.strip() == workflow.FAST_PLANNING
+
+
+def test_fast_plan_response_is_parsed_into_the_output_schema() -> None:
+    plan = workflow._parse_plan(existing_plan().model_dump_json())
+
+    assert plan == existing_plan()
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "not json",
+        # A response cut off mid-stream.
+        existing_plan().model_dump_json()[:-20],
+        # Two-pass answers are not a whole plan.
+        AnalysisSchema(goal="Tidy.", objects=[]).model_dump_json(),
+        StepsSchema(goal="Tidy.", steps=[]).model_dump_json(),
+        '{"goal": "Tidy.", "objects": [{"label": "cup", "box_2d": [1, 2]}], '
+        '"steps": []}',
+        '{"goal": "Tidy.", "objects": [], "steps": [{"text": "Wipe."}]}',
+    ],
+)
+def test_malformed_or_partial_fast_plans_are_rejected(text: str) -> None:
+    with pytest.raises(ValidationError):
+        workflow._parse_plan(text)
+
+
+def test_empty_fast_plan_response_is_reported() -> None:
+    with pytest.raises(RuntimeError, match="Plan model did not return any content"):
+        workflow._parse_plan(None)
+
+
+def test_fast_plan_stream_fails_before_any_event_on_a_partial_response(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    backend = FixedBackend('{"goal": "Tidy.", "objects": []}')
+    monkeypatch.setattr(workflow, "get_backend", lambda: backend)
+    options = workflow.WorkflowOptions(
+        generate_banana=False, plan_mode=workflow.FAST_PLANNING
+    )
+
+    async def stages() -> List[str]:
+        events = workflow.stream_plan_from_image(tabletop(), options)
+        return [event.stage async for event in events]
+
+    with pytest.raises(ValidationError):
+        asyncio.run(stages())
+    assert backend.stages == [workflow.PLAN_STAGE]
+
+
+def test_fast_plan_makes_a_single_model_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    backend = FixedBackend(existing_plan().model_dump_json())
+    monkeypatch.setattr(workflow, "get_backend", lambda: backend)
+    options = workflow.WorkflowOptions(
+        generate_banana=False, plan_mode=workflow.FAST_PLANNING
+    )
+
+    artifacts = workflow.generate_plan_from_image(tabletop(), options)
+
+    assert backend.stages == [workflow.PLAN_STAGE]
+    assert artifacts.output == existing_plan()
+    assert artifacts.highlight is not None
@@ -0,0 +1,233 @@
+import functools
+import inspect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+LATENCY_BUCKETS_S = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+@dataclass
+class _Series:
+    counts: List[int]
+    total: float = 0.0
+    count: int = 0
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS_S
+    ) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[Labels, _Series] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series([0] * len(self.buckets))
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series.counts[index] += 1
+            series.total += value
+            series.count += 1
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series.counts):
+                    bucket_labels = _format_labels(key + (("le", repr(bound)),))
+                    lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+                labels = _format_labels(key + (("le", "+Inf"),))
+                lines.append(f"{self.name}_bucket{labels} {series.count}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series.total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series.count}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+STAGE_SECONDS = Histogram(
+    "realityguide_stage_seconds", "Wall time of each pipeline stage."
+)
+REQUEST_SECONDS = Histogram(
+    "realityguide_request_seconds", "Wall time of each HTTP request."
+)
+MODEL_TOKENS = Counter(
+    "realityguide_model_tokens_total", "Tokens reported by the model, by kind."
+)
+METRICS = (STAGE_SECONDS, REQUEST_SECONDS, MODEL_TOKENS)
+
+
+@dataclass
+class RequestTrace:
+    """Stage timings of one HTTP request, reported in its Server-Timing header."""
+
+    started: float = field(default_factory=time.perf_counter)
+    spans: List[Tuple[str, float]] = field(default_factory=list)
+    open: bool = True
+
+    def server_timing(self) -> str:
+        totals: Dict[str, float] = {}
+        for name, duration_s in self.spans:
+            totals[name] = totals.get(name, 0.0) + duration_s
+        totals["total"] = time.perf_counter() - self.started
+        return ", ".join(
+            f"{name};dur={duration_s * 1000.0:.1f}"
+            for name, duration_s in totals.items()
+        )
+
+
+_trace: ContextVar[Optional[RequestTrace]] = ContextVar(
+    "realityguide_trace", default=None
+)
+
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration_s = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration_s, stage=stage)
+        trace = _trace.get()
+        # Work that outlives its request (background jobs) keeps the request's
+        # context; only the open trace should collect spans.
+        if trace is not None and trace.open:
+            trace.spans.append((stage, duration_s))
+
+
+def traced(stage: str) -> Callable[[F], F]:
+    """Decorator form of stage_timer, for sync and async functions."""
+
+    def decorate(func: F) -> F:
+        if inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def record_token_usage(model: str, stage: str, usage: Dict[str, Optional[int]]) -> None:
+    for kind, tokens in usage.items():
+        if tokens:
+            MODEL_TOKENS.inc(tokens, model=model, stage=stage, kind=kind)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class TracingMiddleware:
+    """ASGI middleware that times requests and adds a Server-Timing header."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Any, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+        token = _trace.set(trace)
+        status = 500
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append(
+                    (b"server-timing", trace.server_timing().encode("latin-1"))
+                )
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            trace.open = False
+            _trace.reset(token)
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - trace.started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=str(status),
+            )
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    body = ",".join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return "{" + body + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,157 +1,409 @@
+import os
 from dataclasses import dataclass
+from functools import cache
 from pathlib import Path
-from typing import Dict, List, Optional, Sequence
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
-from google.genai import types
 from PIL import Image
 
+from backends import (
+    ANALYSIS_STAGE,
+    BANANA_STAGE,
+    COMPACT_COMPLETION_STAGE,
+    COMPLETION_STAGE,
+    PLAN_STAGE,
+    STEPS_STAGE,
+    GeneratedImage,
+    ModelRequest,
+    get_backend,
+)
+from input_prep import (
+    PHOTO_INPUT_PROFILE,
+    PreparedImage,
+    encode_image,
+    prepare_image,
+)
 from shared import (
     AnalysisSchema,
     BANANA_OUTPUT_PATH,
     CONTINUATION_BANANA_PATH,
     CONTINUATION_HIGHLIGHT_PATH,
+    CompactCompletionSchema,
     FIRST_STEP_HIGHLIGHT_PATH,
     OBJECT_CROP_DIR,
     ObjectItem,
+    ObjectSet,
     OutputSchema,
     StepItem,
     StepsSchema,
-    banana,
-    client,
-    crop_and_save_objects,
-    highlight_first_step,
-    resize_image,
-    resize_images,
+    annotate_first_step,
+    banana_image,
+    banana_image_async,
+    build_crop_atlas,
+    crop_objects,
+    encode_png_image,
+    normalize_label,
+    run_cpu_bound,
+    save_image_bytes,
+    save_object_crops,
+)
+from serialization import json_schema
+from tracing import traced
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+ROBOTICS_MODEL = "gemini-robotics-er-1.5-preview"
+ROBOTICS_INPUT_PROFILE = PHOTO_INPUT_PROFILE
+HIGHLIGHT_EVENT = "highlight"
+DONE_EVENT = "done"
+DONE_PREFIX = "[DONE]"
+FULL_COMPLETION = "full"
+COMPACT_COMPLETION = "compact"
+COMPLETION_MODES = (FULL_COMPLETION, COMPACT_COMPLETION)
+SEPARATE_CROPS = "separate"
+CROP_ATLAS = "atlas"
+CROP_MODES = (SEPARATE_CROPS, CROP_ATLAS)
+TWO_PASS_PLANNING = "two_pass"
+FAST_PLANNING = "fast"
+PLAN_MODES = (TWO_PASS_PLANNING, FAST_PLANNING)
+
+
+def _mode_from_env(name: str, default: str, modes: Tuple[str, ...]) -> str:
+    """Reads a mode setting, refusing values that would fall back to the default."""
+    mode = os.environ.get(name, default).strip().lower()
+    if mode not in modes:
+        raise RuntimeError(f"Unknown {name} '{mode}', expected one of {modes}.")
+    return mode
+
+
+DEFAULT_COMPLETION_MODE = _mode_from_env(
+    "REALITYGUIDE_COMPLETION_MODE", FULL_COMPLETION, COMPLETION_MODES
+)
+DEFAULT_CROP_MODE = _mode_from_env("REALITYGUIDE_CROP_MODE", SEPARATE_CROPS, CROP_MODES)
+DEFAULT_PLAN_MODE = _mode_from_env(
+    "REALITYGUIDE_PLAN_MODE", TWO_PASS_PLANNING, PLAN_MODES
+)
+
+
+@dataclass
+class ArtifactPaths:
+    """Optional disk sink for workflow artifacts; a None entry is not written."""
+
+    highlight: Optional[Path] = None
+    banana: Optional[Path] = None
+    crops_dir: Optional[Path] = None
+
+
+PLAN_ARTIFACT_PATHS = ArtifactPaths(
+    highlight=FIRST_STEP_HIGHLIGHT_PATH,
+    banana=BANANA_OUTPUT_PATH,
+    crops_dir=OBJECT_CROP_DIR,
+)
+REFRESH_ARTIFACT_PATHS = ArtifactPaths(
+    highlight=CONTINUATION_HIGHLIGHT_PATH, banana=CONTINUATION_BANANA_PATH
 )
 
 
 @dataclass
 class WorkflowArtifacts:
-    """Represents the structured output plus any generated imagery paths."""
+    """Represents the structured output plus the generated imagery.
+
+    highlight and banana hold encoded image bytes; highlight_image is the decoded
+    annotated frame that banana generation starts from. The paths are only set
+    when the run was asked to save its artifacts to disk.
+    """
 
     output: OutputSchema
-    highlight_path: Optional[Path]
-    banana_path: Optional[Path]
+    highlight: Optional[GeneratedImage]
+    banana: Optional[GeneratedImage]
+    highlight_image: Optional[Image.Image] = None
+    highlight_path: Optional[Path] = None
+    banana_path: Optional[Path] = None
+
+
+@dataclass
+class WorkflowOptions:
+    """Per-call switches for the planning workflows.
+
+    completion_mode selects the continuation prompt: FULL_COMPLETION re-sends the
+    whole plan and asks for a complete OutputSchema, COMPACT_COMPLETION only sends
+    the unfinished steps and asks for their status changes. crop_mode selects how
+    object close-ups reach the steps call: SEPARATE_CROPS attaches one image per
+    object, CROP_ATLAS packs them into a single captioned contact sheet.
+    plan_mode selects the initial planning: TWO_PASS_PLANNING runs the analysis
+    call and then the steps call with object crops, FAST_PLANNING asks for the
+    whole OutputSchema in one call without crops.
+    """
+
+    generate_banana: bool = True
+    save_to: Optional[ArtifactPaths] = None
+    completion_mode: str = DEFAULT_COMPLETION_MODE
+    crop_mode: str = DEFAULT_CROP_MODE
+    plan_mode: str = DEFAULT_PLAN_MODE
+
+
+@dataclass
+class WorkflowEvent:
+    """A stage result emitted by the streaming workflows as soon as it is available.
+
+    The payload is the stage's schema (AnalysisSchema, StepsSchema or OutputSchema),
+    the encoded highlight or banana GeneratedImage, or the final WorkflowArtifacts
+    for DONE_EVENT.
+    """
+
+    stage: str
+    payload: Any
 
 
-def generate_plan_from_image(image: Image.Image) -> WorkflowArtifacts:
+def generate_plan_from_image(
+    image: Image.Image, options: Optional[WorkflowOptions] = None
+) -> WorkflowArtifacts:
+    options = options or WorkflowOptions()
     original_image = image.copy()
-    analysis_image = resize_image(original_image)
-
-    analysis_text = client.models.generate_content(
-        model="gemini-robotics-er-1.5-preview",
-        contents=[analysis_image, ANALYSIS_PROMPT],
-        config=types.GenerateContentConfig(
-            temperature=0.5,
-            thinking_config=types.ThinkingConfig(thinking_budget=-1),
-            response_mime_type="application/json",
-            response_json_schema=AnalysisSchema.model_json_schema(),
-        ),
-    ).text
+    analysis_input = prepare_image(original_image, ROBOTICS_INPUT_PROFILE)
+
+    if _check_plan_mode(options.plan_mode) == FAST_PLANNING:
+        plan_text = get_backend().generate(_plan_request(analysis_input.part)).text
+        output = _parse_plan(plan_text)
+    else:
+        analysis_text = (
+            get_backend().generate(_analysis_request(analysis_input.part)).text
+        )
+        analysis = _parse_analysis(analysis_text)
 
-    if analysis_text is None:
-        raise RuntimeError("Analysis model did not return any content.")
+        crop_dir = options.save_to.crops_dir if options.save_to is not None else None
+        crop_images, crop_parts = _crop_object_parts(
+            original_image, analysis.objects, crop_dir, options.crop_mode
+        )
 
-    analysis = AnalysisSchema.model_validate_json(analysis_text)
+        steps_prompt = _build_steps_prompt(
+            analysis.goal, analysis.objects, crop_images, options.crop_mode
+        )
+        step_contents = [analysis_input.part, *crop_parts, steps_prompt]
+
+        steps_text = get_backend().generate(_steps_request(step_contents)).text
+        steps = _parse_steps(steps_text)
+        output = OutputSchema(
+            goal=steps.goal, objects=analysis.objects, steps=steps.steps
+        )
 
-    cropped_assets = crop_and_save_objects(
-        original_image, analysis.objects, OBJECT_CROP_DIR
+    highlight_image, highlight = _highlight_first_step(
+        original_image, output.objects, output.steps
     )
-    crop_images = [asset[1] for asset in cropped_assets]
-    resized_crop_images = resize_images(crop_images)
-
-    steps_prompt = _build_steps_prompt(analysis.goal, analysis.objects, crop_images)
-    step_contents = [analysis_image, *resized_crop_images, steps_prompt]
-
-    steps_text = client.models.generate_content(
-        model="gemini-robotics-er-1.5-preview",
-        contents=step_contents,
-        config=types.GenerateContentConfig(
-            temperature=0.5,
-            thinking_config=types.ThinkingConfig(thinking_budget=-1),
-            response_mime_type="application/json",
-            response_json_schema=StepsSchema.model_json_schema(),
+    banana = (
+        _generate_banana_image(output.steps, highlight_image)
+        if options.generate_banana
+        else None
+    )
+
+    return save_artifacts(
+        WorkflowArtifacts(
+            output=output,
+            highlight=highlight,
+            banana=banana,
+            highlight_image=highlight_image,
         ),
-    ).text
+        options.save_to,
+    )
 
-    if steps_text is None:
-        raise RuntimeError("Steps model did not return any content.")
 
-    steps = StepsSchema.model_validate_json(steps_text)
+async def generate_plan_from_image_async(
+    image: Image.Image, options: Optional[WorkflowOptions] = None
+) -> WorkflowArtifacts:
+    return await collect_artifacts(stream_plan_from_image(image, options))
 
-    highlight_path = highlight_first_step(
-        original_image, analysis.objects, steps.steps, FIRST_STEP_HIGHLIGHT_PATH
-    )
-    banana_path = _generate_banana_asset(
-        steps.steps, highlight_path, BANANA_OUTPUT_PATH
+
+async def stream_plan_from_image(
+    image: Image.Image, options: Optional[WorkflowOptions] = None
+) -> AsyncIterator[WorkflowEvent]:
+    options = options or WorkflowOptions()
+    original_image = await run_cpu_bound(image.copy)
+    analysis_input = await run_cpu_bound(
+        prepare_image, original_image, ROBOTICS_INPUT_PROFILE
     )
 
-    output = OutputSchema(
-        goal=steps.goal,
-        objects=analysis.objects,
-        steps=steps.steps,
+    if _check_plan_mode(options.plan_mode) == FAST_PLANNING:
+        response = await get_backend().agenerate(_plan_request(analysis_input.part))
+        output = _parse_plan(response.text)
+        # Same events as the two-pass mode, so streaming clients need no changes.
+        yield WorkflowEvent(
+            ANALYSIS_STAGE, AnalysisSchema(goal=output.goal, objects=output.objects)
+        )
+        yield WorkflowEvent(
+            STEPS_STAGE, StepsSchema(goal=output.goal, steps=output.steps)
+        )
+    else:
+        response = await get_backend().agenerate(_analysis_request(analysis_input.part))
+        analysis = _parse_analysis(response.text)
+        yield WorkflowEvent(ANALYSIS_STAGE, analysis)
+
+        crop_dir = options.save_to.crops_dir if options.save_to is not None else None
+        crop_images, crop_parts = await run_cpu_bound(
+            _crop_object_parts,
+            original_image,
+            analysis.objects,
+            crop_dir,
+            options.crop_mode,
+        )
+
+        steps_prompt = _build_steps_prompt(
+            analysis.goal, analysis.objects, crop_images, options.crop_mode
+        )
+        response = await get_backend().agenerate(
+            _steps_request([analysis_input.part, *crop_parts, steps_prompt])
+        )
+        steps = _parse_steps(response.text)
+        yield WorkflowEvent(STEPS_STAGE, steps)
+        output = OutputSchema(
+            goal=steps.goal, objects=analysis.objects, steps=steps.steps
+        )
+
+    highlight_image, highlight = await run_cpu_bound(
+        _highlight_first_step, original_image, output.objects, output.steps
     )
-    return WorkflowArtifacts(
-        output=output, highlight_path=highlight_path, banana_path=banana_path
+    yield WorkflowEvent(HIGHLIGHT_EVENT, highlight)
+
+    banana = None
+    if options.generate_banana:
+        banana = await _generate_banana_image_async(output.steps, highlight_image)
+        yield WorkflowEvent(BANANA_STAGE, banana)
+
+    artifacts = WorkflowArtifacts(
+        output=output,
+        highlight=highlight,
+        banana=banana,
+        highlight_image=highlight_image,
     )
+    if options.save_to is not None:
+        artifacts = await run_cpu_bound(save_artifacts, artifacts, options.save_to)
+    yield WorkflowEvent(DONE_EVENT, artifacts)
 
 
 def refresh_plan_from_image(
-    image: Image.Image, existing: OutputSchema
+    image: Image.Image,
+    existing: OutputSchema,
+    options: Optional[WorkflowOptions] = None,
 ) -> WorkflowArtifacts:
+    options = options or WorkflowOptions()
     current_image = image.copy()
-    resized_image = resize_image(current_image)
-
-    completion_prompt = _build_completion_prompt(existing)
-
-    completion_text = client.models.generate_content(
-        model="gemini-robotics-er-1.5-preview",
-        contents=[resized_image, completion_prompt],
-        config=types.GenerateContentConfig(
-            temperature=0.3,
-            thinking_config=types.ThinkingConfig(thinking_budget=-1),
-            response_mime_type="application/json",
-            response_json_schema=OutputSchema.model_json_schema(),
-        ),
-    ).text
+    completion_input = prepare_image(current_image, ROBOTICS_INPUT_PROFILE)
 
-    if completion_text is None:
-        raise RuntimeError("Completion model did not return any content.")
+    response = get_backend().generate(
+        _completion_request(existing, completion_input.part, options.completion_mode)
+    )
+    updated_output = _merge_completion(existing, response.text, options.completion_mode)
 
-    completion = OutputSchema.model_validate_json(completion_text)
+    remaining_steps = actionable_steps(updated_output.steps)
+    highlight_image, highlight = _highlight_first_step(
+        current_image, updated_output.objects, remaining_steps
+    )
+    banana = (
+        _generate_banana_image(remaining_steps, highlight_image)
+        if options.generate_banana
+        else None
+    )
 
-    merged_objects = merge_objects_by_label(existing.objects, completion.objects)
+    return save_artifacts(
+        WorkflowArtifacts(
+            output=updated_output,
+            highlight=highlight,
+            banana=banana,
+            highlight_image=highlight_image,
+        ),
+        options.save_to,
+    )
 
-    updated_output = OutputSchema(
-        goal=existing.goal,
-        objects=merged_objects,
-        steps=completion.steps,
+
+async def refresh_plan_from_image_async(
+    image: Image.Image,
+    existing: OutputSchema,
+    options: Optional[WorkflowOptions] = None,
+) -> WorkflowArtifacts:
+    return await collect_artifacts(stream_refresh_from_image(image, existing, options))
+
+
+async def stream_refresh_from_image(
+    image: Image.Image,
+    existing: OutputSchema,
+    options: Optional[WorkflowOptions] = None,
+) -> AsyncIterator[WorkflowEvent]:
+    options = options or WorkflowOptions()
+    current_image = await run_cpu_bound(image.copy)
+    completion_input = await run_cpu_bound(
+        prepare_image, current_image, ROBOTICS_INPUT_PROFILE
+    )
+
+    response = await get_backend().agenerate(
+        _completion_request(existing, completion_input.part, options.completion_mode)
     )
+    updated_output = _merge_completion(existing, response.text, options.completion_mode)
+    yield WorkflowEvent(COMPLETION_STAGE, updated_output)
 
     remaining_steps = actionable_steps(updated_output.steps)
-    highlight_path = highlight_first_step(
-        current_image,
-        updated_output.objects,
-        remaining_steps,
-        CONTINUATION_HIGHLIGHT_PATH,
+    highlight_image, highlight = await run_cpu_bound(
+        _highlight_first_step, current_image, updated_output.objects, remaining_steps
     )
-    banana_path = _generate_banana_asset(
-        remaining_steps, highlight_path, CONTINUATION_BANANA_PATH
+    yield WorkflowEvent(HIGHLIGHT_EVENT, highlight)
+
+    banana = None
+    if options.generate_banana:
+        banana = await _generate_banana_image_async(remaining_steps, highlight_image)
+        yield WorkflowEvent(BANANA_STAGE, banana)
+
+    artifacts = WorkflowArtifacts(
+        output=updated_output,
+        highlight=highlight,
+        banana=banana,
+        highlight_image=highlight_image,
     )
+    if options.save_to is not None:
+        artifacts = await run_cpu_bound(save_artifacts, artifacts, options.save_to)
+    yield WorkflowEvent(DONE_EVENT, artifacts)
 
-    return WorkflowArtifacts(
-        output=updated_output, highlight_path=highlight_path, banana_path=banana_path
-    )
+
+def save_artifacts(
+    artifacts: WorkflowArtifacts, paths: Optional[ArtifactPaths]
+) -> WorkflowArtifacts:
+    if paths is None:
+        return artifacts
+    if paths.highlight is not None and artifacts.highlight is not None:
+        artifacts.highlight_path = save_image_bytes(
+            artifacts.highlight, paths.highlight
+        )
+    if paths.banana is not None and artifacts.banana is not None:
+        artifacts.banana_path = save_image_bytes(artifacts.banana, paths.banana)
+    return artifacts
+
+
+async def collect_artifacts(events: AsyncIterator[WorkflowEvent]) -> WorkflowArtifacts:
+    async for event in events:
+        if event.stage == DONE_EVENT:
+            return event.payload
+    raise RuntimeError("Workflow finished without producing any artifacts.")
+
+
+def is_step_done(step: StepItem) -> bool:
+    return step.text.lstrip().upper().startswith(DONE_PREFIX)
 
 
 def actionable_steps(steps: List[StepItem]) -> List[StepItem]:
-    result: List[StepItem] = []
-    for step in steps:
-        text = step.text.lstrip()
-        if text.upper().startswith("[DONE]"):
-            continue
-        result.append(step)
-    return result
+    return [step for step in steps if not is_step_done(step)]
+
+
+def first_actionable_step(output: OutputSchema) -> Optional[StepItem]:
+    remaining_steps = actionable_steps(output.steps)
+    return remaining_steps[0] if remaining_steps else None
 
 
 def summarize_objects(objects: Sequence[ObjectItem]) -> str:
@@ -175,25 +427,247 @@ def merge_objects_by_label(
     reference_objects: Sequence[ObjectItem],
     updated_objects: Sequence[ObjectItem],
 ) -> List[ObjectItem]:
-    lookup: Dict[str, ObjectItem] = {}
-    for obj in updated_objects:
-        key = obj.label.strip().lower()
-        if not key:
+    merged = ObjectSet.from_items(reference_objects).merge(
+        ObjectSet.from_items(updated_objects)
+    )
+    return merged.to_items()
+
+
+def _analysis_request(image: Any) -> ModelRequest:
+    return ModelRequest(
+        stage=ANALYSIS_STAGE,
+        model=ROBOTICS_MODEL,
+        contents=[image, ANALYSIS_PROMPT],
+        config=_analysis_config(),
+    )
+
+
+def _plan_request(image: Any) -> ModelRequest:
+    return ModelRequest(
+        stage=PLAN_STAGE,
+        model=ROBOTICS_MODEL,
+        contents=[image, FAST_PLAN_PROMPT],
+        config=_plan_config(),
+    )
+
+
+def _steps_request(contents: List[Any]) -> ModelRequest:
+    return ModelRequest(
+        stage=STEPS_STAGE,
+        model=ROBOTICS_MODEL,
+        contents=contents,
+        config=_steps_config(),
+    )
+
+
+def _completion_request(existing: OutputSchema, image: Any, mode: str) -> ModelRequest:
+    if mode == FULL_COMPLETION:
+        return ModelRequest(
+            stage=COMPLETION_STAGE,
+            model=ROBOTICS_MODEL,
+            contents=[image, _build_completion_prompt(existing)],
+            config=_completion_config(),
+        )
+    if mode == COMPACT_COMPLETION:
+        return ModelRequest(
+            stage=COMPACT_COMPLETION_STAGE,
+            model=ROBOTICS_MODEL,
+            contents=[image, _build_compact_completion_prompt(existing)],
+            config=_compact_completion_config(),
+        )
+    raise ValueError(
+        f"Unknown completion mode '{mode}', expected one of {COMPLETION_MODES}."
+    )
+
+
+def warm_up_configs() -> None:
+    """Builds the generation configs now instead of on the first model call."""
+    for build in (
+        _analysis_config,
+        _plan_config,
+        _steps_config,
+        _completion_config,
+        _compact_completion_config,
+    ):
+        build()
+
+
+# Generation configs are built once and shared by every request; do not modify
+# them.
+@cache
+def _analysis_config() -> "types.GenerateContentConfig":
+    return _json_config(temperature=0.5, schema=json_schema(AnalysisSchema))
+
+
+@cache
+def _plan_config() -> "types.GenerateContentConfig":
+    return _json_config(temperature=0.5, schema=json_schema(OutputSchema))
+
+
+@cache
+def _steps_config() -> "types.GenerateContentConfig":
+    return _json_config(temperature=0.5, schema=json_schema(StepsSchema))
+
+
+@cache
+def _completion_config() -> "types.GenerateContentConfig":
+    return _json_config(temperature=0.3, schema=json_schema(OutputSchema))
+
+
+@cache
+def _compact_completion_config() -> "types.GenerateContentConfig":
+    return _json_config(temperature=0.3, schema=json_schema(CompactCompletionSchema))
+
+
+def _json_config(
+    temperature: float, schema: Dict[str, Any]
+) -> "types.GenerateContentConfig":
+    from google.genai import types
+
+    return types.GenerateContentConfig(
+        temperature=temperature,
+        thinking_config=types.ThinkingConfig(thinking_budget=-1),
+        response_mime_type="application/json",
+        response_json_schema=schema,
+    )
+
+
+def _parse_analysis(analysis_text: Optional[str]) -> AnalysisSchema:
+    if analysis_text is None:
+        raise RuntimeError("Analysis model did not return any content.")
+    return AnalysisSchema.model_validate_json(analysis_text)
+
+
+def _parse_plan(plan_text: Optional[str]) -> OutputSchema:
+    if plan_text is None:
+        raise RuntimeError("Plan model did not return any content.")
+    return OutputSchema.model_validate_json(plan_text)
+
+
+def _check_plan_mode(plan_mode: str) -> str:
+    if plan_mode not in PLAN_MODES:
+        raise ValueError(
+            f"Unknown plan mode '{plan_mode}', expected one of {PLAN_MODES}."
+        )
+    return plan_mode
+
+
+def _parse_steps(steps_text: Optional[str]) -> StepsSchema:
+    if steps_text is None:
+        raise RuntimeError("Steps model did not return any content.")
+    return StepsSchema.model_validate_json(steps_text)
+
+
+@traced("merge_completion")
+def _merge_completion(
+    existing: OutputSchema, completion_text: Optional[str], mode: str
+) -> OutputSchema:
+    if completion_text is None:
+        raise RuntimeError("Completion model did not return any content.")
+    if mode == COMPACT_COMPLETION:
+        return _merge_compact_completion(existing, completion_text)
+
+    completion = OutputSchema.model_validate_json(completion_text)
+
+    merged_objects = merge_objects_by_label(existing.objects, completion.objects)
+
+    return OutputSchema(
+        goal=existing.goal,
+        objects=merged_objects,
+        steps=completion.steps,
+    )
+
+
+def _merge_compact_completion(
+    existing: OutputSchema, completion_text: str
+) -> OutputSchema:
+    completion = CompactCompletionSchema.model_validate_json(completion_text)
+
+    # Only the objects of unfinished steps were re-detected; the others, and any
+    # the model left out, keep their previous box.
+    merged_objects = (
+        ObjectSet.from_items(existing.objects)
+        .merge(
+            ObjectSet.from_items(completion.objects),
+            labels=_referenced_labels(existing),
+            keep_missing=True,
+        )
+        .to_items()
+    )
+
+    statuses = {status.id: status for status in completion.steps}
+    merged_steps: List[StepItem] = []
+    number = 0
+    for step in existing.steps:
+        if is_step_done(step):
+            merged_steps.append(step)
             continue
-        lookup.setdefault(key, obj)
-
-    merged: List[ObjectItem] = []
-    for obj in reference_objects:
-        key = obj.label.strip().lower()
-        match = lookup.get(key)
-        merged.append(
-            ObjectItem(
-                label=obj.label,
-                box_2d=match.box_2d if match else None,
+        number += 1
+        status = statuses.get(number)
+        if status is None:
+            merged_steps.append(step)
+        elif status.done:
+            merged_steps.append(
+                StepItem(
+                    text=f"{DONE_PREFIX} {step.text}", object_label=step.object_label
+                )
+            )
+        else:
+            merged_steps.append(
+                StepItem(text=status.text or step.text, object_label=step.object_label)
             )
+    merged_steps.extend(completion.new_steps)
+
+    return OutputSchema(goal=existing.goal, objects=merged_objects, steps=merged_steps)
+
+
+def _referenced_objects(existing: OutputSchema) -> List[ObjectItem]:
+    labels = _referenced_labels(existing)
+    return [obj for obj in existing.objects if normalize_label(obj.label) in labels]
+
+
+def _referenced_labels(existing: OutputSchema) -> Set[str]:
+    return {
+        normalize_label(step.object_label) for step in actionable_steps(existing.steps)
+    }
+
+
+@traced("crop")
+def _crop_object_parts(
+    image: Image.Image,
+    objects: Sequence[ObjectItem],
+    crops_dir: Optional[Path],
+    crop_mode: str = SEPARATE_CROPS,
+) -> Tuple[List[Image.Image], List["types.Part"]]:
+    crops = crop_objects(image, list(objects))
+    if crops_dir is not None:
+        save_object_crops(crops, crops_dir)
+    crop_images = [crop for _, crop in crops]
+    if crop_mode == CROP_ATLAS:
+        atlas = build_crop_atlas(crops)
+        if atlas is None:
+            return crop_images, []
+        return crop_images, [encode_image(atlas, ROBOTICS_INPUT_PROFILE).part]
+    if crop_mode != SEPARATE_CROPS:
+        raise ValueError(
+            f"Unknown crop mode '{crop_mode}', expected one of {CROP_MODES}."
         )
+    crop_parts = [crop.part for crop in _prepare_inputs(crop_images)]
+    return crop_images, crop_parts
 
-    return merged
+
+def _prepare_inputs(images: Sequence[Image.Image]) -> List[PreparedImage]:
+    return [prepare_image(image, ROBOTICS_INPUT_PROFILE) for image in images]
+
+
+@traced("highlight")
+def _highlight_first_step(
+    image: Image.Image, objects: List[ObjectItem], steps: List[StepItem]
+) -> Tuple[Optional[Image.Image], Optional[GeneratedImage]]:
+    annotated = annotate_first_step(image, objects, steps)
+    if annotated is None:
+        return None, None
+    return annotated, encode_png_image(annotated)
 
 
 ANALYSIS_PROMPT = """\
@@ -211,8 +685,25 @@ Return a JSON object structured as:
 }"""
 
 
+FAST_PLAN_PROMPT = """\
+Inspect the provided image and infer a single high-level goal that represents the most reasonable outcome in the situation.
+Express the goal as a short imperative sentence grounded solely in the visual evidence.
+
+Identify the objects that are relevant to achieving the goal and provide their bounding boxes.
+Each detected object must be assigned a unique identifying label.
+Represent every bounding box using "box_2d": [ymin, xmin, ymax, xmax] with each coordinate normalized to the 0–1000 range (integers).
+
+Then produce an ordered list of detailed, clear, imperative manipulation steps that achieve the goal.
+For each step set "object_label" to the single most relevant label taken verbatim from your objects list.
+
+Return JSON structured exactly as {"goal": <goal>, "objects": [{"label": <label>, "box_2d": [ymin, xmin, ymax, xmax]}, ...], "steps": [{"text": <step_text>, "object_label": <object_label>}, ...]} with the goal field appearing before objects."""
+
+
 def _build_steps_prompt(
-    goal: str, objects: Sequence[ObjectItem], crop_images: Sequence[Image.Image]
+    goal: str,
+    objects: Sequence[ObjectItem],
+    crop_images: Sequence[Image.Image],
+    crop_mode: str = SEPARATE_CROPS,
 ) -> str:
     objects_summary = (
         "\n".join(
@@ -225,11 +716,12 @@ def _build_steps_prompt(
         else "No objects were detected in the first pass."
     )
 
-    attachment_note = (
-        " and cropped close-up images for each listed object (these attachments follow the scene image in the same order)."
-        if crop_images
-        else ". No cropped close-up images are available; rely solely on the scene image."
-    )
+    if not crop_images:
+        attachment_note = ". No cropped close-up images are available; rely solely on the scene image."
+    elif crop_mode == CROP_ATLAS:
+        attachment_note = " and a contact sheet (second attachment) with a close-up of each listed object that has a box, captioned with its label."
+    else:
+        attachment_note = " and cropped close-up images for each listed object (these attachments follow the scene image in the same order)."
 
     return f"""\
 Initial goal: {goal}
@@ -276,16 +768,52 @@ If no steps were provided previously, create a fresh ordered list that the robot
 """
 
 
-def _generate_banana_asset(
-    steps: Sequence[StepItem],
-    highlight_path: Optional[Path],
-    output_path: Path,
-) -> Optional[Path]:
+def _build_compact_completion_prompt(existing: OutputSchema) -> str:
+    referenced = _referenced_objects(existing)
+    referenced_labels = {obj.label for obj in referenced}
+    other_labels = [
+        obj.label for obj in existing.objects if obj.label not in referenced_labels
+    ]
+    remaining = actionable_steps(existing.steps)
+    other_note = (
+        f"\nOther known labels (no box needed): {', '.join(other_labels)}"
+        if other_labels
+        else ""
+    )
+    return f"""\
+You previously generated a plan for a robot and are now checking progress.
+Goal: {existing.goal}
+
+Objects:
+{summarize_objects(referenced)}{other_note}
+
+Remaining steps:
+{summarize_steps(remaining)}
+
+Look at the updated scene image (attachment) and determine which remaining steps have been completed.
+- In "objects", provide the bounding box of each object listed above as normalized integers in [ymin, xmin, ymax, xmax] format spanning 0–1000, or null when it is not visible. Use the labels verbatim.
+- In "steps", list only the remaining steps whose status or wording changed, by number. Set "done" to true when the step is fully satisfied. Otherwise set "done" to false and "text" to a rewrite that reflects what remains. Omit unchanged steps.
+- In "new_steps", add steps only if more actions are required after the remaining steps to finish the goal. Use a known object_label; never invent new labels.
+
+Return JSON structured exactly as {{"objects": [{{"label": <label>, "box_2d": [ymin, xmin, ymax, xmax] or null}}, ...], "steps": [{{"id": <number>, "done": <true|false>, "text": <text or null>}}, ...], "new_steps": [{{"text": <step>, "object_label": <label>}}, ...]}}.
+
+If there are no remaining steps, put a fresh ordered list that finishes the goal from the current state in "new_steps".
+"""
+
+
+def _generate_banana_image(
+    steps: Sequence[StepItem], highlight_image: Optional[Image.Image]
+) -> Optional[GeneratedImage]:
     first_step = steps[0] if steps else None
-    if highlight_path and first_step:
-        return banana(
-            step_text=first_step.text,
-            annotated_image_path=highlight_path,
-            output_path=output_path,
-        )
+    if highlight_image is not None and first_step:
+        return banana_image(first_step.text, highlight_image)
+    return None
+
+
+async def _generate_banana_image_async(
+    steps: Sequence[StepItem], highlight_image: Optional[Image.Image]
+) -> Optional[GeneratedImage]:
+    first_step = steps[0] if steps else None
+    if highlight_image is not None and first_step:
+        return await banana_image_async(first_step.text, highlight_image)
     return None